@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+breath_phase.py — Online inademing/uitademing detectie op de EDR (QRS-RMS per beat)
+"""
+from __future__ import annotations
+
+import math
+from collections import deque
+from typing import Deque, Optional
+
+import numpy as np
+
+from app.algorithms.running_stats import SlidingMedian
+
+
+class BreathPhaseDetector:
+    """
+    Streaming fase-detector met hysterese voor de per-beat EDR.
+
+    Elke beat wordt precies één keer verwerkt (oplopende beat-tijd); oude
+    beats worden bij een volgende schatting overgeslagen. Een 'E' (top van de
+    RMS) of 'I' (dal) wordt gemeld op de beat waarop de omslag bevestigd is:
+    het signaal is dan minstens `prominence` van het lopende extreem
+    teruggelopen. Gemelde markers veranderen dus nooit meer. Alle state is
+    begrensd (vaste vensters), ongeacht de sessieduur.
+    """
+
+    MIN_BEATS = 10          # opwarmen voordat er markers komen
+    PROM_FRACTION = 0.15    # fractie van de p5–p95 spreiding
+    AMP_WINDOW = 64         # beats voor de amplitude-schatting
+    RR_WINDOW = 32
+    BPM_WINDOW = 20
+
+    def __init__(self, min_beat_gap_ms: float = 250.0):
+        self.min_beat_gap_ms = float(min_beat_gap_ms)
+        self.last_ts: float = -math.inf
+        self.n_beats = 0
+
+        self._rr = SlidingMedian(self.RR_WINDOW)
+        self._bpm = SlidingMedian(self.BPM_WINDOW)
+        self._amp = SlidingMedian(self.AMP_WINDOW)
+        self._raw: Deque[float] = deque(maxlen=15)
+        self._trend: Optional[float] = None
+
+        self._rising = True
+        self._ext = math.nan
+        self._last_event_beat = -10_000
+        # Marker op een beat die niet uitgezonden wordt (geen est_rr/tijd):
+        # de estimator zet hem op de volgende uitgezonden beat
+        self.pending_mark = ''
+
+    def _cycle_params(self):
+        est_bpm = self._bpm.median()
+        if not np.isfinite(est_bpm) or est_bpm <= 3:
+            est_bpm = 10.0
+        rr_med = self._rr.median()
+        avg_rr_sec = rr_med / 1000.0 if np.isfinite(rr_med) else 0.8
+        if avg_rr_sec <= 0.3:
+            avg_rr_sec = 0.8
+        resp_cycle_sec = 60.0 / est_bpm
+
+        target_smooth_sec = min(2.0, max(0.6, resp_cycle_sec * 0.25))
+        smooth_beats = max(3, int(target_smooth_sec / avg_rr_sec))
+        if smooth_beats % 2 == 0:
+            smooth_beats += 1
+        smooth_beats = min(smooth_beats, self._raw.maxlen)
+        trend_win = max(30, int((resp_cycle_sec * 2) / avg_rr_sec))
+        min_dist = max(1, int((resp_cycle_sec * 0.4) / avg_rr_sec))
+        return smooth_beats, trend_win, min_dist
+
+    def update(self, ts_ms: float, rms: float, rr_ms: float = math.nan, est_bpm: float = math.nan) -> str:
+        """
+        Verwerk één nieuwe beat. Geeft 'I', 'E' of '' terug.
+        Beats die niet na de vorige verwerkte beat liggen worden genegeerd.
+        """
+        if not np.isfinite(ts_ms) or ts_ms <= self.last_ts + self.min_beat_gap_ms:
+            return ''
+        if not np.isfinite(rms):
+            return ''
+        self.last_ts = float(ts_ms)
+        beat = self.n_beats
+        self.n_beats += 1
+
+        if np.isfinite(rr_ms) and rr_ms > 0:
+            self._rr.push(rr_ms)
+        self._bpm.push(est_bpm)
+        smooth_beats, trend_win, min_dist = self._cycle_params()
+
+        # Causale Hann-smoothing over de laatste beats
+        self._raw.append(float(rms))
+        recent = np.fromiter(self._raw, dtype=float)[-smooth_beats:]
+        w = np.hanning(recent.size + 2)[1:-1]
+        y_s = float(np.dot(recent, w) / w.sum())
+
+        # Detrend met een exponentiële trend (~trend_win beats)
+        alpha = 2.0 / (trend_win + 1.0)
+        self._trend = y_s if self._trend is None else self._trend + alpha * (y_s - self._trend)
+        y = y_s - self._trend
+        self._amp.push(y)
+
+        if self.n_beats < self.MIN_BEATS:
+            self._ext = y
+            return ''
+
+        spread = self._amp.quantile(0.95) - self._amp.quantile(0.05)
+        prom = max(0.001, spread * self.PROM_FRACTION)
+
+        event = ''
+        if self._rising:
+            if not (y <= self._ext):
+                self._ext = y
+            elif self._ext - y >= prom and beat - self._last_event_beat >= min_dist:
+                event = 'E'
+        else:
+            if not (y >= self._ext):
+                self._ext = y
+            elif y - self._ext >= prom and beat - self._last_event_beat >= min_dist:
+                event = 'I'
+
+        if event:
+            self._rising = not self._rising
+            self._ext = y
+            self._last_event_beat = beat
+        return event
@@ -6,9 +6,14 @@ Migrated from SerenaWebApp/pythonbleakgui_server/resp_rr_estimator.py
 from __future__ import annotations
 
 import numpy as np
+from collections.abc import Sequence
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Tuple
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy import signal
-from scipy.signal import find_peaks
+
+from app.algorithms.breath_phase import BreathPhaseDetector
+from app.algorithms.running_stats import SlidingMedian
 
 
 # ---------------- Helper functies ----------------
@@ -30,10 +35,16 @@ def _parabolic_interp(y: np.ndarray, i: int) -> Tuple[float, float]:
     return float(x_ref), float(y_ref)
 
 
-def _butter_bandpass_filtfilt(x: np.ndarray, fs: float, low_hz: float, high_hz: float, order: int = 2) -> np.ndarray:
+@lru_cache(maxsize=64)
+def _butter_bandpass_sos(fs: float, low_hz: float, high_hz: float, order: int = 2) -> np.ndarray:
+    """Ontwerpt (eenmalig per (fs, band, order)) een Butterworth banddoorlaat in SOS-vorm."""
     nyq = fs / 2.0
-    b, a = signal.butter(order, [low_hz/nyq, high_hz/nyq], btype="band")
-    return signal.filtfilt(b, a, x)
+    return signal.butter(order, [low_hz/nyq, high_hz/nyq], btype="band", output="sos")
+
+
+def _butter_bandpass_filtfilt(x: np.ndarray, fs: float, low_hz: float, high_hz: float, order: int = 2) -> np.ndarray:
+    sos = _butter_bandpass_sos(float(fs), float(low_hz), float(high_hz), int(order))
+    return signal.sosfiltfilt(sos, x)
 
 
 def _moving_window_abs_mean(x: np.ndarray, win: int) -> np.ndarray:
@@ -50,9 +61,8 @@ def _moving_window_abs_mean(x: np.ndarray, win: int) -> np.ndarray:
     return y
 
 
-def _detect_r_peaks(ecg_raw: np.ndarray, fs: float, cfg: Dict) -> np.ndarray:
-    """Detecteert R-toppen met behulp van de meegegeven configuratie (cfg)."""
-    x = _butter_bandpass_filtfilt(ecg_raw, fs, cfg["BP_LOW_HZ"], cfg["BP_HIGH_HZ"], order=2)
+def _detect_r_peaks(x: np.ndarray, fs: float, cfg: Dict) -> np.ndarray:
+    """Detecteert R-toppen in het (al banddoorlaat-gefilterde) signaal x met de configuratie (cfg)."""
     w1 = max(1, int(round(cfg["MWA_QRS_SEC"]  * fs)))
     w2 = max(1, int(round(cfg["MWA_BEAT_SEC"] * fs)))
     mwa_qrs  = _moving_window_abs_mean(x, w1)
@@ -92,15 +102,13 @@ def _refine_r_peaks(sig: np.ndarray, rpeaks: np.ndarray) -> np.ndarray:
     return np.array(out, dtype=int)
 
 
-def _extract_qrs_stacks(ecg_raw: np.ndarray, rpeaks: np.ndarray, fs: float, cfg: Dict) -> np.ndarray:
+def _extract_qrs_stacks(x: np.ndarray, rpeaks: np.ndarray, fs: float, cfg: Dict) -> np.ndarray:
+    """QRS-vensters rond elke R-top uit het (al banddoorlaat-gefilterde) signaal x."""
     half = int(round(cfg["QRS_HALF_SEC"] * fs))
-    x = _butter_bandpass_filtfilt(ecg_raw, fs, cfg["BP_LOW_HZ"], cfg["BP_HIGH_HZ"], order=2)
-    beats = np.zeros((2*half+1, rpeaks.size))
-    N = len(x)
-    for k, rp in enumerate(rpeaks):
-        seg = np.clip(np.arange(rp - half, rp + half + 1), 0, N-1)
-        beats[:, k] = x[seg]
-    return beats
+    # Edge-padding = clippen van indices aan de randen; vensters als strided view
+    xp = np.pad(x, half, mode="edge")
+    windows = sliding_window_view(xp, 2*half+1)
+    return windows[rpeaks].T
 
 
 def _estimate_bpm_from_section(section: np.ndarray, rr_med_ms: float, cfg: Dict) -> float:
@@ -152,39 +160,94 @@ def _estimate_bpm_from_section(section: np.ndarray, rr_med_ms: float, cfg: Dict)
     return float(bpm)
 
 
+def _block_sample_ts_ms(ts: np.ndarray, block_sizes: List[int], n: int, fs: float) -> np.ndarray:
+    """Per-sample tijdstempels (ms): ts van het pakket plus sample-offset binnen het pakket."""
+    out = np.full(n, np.nan, dtype=float)
+    sizes = np.asarray(block_sizes, dtype=np.int64)
+    nb = min(len(ts), sizes.size)
+    sizes = np.clip(sizes[:nb], 0, None)
+    starts = np.cumsum(sizes) - sizes
+    m = min(int(sizes.sum()), n)
+    if m <= 0:
+        return out
+    t0 = np.repeat(np.asarray(ts[:nb], dtype=float), sizes)[:m]
+    offs = np.arange(m, dtype=float) - np.repeat(starts, sizes)[:m]
+    out[:m] = t0 + (offs/fs)*1000.0
+    return out
+
+
+def _format_tijd(rel_ms: float) -> str:
+    total_ms = int(round(rel_ms))
+    h, rem = divmod(total_ms, 3600_000)
+    m, rem = divmod(rem, 60_000)
+    s, ms = divmod(rem, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d} UTC"
+
+
+class TijdLabels(Sequence):
+    """
+    Relatieve tijdlabels per beat ("HH:MM:SS.mmm UTC" t.o.v. de eerste geldige beat).
+    Strings worden pas bij opvragen geformatteerd, zodat alleen de beats die
+    daadwerkelijk worden uitgezonden iets kosten.
+    """
+
+    def __init__(self, ts_per_beat: np.ndarray):
+        self._ts = ts_per_beat
+        valid = np.flatnonzero(np.isfinite(ts_per_beat))
+        self._base = float(ts_per_beat[valid[0]]) if valid.size else None
+
+    def __len__(self) -> int:
+        return len(self._ts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        t = self._ts[i]
+        if self._base is None or not np.isfinite(t):
+            return ''
+        return _format_tijd(t - self._base)
+
+
 # ---------------- Publieke API ----------------
 
-def estimate_from_records(records: List[dict], fs_hint: float = 130.0, params: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
+def estimate_from_records(records: List[dict], fs_hint: float = 130.0, params: Optional[Dict] = None,
+                          breath_detector: Optional[BreathPhaseDetector] = None) -> Optional[Dict[str, Any]]:
     """
     Zet list-of-records om naar arrays en roept de estimator aan.
+    Geef per sessie dezelfde breath_detector mee voor stabiele I/E-markers.
     """
     if not records:
         return None
         
-    all_samples = []
+    blocks = []
     ts_list = []
     block_sizes = []
     
     for r in records:
         samps = r.get("samples", [])
-        if not samps: continue
+        if samps is None or len(samps) == 0: continue
         
-        if isinstance(samps, (list, tuple, np.ndarray)):
-             all_samples.extend([int(x) for x in samps])
+        # Binaire ECG-frames leveren al een ndarray (int16/int32): geen per-sample conversie
+        if isinstance(samps, np.ndarray):
+             blocks.append(samps)
+             block_sizes.append(len(samps))
+        elif isinstance(samps, (list, tuple)):
+             blocks.append(np.array([int(x) for x in samps], dtype=np.int32))
              block_sizes.append(len(samps))
         
         if "ts" in r:
             ts_list.append(int(r["ts"]))
 
-    if not all_samples:
+    if not blocks:
         return None
 
     # Use int32 to handle larger ECG values from Polar H10
-    sig_i16 = np.array(all_samples, dtype=np.int32)
+    sig_i16 = np.concatenate(blocks).astype(np.int32, copy=False)
     ts_arr = np.array(ts_list, dtype=np.int64) if ts_list else None
 
     try:
-        return estimate_from_arrays(sig_i16, ts_arr, fs_est=None, block_sizes=block_sizes, per_sample_t=None, fs_hint=fs_hint, params=params)
+        return estimate_from_arrays(sig_i16, ts_arr, fs_est=None, block_sizes=block_sizes, per_sample_t=None, fs_hint=fs_hint, params=params,
+                                    breath_detector=breath_detector)
     except Exception as e:
         print(f"[ESTIMATOR] Fout tijdens berekening: {e}") 
         return None
@@ -196,10 +259,13 @@ def estimate_from_arrays(sig_i16: np.ndarray,
                          block_sizes: Optional[List[int]],
                          per_sample_t: Optional[np.ndarray],
                          fs_hint: Optional[float] = None,
-                         params: Optional[Dict] = None) -> Dict[str, Any]:
+                         params: Optional[Dict] = None,
+                         breath_detector: Optional[BreathPhaseDetector] = None) -> Dict[str, Any]:
     """
     Core estimation function.
     Accepts params dict directly (from MongoDB ParameterSet).
+    breath_detector: optional per-session BreathPhaseDetector; without it a
+    fresh detector runs over all beats in this call.
     """
     # Build config from params
     if params is None:
@@ -227,14 +293,17 @@ def estimate_from_arrays(sig_i16: np.ndarray,
     sig = sig_i16.astype(float)
     sig -= np.median(sig)
 
+    # Banddoorlaat eenmalig; gedeeld door R-peak detectie en QRS-stacking
+    x_bp = _butter_bandpass_filtfilt(sig, fs, cfg["BP_LOW_HZ"], cfg["BP_HIGH_HZ"], order=2)
+
     # R-Peak detectie
-    r0 = _detect_r_peaks(sig, fs, cfg)
+    r0 = _detect_r_peaks(x_bp, fs, cfg)
     r  = _refine_r_peaks(sig, r0)
     if r.size < 4:
         raise RuntimeError(f"Te weinig R-peaks ({r.size}) gevonden; check signaalkwaliteit.")
 
     # EDR (RMS) berekening
-    qrs = _extract_qrs_stacks(sig, r, fs, cfg)
+    qrs = _extract_qrs_stacks(x_bp, r, fs, cfg)
     rms = np.sqrt(np.mean(qrs**2, axis=0))
     rr_ms = 1000.0 * np.diff(r) / fs
 
@@ -243,103 +312,75 @@ def estimate_from_arrays(sig_i16: np.ndarray,
     h_win = int(cfg["HEARTBEAT_WINDOW"])
     s_win = int(cfg["SMOOTH_WIN"])
 
+    # RR-mediaan over rr_ms[0:i] (opstart) resp. rr_ms[i-h_win-1:i-1]:
+    # schuivend venster van h_win waarden, gevuld tot en met rr_ms[hi-1].
+    rr_win = SlidingMedian(h_win)
+    rr_hi = 0
     for i in range(rms.size):
         if i < h_win:
             section = rms[0:i]
-            rr_med_ms = np.median(rr_ms[0:i]) if i > 0 and rr_ms.size>0 else np.nan
+            hi = i
         else:
             section = rms[i-h_win:i]
-            start  = max(0, i-h_win-1)
-            stop   = max(0, i-1)
-            rr_slice = rr_ms[start:stop] if stop > start else rr_ms[0:i]
-            rr_med_ms = np.median(rr_slice) if rr_slice.size>0 else np.nan
+            hi = i-1
+        while rr_hi < min(hi, rr_ms.size):
+            rr_win.push(rr_ms[rr_hi])
+            rr_hi += 1
+        rr_med_ms = rr_win.median()
 
         bpm = _estimate_bpm_from_section(section, rr_med_ms, cfg)
         est.append(bpm)
     est = np.asarray(est, dtype=float)
 
-    # Smoothing van BPM
+    # Smoothing van BPM (nanmedian over de vorige s_win schattingen)
     sm = np.copy(est)
+    sm_win = SlidingMedian(s_win)
     for i in range(len(est)):
         if i >= s_win:
-            sm[i] = np.nanmedian(est[i-s_win:i])
+            sm[i] = sm_win.median()
+        sm_win.push(est[i])
 
     # Tijd Mapping
     sample_ts_ms = None
     if per_sample_t is not None and isinstance(per_sample_t, np.ndarray) and per_sample_t.size == sig_i16.size:
         sample_ts_ms = per_sample_t*1000.0
     elif ts is not None and block_sizes:
-        sample_ts_ms = np.empty(sig_i16.size, dtype=float)
-        cursor = 0
-        for b, bsize in enumerate(block_sizes):
-            if b >= len(ts): break
-            t0 = float(ts[b])
-            if bsize <= 0: continue
-            offs = (np.arange(bsize, dtype=float)/fs)*1000.0
-            end = cursor + bsize
-            take = max(0, end - cursor)
-            sample_ts_ms[cursor:end] = t0 + offs[:take]
-            cursor = end
+        sample_ts_ms = _block_sample_ts_ms(ts, block_sizes, sig_i16.size, fs)
 
     ts_per_beat = np.full(len(sm), np.nan, dtype=float)
-    tijd = np.array([''] * len(sm), dtype=object)
-    
-    if sample_ts_ms is not None and r.size == len(sm):
-        for i in range(len(sm)):
-            rp = int(r[i])
-            if 0 <= rp < len(sample_ts_ms) and np.isfinite(sm[i]):
-                ts_per_beat[i] = sample_ts_ms[rp]
-        
-        valid_idx = np.where(np.isfinite(ts_per_beat))[0]
-        if valid_idx.size:
-            base_ts = ts_per_beat[valid_idx[0]]
-            for i in valid_idx:
-                rel_ms = ts_per_beat[i] - base_ts
-                total_ms = int(round(rel_ms))
-                h, rem = divmod(total_ms, 3600_000)
-                m, rem = divmod(rem, 60_000)
-                s, ms = divmod(rem, 1000)
-                tijd[i] = f"{h:02d}:{m:02d}:{s:02d}.{ms:03d} UTC"
-
-    # INHALE/EXHALE DETECTIE
-    inhale = np.array([''] * len(sm), dtype=object)
-    exhale = np.array([''] * len(sm), dtype=object)
-
-    if rms.size >= 10:
-        est_resp_bpm = np.nanmedian(sm[-20:]) if sm.size >= 20 else np.nanmedian(sm)
-        if np.isnan(est_resp_bpm) or est_resp_bpm <= 3: 
-            est_resp_bpm = 10.0
-        
-        avg_rr_sec = (np.nanmedian(rr_ms) / 1000.0) if (rr_ms is not None and rr_ms.size > 0) else 0.8
-        if avg_rr_sec <= 0.3: avg_rr_sec = 0.8
-
-        resp_cycle_sec = 60.0 / est_resp_bpm
-        target_smooth_sec = min(2.0, max(0.6, resp_cycle_sec * 0.25)) 
-        
-        smooth_beats = int(target_smooth_sec / avg_rr_sec)
-        smooth_beats = max(3, smooth_beats)
-        if smooth_beats % 2 == 0: smooth_beats += 1
-
-        window = np.hanning(smooth_beats)
-        window = window / window.sum()
-        rms_smooth = np.convolve(rms, window, mode='same')
 
-        trend_win = max(30, int((resp_cycle_sec * 2) / avg_rr_sec))
-        trend = _moving_window_abs_mean(rms_smooth, trend_win)
-        rms_detrended = rms_smooth - trend
+    if sample_ts_ms is not None and r.size == len(sm):
+        ok = (r >= 0) & (r < len(sample_ts_ms)) & np.isfinite(sm)
+        ts_per_beat[ok] = sample_ts_ms[r[ok]]
 
-        min_dist_beats = max(1, int((resp_cycle_sec * 0.4) / avg_rr_sec))
-        local_ptp = np.percentile(rms_detrended, 95) - np.percentile(rms_detrended, 5)
-        prom_val = max(0.001, local_ptp * 0.15)
+    tijd = TijdLabels(ts_per_beat)
 
-        peaks_e, _ = find_peaks(rms_detrended, distance=min_dist_beats, prominence=prom_val)
-        peaks_i, _ = find_peaks(-rms_detrended, distance=min_dist_beats, prominence=prom_val)
+    # INHALE/EXHALE DETECTIE (online; alleen beats die de detector nog niet zag)
+    inhale = np.array([''] * len(sm), dtype=object)
+    exhale = np.array([''] * len(sm), dtype=object)
 
-        for p in peaks_e:
-            if p < len(exhale): exhale[p] = 'E'
-        
-        for p in peaks_i:
-            if p < len(inhale): inhale[p] = 'I'
+    if breath_detector is None:
+        breath_detector = BreathPhaseDetector()
+    if sample_ts_ms is not None:
+        ok = (r >= 0) & (r < len(sample_ts_ms))
+        beat_ts = np.full(r.size, np.nan, dtype=float)
+        beat_ts[ok] = sample_ts_ms[r[ok]]
+    else:
+        beat_ts = 1000.0 * r / fs
+    new_idx = np.flatnonzero(beat_ts > breath_detector.last_ts)
+    for i in new_idx:
+        rr_i = rr_ms[i-1] if i > 0 else np.nan
+        mark = breath_detector.update(beat_ts[i], rms[i], rr_i, sm[i])
+        if mark:
+            breath_detector.pending_mark = mark
+        # Alleen beats met een tijd (eindige est_rr) worden uitgezonden;
+        # een marker op een NaN-beat schuift door naar de volgende
+        if breath_detector.pending_mark and np.isfinite(ts_per_beat[i]):
+            if breath_detector.pending_mark == 'E':
+                exhale[i] = 'E'
+            else:
+                inhale[i] = 'I'
+            breath_detector.pending_mark = ''
 
     return {
         "fs": fs,
@@ -350,5 +391,5 @@ def estimate_from_arrays(sig_i16: np.ndarray,
         "inhale": inhale,
         "exhale": exhale,
         "rr_ms": rr_ms,
-        "edr": None, "t_edr": None, "rr_times": None, "rr_bpm": None,
+        "edr": rms, "t_edr": None, "rr_times": None, "rr_bpm": None,
     }
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+running_stats.py — Streaming mediaan/percentiel over een schuivend venster
+"""
+from __future__ import annotations
+
+import math
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Deque, Iterable, List
+
+
+class SlidingMedian:
+    """
+    Mediaan/percentiel over de laatste `window` waarden.
+
+    Houdt naast de FIFO van het venster een gesorteerde lijst van de eindige
+    waarden bij; push() kost een binary search plus een insert/delete in die
+    lijst in plaats van een volledige sortering per stap. NaN's tellen mee
+    voor de vensterlengte maar worden (zoals np.nanmedian) niet meegenomen
+    in de statistiek.
+    """
+
+    __slots__ = ("window", "_fifo", "_sorted")
+
+    def __init__(self, window: int):
+        if window < 0:
+            raise ValueError(f"window moet >= 0 zijn, kreeg {window}")
+        self.window = int(window)
+        self._fifo: Deque[float] = deque()
+        self._sorted: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self._fifo)
+
+    @property
+    def count(self) -> int:
+        """Aantal eindige waarden in het venster."""
+        return len(self._sorted)
+
+    def push(self, x: float) -> None:
+        x = float(x)
+        self._fifo.append(x)
+        if not math.isnan(x):
+            insort(self._sorted, x)
+        while len(self._fifo) > self.window:
+            self._discard(self._fifo.popleft())
+
+    def extend(self, values: Iterable[float]) -> None:
+        for v in values:
+            self.push(v)
+
+    def clear(self) -> None:
+        self._fifo.clear()
+        self._sorted.clear()
+
+    def _discard(self, old: float) -> None:
+        if math.isnan(old):
+            return
+        del self._sorted[bisect_left(self._sorted, old)]
+
+    def median(self) -> float:
+        """Mediaan van de eindige waarden; NaN als er geen zijn."""
+        s = self._sorted
+        n = len(s)
+        if n == 0:
+            return math.nan
+        mid = n // 2
+        if n % 2:
+            return s[mid]
+        return (s[mid - 1] + s[mid]) / 2.0
+
+    def quantile(self, q: float) -> float:
+        """Kwantiel q in [0, 1] met lineaire interpolatie (zoals np.percentile)."""
+        s = self._sorted
+        n = len(s)
+        if n == 0:
+            return math.nan
+        pos = min(max(q, 0.0), 1.0) * (n - 1)
+        lo = int(pos)
+        hi = min(lo + 1, n - 1)
+        return s[lo] + (s[hi] - s[lo]) * (pos - lo)
+
+    def percentile(self, p: float) -> float:
+        return self.quantile(p / 100.0)
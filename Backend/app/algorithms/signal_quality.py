@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+signal_quality.py — Goedkope ECG-kwaliteitscontrole per pakket en per venster
+"""
+from __future__ import annotations
+
+from collections import Counter, deque
+from typing import Deque, Optional, Sequence
+
+import numpy as np
+
+# Drempels (Polar H10, µV, ~130 Hz, ~73 samples per pakket)
+FLAT_PTP = 50.0          # piek-piek kleiner dan dit = flatline / elektrode los
+SAT_FRACTION = 0.15      # fractie samples op min/max van het pakket = clipping
+HF_RATIO_MAX = 1.6       # RMS 2e afgeleide / std; witte ruis ~2.4, ECG < 1.3
+RR_OUTLIER_MAX = 0.2     # max fractie RR-intervallen buiten 0.6–1.6× mediaan
+
+REASON_FLATLINE = "flatline"
+REASON_SATURATED = "saturated"
+REASON_NOISE = "noise"
+REASON_IRREGULAR = "irregular"
+
+
+def packet_quality(samples: Sequence[int]) -> str:
+    """Beoordeelt één ECG-pakket. Geeft '' terug als bruikbaar, anders de reden."""
+    x = np.asarray(samples, dtype=float)
+    if x.size < 4:
+        return ""
+    lo, hi = x.min(), x.max()
+    if hi - lo < FLAT_PTP:
+        return REASON_FLATLINE
+    if np.count_nonzero((x == lo) | (x == hi)) > SAT_FRACTION * x.size:
+        return REASON_SATURATED
+    d2 = np.diff(x, 2)
+    if np.sqrt(np.mean(d2 * d2)) > HF_RATIO_MAX * x.std():
+        return REASON_NOISE
+    return ""
+
+
+def rr_regular(rr_ms: Optional[np.ndarray]) -> bool:
+    """True als de R-peaks een plausibel, regelmatig ritme geven."""
+    if rr_ms is None or len(rr_ms) < 3:
+        return False
+    rr = np.asarray(rr_ms, dtype=float)
+    med = np.median(rr)
+    if not med > 0:
+        return False
+    # Robuust tegen ademhalingsgebonden HRV: alleen gemiste/extra beats tellen
+    outliers = np.count_nonzero((rr < 0.6 * med) | (rr > 1.6 * med))
+    return outliers <= RR_OUTLIER_MAX * rr.size
+
+
+class QualityTracker:
+    """
+    Kwaliteitsindex over de laatste `window` pakketten van een sessie.
+
+    index = fractie bruikbare pakketten (0..1), gehalveerd als de laatste
+    schatting geen regelmatige R-peaks gaf. Schattingen worden overgeslagen
+    zolang de pakketten zelf onbruikbaar zijn (`estimable`); onregelmatige
+    R-peaks verlagen alleen de gerapporteerde kwaliteit, zodat een volgende
+    schatting het herstel kan zien.
+    """
+
+    def __init__(self, window: int = 8, min_index: float = 0.75):
+        self.min_index = float(min_index)
+        self._reasons: Deque[str] = deque(maxlen=window)
+        self._rr_ok = True
+        self._reported_ok = True
+
+    def add_packet(self, samples: Sequence[int]) -> str:
+        reason = packet_quality(samples)
+        self._reasons.append(reason)
+        return reason
+
+    def note_estimate(self, rr_ms: Optional[np.ndarray]) -> None:
+        """Verwerk de RR-intervallen van de laatste schatting (None = mislukt)."""
+        self._rr_ok = rr_regular(rr_ms)
+
+    @property
+    def packet_index(self) -> float:
+        if not self._reasons:
+            return 1.0
+        return sum(1 for r in self._reasons if not r) / len(self._reasons)
+
+    @property
+    def index(self) -> float:
+        good = self.packet_index
+        return good if self._rr_ok else 0.5 * good
+
+    @property
+    def estimable(self) -> bool:
+        """False als de recente pakketten flatline/clipping/ruis zijn."""
+        return self.packet_index >= self.min_index
+
+    @property
+    def ok(self) -> bool:
+        return self.index >= self.min_index
+
+    @property
+    def reason(self) -> str:
+        bad = [r for r in self._reasons if r]
+        if bad:
+            return Counter(bad).most_common(1)[0][0]
+        return "" if self._rr_ok else REASON_IRREGULAR
+
+    def changed(self) -> bool:
+        """True (één keer) wanneer `ok` is omgeslagen sinds de vorige aanroep."""
+        now = self.ok
+        if now != self._reported_ok:
+            self._reported_ok = now
+            return True
+        return False
@@ -5,7 +5,7 @@ from __future__ import annotations
 from fastapi import APIRouter
 from datetime import datetime
 
-from app.api.v1 import devices, sessions, signals, techniques, feedback, param_sets, ingest, stream
+from app.api.v1 import devices, sessions, signals, techniques, feedback, param_sets, ingest, stream, ws_ingest
 
 api_router = APIRouter(prefix="/api/v1", tags=["v1"])
 
@@ -18,6 +18,7 @@ api_router.include_router(feedback.router, prefix="/feedback", tags=["feedback"]
 api_router.include_router(param_sets.router, prefix="/param_versions", tags=["parameter-sets"])
 api_router.include_router(ingest.router, tags=["ingest"])
 api_router.include_router(stream.router, tags=["stream"])
+api_router.include_router(ws_ingest.router, tags=["ingest"])
 
 
 @api_router.get("/ping")
@@ -31,6 +32,8 @@ async def get_status():
     """Get detailed system status"""
     from app.database import database
     from app.config import settings
+    from app.services.admission import admission
+    from app.services.stream_manager import stream_manager
 
     db_status = "unknown"
     db_detail: str | None = None
@@ -50,7 +53,11 @@ async def get_status():
         "database": db_status,
         "timestamp": datetime.utcnow().isoformat() + "Z",
         "version": "0.4",
+        "ingest": admission.stats(),
+        "stream": stream_manager.stats(),
     }
+    if settings.cluster_shard is not None:
+        out["shard"] = settings.cluster_shard
     if db_detail is not None:
         out["database_error"] = db_detail
     return out
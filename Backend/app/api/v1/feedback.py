@@ -2,30 +2,36 @@
 """Feedback rules endpoints"""
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 
 from app.database import get_database
 from app.models.feedback import FeedbackRulesResponse, FeedbackRulesUpdate
 from app.schemas.feedback_rules import FeedbackRules
+from app.services.catalog_cache import catalog_cache
+from app.utils.http_cache import not_modified
 
 router = APIRouter()
 
 
 @router.get("/rules", response_model=FeedbackRulesResponse)
-async def get_feedback_rules():
+async def get_feedback_rules(request: Request, response: Response):
     """Get all feedback rules"""
-    db = await get_database()
-    
     # Use a query that will find the singleton document
     # Since we use a single document pattern, we can query for any document
-    rules_doc = await db.feedback_rules.find_one({})
+    rules_doc = await catalog_cache.find_one("feedback_rules")
     
     if not rules_doc:
         # Create default rules
+        db = await get_database()
         feedback_rules = FeedbackRules()
         await db.feedback_rules.insert_one(feedback_rules.to_dict())
+        catalog_cache.invalidate("feedback_rules")
         return FeedbackRulesResponse(rules=feedback_rules.rules, version=feedback_rules.version)
     
+    cached = not_modified(request, response, await catalog_cache.etag("feedback_rules"))
+    if cached:
+        return cached
+    
     feedback_rules = FeedbackRules.from_dict(rules_doc)
     return FeedbackRulesResponse(rules=feedback_rules.rules, version=feedback_rules.version)
 
@@ -49,16 +55,19 @@ async def update_feedback_rules(rules_data: FeedbackRulesUpdate):
     else:
         feedback_rules = FeedbackRules(rules=rules_data.rules)
         await db.feedback_rules.insert_one(feedback_rules.to_dict())
+    catalog_cache.invalidate("feedback_rules")
     
     return FeedbackRulesResponse(rules=feedback_rules.rules, version=feedback_rules.version)
 
 
 @router.get("/rules/settings", response_model=dict)
-async def get_feedback_settings():
+async def get_feedback_settings(request: Request, response: Response):
     """Get only feedback settings"""
-    db = await get_database()
+    cached = not_modified(request, response, await catalog_cache.etag("feedback_rules"))
+    if cached:
+        return cached
     
-    rules_doc = await db.feedback_rules.find_one({})
+    rules_doc = await catalog_cache.find_one("feedback_rules")
     
     if not rules_doc:
         feedback_rules = FeedbackRules()
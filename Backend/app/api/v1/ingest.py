@@ -2,25 +2,32 @@
 """Data ingestion endpoint"""
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
+import time
+from functools import partial
 from datetime import datetime
-from typing import List, Optional
+from typing import AsyncIterator, Callable, Dict, List, Optional, Union
 from fastapi import APIRouter, Request, HTTPException
 
+from app.config import settings
 from app.database import get_database
 from app.models.signal import RecordIngest, IngestResponse
 from app.schemas.signal import SignalRecord
 from app.services.stream_manager import stream_manager
-from app.services.signal_processor import SignalProcessor
-import asyncio
+from app.services.signal_processor import signal_processor
+from app.services.admission import admission
+from app.services.ingest_streams import ingest_streams
+from app.services.idempotency import idempotency
+from app.utils import ecg_binary
+from app.utils.content_encoding import (
+    BodyDecodeError, UnsupportedEncoding, get_decoder, iter_decoded, read_decoded,
+)
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Global signal processor
-signal_processor = SignalProcessor()
-
 
 def parse_timestamp(ts: any) -> Optional[int]:
     """Parse timestamp to milliseconds"""
@@ -36,8 +43,6 @@ def parse_timestamp(ts: any) -> Optional[int]:
         if 1_000_000_000 < ts_int < 10_000_000_000:
             return ts_int * 1000
         # Already milliseconds
-        if 1_000_000_000_000 < ts_int < 10_000_000_000_000:
-            return ts_int // 1000
         if 1_000_000_000_000 <= ts_int <= 10_000_000_000_000:
             return ts_int
         # Assume milliseconds if in reasonable range
@@ -57,7 +62,7 @@ def parse_dt_from_ts(ts: int) -> str:
 
 @router.post("/ingest", response_model=IngestResponse)
 async def ingest(request: Request):
-    """Ingest sensor data (NDJSON or JSON array)"""
+    """Ingest sensor data (NDJSON, JSON array or binary ECG frames; optionally gzip/zstd encoded)"""
     print("=" * 50, flush=True)
     print("[INGEST] Request received!", flush=True)
     print("=" * 50, flush=True)
@@ -65,74 +70,113 @@ async def ingest(request: Request):
     
     ctype = request.headers.get("content-type", "").lower()
     print(f"[INGEST] Content-Type: '{ctype}'", flush=True)
+    try:
+        decoder = get_decoder(request.headers.get("content-encoding"))
+    except UnsupportedEncoding as e:
+        raise HTTPException(status_code=415, detail=str(e))
     accepted = 0
+    shed = 0
     active_session_id: Optional[str] = None
+    admitted_devices: List[str] = []
+    stream_id: Optional[str] = None
+    response: Optional[IngestResponse] = None
+    
+    # Retried batch (client spool): return the stored response instead of ingesting again.
+    # NDJSON streams resume via X-Stream-Id instead (already persisted records are skipped).
+    idem_key = (request.headers.get("idempotency-key") or "").strip() or None
+    if idem_key and "application/x-ndjson" not in ctype:
+        stored = await idempotency.begin(idem_key, db)
+        if stored is not None:
+            print(f"[INGEST] Duplicate Idempotency-Key {idem_key}, skipped", flush=True)
+            return IngestResponse(**{**stored, "duplicate": True})
+    else:
+        idem_key = None
     
     try:
         records_to_insert: List[dict] = []
         
         if "application/x-ndjson" in ctype:
-            # NDJSON format
+            # NDJSON format: persisted in bounded batches while the stream is open,
+            # so a device can keep one upload open for a whole session
             print("[INGEST] Processing as NDJSON", flush=True)
+            stream = ingest_streams.open(request.headers.get("x-stream-id"))
+            stream_id = stream["stream_id"]
+            last_flush = time.monotonic()
             buf = b""
-            async for chunk in request.stream():
-                if not chunk:
-                    continue
-                buf += chunk
-                print(f"[INGEST] Received chunk, buf size: {len(buf)}", flush=True)
-                while True:
-                    nl = buf.find(b"\n")
-                    if nl < 0:
-                        print(f"[INGEST] No newline found in buf, waiting for more data", flush=True)
-                        break
-                    line = buf[:nl].strip()
-                    buf = buf[nl + 1:]
-                    if not line:
-                        continue
-                    
-                    print(f"[INGEST] Got line: {line[:100]}...", flush=True)
-                    try:
-                        data = json.loads(line)
-                        print(f"[INGEST] Parsed JSON, signal={data.get('signal')}", flush=True)
-                        payload = [data] if isinstance(data, dict) else (data if isinstance(data, list) else None)
-                        if payload:
-                            for item in payload:
-                                rec = RecordIngest(**item)
-                                session_id, signals = await process_record(rec, db)
-                                if session_id:
-                                    active_session_id = session_id
-                                records_to_insert.extend(signals)
-                                accepted += 1
-                    except json.JSONDecodeError as e:
-                        print(f"[INGEST] JSON decode error: {e}", flush=True)
-                        continue
-                    except Exception as e:
-                        print(f"[INGEST] Error processing: {e}", flush=True)
+            
+            def flush_due() -> Optional[float]:
+                if not records_to_insert:
+                    return None
+                return settings.ingest_flush_interval_s - (time.monotonic() - last_flush)
+            
+            try:
+                async for chunk in with_idle_ticks(iter_decoded(request.stream(), decoder), flush_due):
+                    if chunk is None:
+                        # Stream idle: persist what is pending instead of waiting for the next chunk
+                        await flush_stream(db, records_to_insert, stream)
+                        last_flush = time.monotonic()
                         continue
-            # Process any remaining data in buffer (no trailing newline)
-            if buf.strip():
-                print(f"[INGEST] Processing remaining buffer: {len(buf)} bytes", flush=True)
-                try:
-                    data = json.loads(buf)
-                    print(f"[INGEST] Parsed remaining JSON, signal={data.get('signal') if isinstance(data, dict) else 'array'}", flush=True)
-                    payload = [data] if isinstance(data, dict) else (data if isinstance(data, list) else None)
-                    if payload:
-                        for item in payload:
-                            rec = RecordIngest(**item)
-                            session_id, signals = await process_record(rec, db)
-                            if session_id:
-                                active_session_id = session_id
-                            records_to_insert.extend(signals)
-                            accepted += 1
-                except json.JSONDecodeError as e:
-                    print(f"[INGEST] Final buffer JSON decode error: {e}", flush=True)
-                except Exception as e:
-                    print(f"[INGEST] Final buffer error: {e}", flush=True)
-            print(f"[INGEST] NDJSON done, accepted: {accepted}", flush=True)
+                    buf += chunk
+                    lines = buf.split(b"\n")
+                    buf = lines.pop()
+                    for line in lines:
+                        n_ok, n_shed, session_id = await _ingest_line(line, db, records_to_insert, stream)
+                        accepted += n_ok
+                        shed += n_shed
+                        stream["accepted"] += n_ok
+                        stream["shed"] += n_shed
+                        active_session_id = session_id or active_session_id
+                    if records_to_insert and (
+                        len(records_to_insert) >= settings.ingest_flush_records
+                        or time.monotonic() - last_flush >= settings.ingest_flush_interval_s
+                    ):
+                        await flush_stream(db, records_to_insert, stream)
+                        last_flush = time.monotonic()
+                # Process any remaining data in buffer (no trailing newline)
+                if buf.strip():
+                    print(f"[INGEST] Processing remaining buffer: {len(buf)} bytes", flush=True)
+                    n_ok, n_shed, session_id = await _ingest_line(buf, db, records_to_insert, stream)
+                    accepted += n_ok
+                    shed += n_shed
+                    stream["accepted"] += n_ok
+                    stream["shed"] += n_shed
+                    active_session_id = session_id or active_session_id
+                await flush_stream(db, records_to_insert, stream)
+            finally:
+                ingest_streams.close(stream)
+            print(f"[INGEST] NDJSON done, accepted: {accepted}, persisted: {stream['persisted']}", flush=True)
         else:
-            # JSON format
-            payload = await request.json()
+            body = await read_decoded(request.stream(), decoder)
+            frames = ecg_binary.CONTENT_TYPE in ctype
+            if frames:
+                # Packed binary ECG frames
+                try:
+                    payload = ecg_binary.decode_frames(body)
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=f"Invalid binary ECG body: {e}")
+            else:
+                # JSON format
+                payload = json.loads(body)
             print(f"[INGEST] Payload type: {type(payload).__name__}, length: {len(payload) if isinstance(payload, list) else 'N/A'}", flush=True)
+            
+            # Admission control: ECG-only requests are rejected when over budget,
+            # requests carrying BreathTarget/markers are always admitted
+            items = [payload] if isinstance(payload, dict) else (payload if isinstance(payload, list) else [])
+            # (per device: a batch with records of several devices is charged to each of them)
+            by_device: Dict[str, List[dict]] = {}
+            for it in items:
+                if isinstance(it, dict):
+                    by_device.setdefault(it.get("device_id") or "UNKNOWN", []).append(it)
+            for device_id, device_items in by_device.items():
+                priority = admission.is_priority(it.get("signal") for it in device_items)
+                if not admission.try_acquire(device_id, priority=priority):
+                    print(f"[INGEST] Shedding {len(items)} record(s): device {device_id} over budget", flush=True)
+                    raise HTTPException(
+                        status_code=429,
+                        detail="Ingest overloaded, retry later",
+                        headers={"Retry-After": str(admission.retry_after_s)},
+                    )
+                admitted_devices.append(device_id)
             if isinstance(payload, dict):
                 print(f"[INGEST] Single record, signal={payload.get('signal')}", flush=True)
                 rec = RecordIngest(**payload)
@@ -145,7 +189,8 @@ async def ingest(request: Request):
                 print(f"[INGEST] Array of {len(payload)} records", flush=True)
                 for item in payload:
                     print(f"[INGEST] Processing item, signal={item.get('signal')}", flush=True)
-                    rec = RecordIngest(**item)
+                    # Decoded frames are already typed; skip Pydantic for them
+                    rec = item if frames else RecordIngest(**item)
                     session_id, signals = await process_record(rec, db)
                     if session_id:
                         active_session_id = session_id
@@ -156,41 +201,206 @@ async def ingest(request: Request):
         
         # Insert all records
         if records_to_insert:
-            await db.signals.insert_many(records_to_insert, ordered=False)
+            await db.signals.insert_many(ecg_binary.to_storable(records_to_insert), ordered=False)
         
-        return IngestResponse(accepted=accepted, session_id=active_session_id)
+        response = IngestResponse(accepted=accepted, session_id=active_session_id, shed=shed, stream_id=stream_id)
+        return response
     
+    except HTTPException:
+        raise
+    except BodyDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("Error in /ingest")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        for device_id in admitted_devices:
+            admission.release(device_id)
+        if idem_key is not None:
+            await idempotency.finish(idem_key, db, response.model_dump() if response is not None else None)
+
+
+async def with_idle_ticks(source: AsyncIterator, timeout: Callable[[], Optional[float]]) -> AsyncIterator:
+    """
+    Items of `source`, plus None whenever `timeout()` seconds pass without one
+    (None = wait indefinitely). Used to flush pending records of an idle stream;
+    the pending read is kept across ticks, never cancelled.
+    """
+    it = source.__aiter__()
+    nxt: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if nxt is None:
+                nxt = asyncio.ensure_future(it.__anext__())
+            wait_s = timeout()
+            if wait_s is not None and wait_s <= 0:
+                done = nxt.done()
+            else:
+                done = bool((await asyncio.wait({nxt}, timeout=wait_s))[0])
+            if not done:
+                yield None
+                continue
+            fut, nxt = nxt, None
+            try:
+                item = fut.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        if nxt is not None:
+            nxt.cancel()
+
+
+async def _ingest_line(line: bytes, db, out: List[dict],
+                       stream: Optional[dict] = None) -> tuple[int, int, Optional[str]]:
+    """Parse and process one NDJSON line; returns (accepted, shed, session_id)"""
+    line = line.strip()
+    if not line:
+        return 0, 0, None
+    try:
+        data = json.loads(line)
+        payload = [data] if isinstance(data, dict) else (data if isinstance(data, list) else None)
+        return await ingest_items(payload or [], db, out, stream=stream)
+    except json.JSONDecodeError as e:
+        print(f"[INGEST] JSON decode error: {e}", flush=True)
+    except Exception as e:
+        print(f"[INGEST] Error processing: {e}", flush=True)
+    return 0, 0, None
+
+
+async def ingest_items(items: list, db, out: List[dict],
+                       sessions: Optional["ActiveSessionCache"] = None,
+                       frames: bool = False,
+                       stream: Optional[dict] = None) -> tuple[int, int, Optional[str]]:
+    """
+    Process streamed records (NDJSON line / WebSocket message); returns (accepted, shed, session_id).
+    frames=True: items come from ecg_binary.decode_frames and skip Pydantic validation.
+    stream: the ingest_streams state; while a resumed stream replays, records it already persisted are skipped.
+    """
+    accepted = shed = 0
+    active_session_id = None
+    for item in items:
+        if stream is not None and _already_persisted(stream, item):
+            stream["skipped"] += 1
+            continue
+        if await _shed_item(item):
+            shed += 1
+            continue
+        rec = item if frames else RecordIngest(**item)
+        session_id, signals = await process_record(rec, db, sessions)
+        if session_id:
+            active_session_id = session_id
+        out.extend(signals)
+        accepted += 1
+    return accepted, shed, active_session_id
 
 
-async def process_record(rec: RecordIngest, db) -> tuple[Optional[str], List[dict]]:
-    """Process a single record and return (session_id, signals_to_insert)"""
-    device_id = rec.device_id or "UNKNOWN"
-    print(f"[process_record] signal={rec.signal}, device={device_id}, samples={len(rec.samples) if rec.samples else 0}", flush=True)
+def _already_persisted(stream: dict, item) -> bool:
+    """Record that an earlier upload of this (resumed) stream already stored"""
+    if not stream["replay"] or not isinstance(item, dict) or item.get("ts") is None:
+        return False
+    return ingest_streams.already_persisted(
+        stream, item.get("device_id") or "UNKNOWN", item.get("signal"), parse_timestamp(item["ts"])
+    )
+
+
+async def flush_stream(db, records: List[dict], stream: dict):
+    """Insert the pending batch of a stream and clear it (keeps stream memory bounded)"""
+    if not records:
+        return
+    await db.signals.insert_many(ecg_binary.to_storable(records), ordered=False)
+    ingest_streams.persisted(stream, records)
+    records.clear()
+
+
+@router.get("/ingest/streams/{stream_id}")
+async def ingest_stream_status(stream_id: str):
+    """Progress ack for an NDJSON upload (accepted/persisted/skipped counts, last persisted ts)"""
+    state = ingest_streams.get(stream_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"Stream {stream_id} not found")
+    return state
+
+
+async def _shed_item(item) -> bool:
+    """
+    Drop a streamed (NDJSON) record when over budget, unless it is a priority signal.
+    Streams first wait up to Retry-After for capacity (backpressure on the upload).
+    """
+    if not isinstance(item, dict) or admission.is_priority([item.get("signal")]):
+        return False
+    device_id = item.get("device_id") or "UNKNOWN"
+    if await admission.wait_for_capacity(device_id, timeout=admission.retry_after_s):
+        return False
+    admission.shed += 1
+    return True
+
+
+class ActiveSessionCache:
+    """
+    Active session per device for one long-lived connection (WebSocket ingest),
+    so the session is not looked up for every record. BreathTarget records
+    invalidate it; the TTL picks up sessions started/ended via the REST API.
+    """
+
+    def __init__(self, ttl_s: float = 5.0):
+        self.ttl_s = ttl_s
+        self._docs: dict = {}
+
+    async def get(self, db, device_id: str) -> Optional[dict]:
+        hit = self._docs.get(device_id)
+        if hit is not None and time.monotonic() - hit[1] < self.ttl_s:
+            return hit[0]
+        doc = await _find_active_session(db, device_id)
+        self._docs[device_id] = (doc, time.monotonic())
+        return doc
+
+    def invalidate(self, device_id: str):
+        self._docs.pop(device_id, None)
+
+
+async def _find_active_session(db, device_id: str) -> Optional[dict]:
+    return await db.sessions.find_one({
+        "device_id": device_id,
+        "status": "active"
+    })
+
+
+async def process_record(rec: Union[RecordIngest, dict], db,
+                         sessions: Optional[ActiveSessionCache] = None) -> tuple[Optional[str], List[dict]]:
+    """
+    Process a single record and return (session_id, signals_to_insert).
+    A plain dict is a decoded binary ECG frame (samples stay an ndarray).
+    """
+    signal_dict = rec if isinstance(rec, dict) else rec.model_dump()
+    signal = signal_dict["signal"]
+    device_id = signal_dict.get("device_id") or "UNKNOWN"
+    samples = signal_dict.get("samples")
+    print(f"[process_record] signal={signal}, device={device_id}, samples={len(samples) if samples is not None else 0}", flush=True)
     
     # Parse timestamp
-    ts = parse_timestamp(rec.ts)
+    ts = parse_timestamp(signal_dict.get("ts"))
     dt = parse_dt_from_ts(ts)
     
     # Get or create active session
-    session_doc = await db.sessions.find_one({
-        "device_id": device_id,
-        "status": "active"
-    })
+    if sessions is not None and signal != "BreathTarget":
+        session_doc = await sessions.get(db, device_id)
+    else:
+        session_doc = await _find_active_session(db, device_id)
     session_id = session_doc["session_id"] if session_doc else None
     
-    if rec.signal == "ecg":
+    if signal == "ecg":
         if session_doc:
             print(f"[ingest] Found active session {session_id} for device {device_id}", flush=True)
         else:
             print(f"[ingest] !! NO ACTIVE SESSION for device_id={device_id} !!", flush=True)
     
     # Handle BreathTarget - update/create session
-    if rec.signal == "BreathTarget":
-        target_rr = getattr(rec, "TargetRR", 0) or 0
-        technique_name = getattr(rec, "technique", None)
+    if signal == "BreathTarget":
+        if sessions is not None:
+            sessions.invalidate(device_id)
+        target_rr = signal_dict.get("TargetRR") or 0
+        technique_name = signal_dict.get("technique")
         
         if target_rr == 0:
             # End session
@@ -206,6 +416,8 @@ async def process_record(rec: RecordIngest, db) -> tuple[Optional[str], List[dic
         elif target_rr > 0:
             # Start or update session
             if session_doc:
+                if session_doc.get("target_rr") != target_rr:
+                    signal_processor.notify_target_change(session_id)
                 await db.sessions.update_one(
                     {"session_id": session_id},
                     {"$set": {
@@ -225,14 +437,13 @@ async def process_record(rec: RecordIngest, db) -> tuple[Optional[str], List[dic
                 session_id = session.session_id
     
     # Create signal record
-    signal_dict = rec.model_dump()
     signal_record = SignalRecord(
         device_id=device_id,
-        signal=rec.signal,
+        signal=signal,
         ts=ts,
         dt=dt,
         session_id=session_id,
-        samples=signal_dict.get("samples"),
+        samples=samples,
         bpm=signal_dict.get("bpm"),
         estRR=signal_dict.get("estRR"),
         tijd=signal_dict.get("tijd"),
@@ -256,13 +467,13 @@ async def process_record(rec: RecordIngest, db) -> tuple[Optional[str], List[dic
     
     # Process ECG signals for RR estimation (async, non-blocking)
     # Note: This runs in background, errors are logged but don't block ingest
-    if rec.signal == "ecg":
+    if signal == "ecg":
         if session_id:
             print(f"[ECG] Processing ecg for session {session_id}, device {device_id}", flush=True)
             try:
-                asyncio.create_task(
-                    signal_processor.process_ecg_signal(signal_dict, session_id, db)
-                )
+                # Samples are buffered here for every packet; only the estimate is queued (and coalesced)
+                if await signal_processor.add_ecg(signal_dict, session_id):
+                    admission.spawn(partial(signal_processor.estimate, session_id, db), session_id)
             except Exception as e:
                 print(f"[ECG] Failed to start processing task: {e}", flush=True)
         else:
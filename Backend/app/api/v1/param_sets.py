@@ -3,32 +3,35 @@
 from __future__ import annotations
 
 from typing import List
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 
 from app.database import get_database
 from app.models.param_set import ParameterSetResponse, ParameterSetCreate
 from app.schemas.parameter_set import ParameterSet
+from app.services.catalog_cache import catalog_cache
+from app.utils.http_cache import not_modified
 
 router = APIRouter()
 
 
 @router.get("", response_model=List[str])
-async def list_param_versions():
+async def list_param_versions(request: Request, response: Response):
     """List all parameter set versions"""
-    db = await get_database()
-    
-    cursor = db.parameter_sets.find({}, {"version": 1})
-    versions = await cursor.to_list(length=None)
+    cached = not_modified(request, response, await catalog_cache.etag("parameter_sets"))
+    if cached:
+        return cached
     
-    return [v["version"] for v in versions]
+    return [v["version"] for v in await catalog_cache.get("parameter_sets")]
 
 
 @router.get("/{version}", response_model=ParameterSetResponse)
-async def get_param_set(version: str):
+async def get_param_set(version: str, request: Request, response: Response):
     """Get parameter set by version"""
-    db = await get_database()
+    cached = not_modified(request, response, await catalog_cache.etag("parameter_sets"))
+    if cached:
+        return cached
     
-    param_doc = await db.parameter_sets.find_one({"version": version})
+    param_doc = await catalog_cache.find_one("parameter_sets", version=version)
     if not param_doc:
         raise HTTPException(status_code=404, detail=f"Parameter set {version} not found")
     
@@ -71,6 +74,7 @@ async def create_param_set(param_data: ParameterSetCreate):
     
     result = await db.parameter_sets.insert_one(param_set.to_dict())
     param_set._id = result.inserted_id
+    catalog_cache.invalidate("parameter_sets")
     
     return ParameterSetResponse(**param_set.to_dict())
 
@@ -91,6 +95,7 @@ async def update_param_set(version: str, param_data: ParameterSetCreate):
         {"version": version},
         {"$set": update_data}
     )
+    catalog_cache.invalidate("parameter_sets")
     
     updated = await db.parameter_sets.find_one({"version": version})
     param_set = ParameterSet.from_dict(updated)
@@ -7,6 +7,7 @@ from fastapi.responses import StreamingResponse
 import json
 
 from app.services.stream_manager import stream_manager
+from app.utils.ecg_binary import json_default
 
 router = APIRouter()
 
@@ -31,7 +32,7 @@ async def stream_signals(
                     continue
                 
                 # Format as SSE
-                event_data = json.dumps(data, ensure_ascii=False)
+                event_data = json.dumps(data, ensure_ascii=False, default=json_default)
                 yield f"data: {event_data}\n\n"
         except Exception as e:
             # Send error event
@@ -4,23 +4,26 @@ from __future__ import annotations
 
 import logging
 from typing import List, Dict
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 
 from app.database import get_database
 from app.models.technique import TechniqueCreate, TechniqueResponse
 from app.schemas.technique import Technique
+from app.services.catalog_cache import catalog_cache
+from app.utils.http_cache import not_modified
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
 @router.get("", response_model=Dict[str, TechniqueResponse])
-async def list_techniques():
+async def list_techniques(request: Request, response: Response):
     """Get all techniques (admin)"""
-    db = await get_database()
+    cached = not_modified(request, response, await catalog_cache.etag("techniques"))
+    if cached:
+        return cached
     
-    cursor = db.techniques.find({"is_active": True})
-    techniques_docs = await cursor.to_list(length=None)
+    techniques_docs = [d for d in await catalog_cache.get("techniques") if d.get("is_active") is True]
     
     result = {}
     for doc in techniques_docs:
@@ -38,15 +41,16 @@ async def list_techniques():
 
 
 @router.get("/public", response_model=Dict[str, TechniqueResponse])
-async def list_public_techniques():
+async def list_public_techniques(request: Request, response: Response):
     """Get techniques marked as show_in_app=true and is_active=true"""
-    db = await get_database()
+    cached = not_modified(request, response, await catalog_cache.etag("techniques"))
+    if cached:
+        return cached
 
-    cursor = db.techniques.find({
-        "show_in_app": True,
-        "is_active": True
-    })
-    techniques_docs = await cursor.to_list(length=None)
+    techniques_docs = [
+        d for d in await catalog_cache.get("techniques")
+        if d.get("show_in_app") is True and d.get("is_active") is True
+    ]
 
     result = {}
     for doc in techniques_docs:
@@ -65,11 +69,13 @@ async def list_public_techniques():
 
 
 @router.get("/{name}", response_model=TechniqueResponse)
-async def get_technique(name: str):
+async def get_technique(name: str, request: Request, response: Response):
     """Get technique by name"""
-    db = await get_database()
+    cached = not_modified(request, response, await catalog_cache.etag("techniques"))
+    if cached:
+        return cached
     
-    technique_doc = await db.techniques.find_one({"name": name, "is_active": True})
+    technique_doc = await catalog_cache.find_one("techniques", name=name, is_active=True)
     if not technique_doc:
         raise HTTPException(status_code=404, detail=f"Technique {name} not found")
 
@@ -113,6 +119,7 @@ async def create_technique(technique_data: TechniqueCreate):
         # Insert new
         result = await db.techniques.insert_one(technique.to_dict())
         technique._id = result.inserted_id
+    catalog_cache.invalidate("techniques")
 
     return TechniqueResponse(
         name=technique.name,
@@ -137,5 +144,6 @@ async def delete_technique(name: str):
         {"name": name},
         {"$set": {"is_active": False}}
     )
+    catalog_cache.invalidate("techniques")
     
     return None
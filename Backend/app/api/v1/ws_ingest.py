@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""WebSocket ingest endpoint (one long-lived connection per device)"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from typing import List, Optional
+
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
+
+from app.config import settings
+from app.database import get_database
+from app.services.ingest_streams import ingest_streams
+from app.services.stream_manager import stream_manager
+from app.utils import ecg_binary
+from app.api.v1.ingest import ActiveSessionCache, flush_stream, ingest_items, with_idle_ticks
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+DEFAULT_PUSH = "guidance"
+
+
+@router.websocket("/ws/ingest")
+async def ws_ingest(
+    websocket: WebSocket,
+    device_id: str = Query(..., description="Device ID of this connection"),
+    push: str = Query(DEFAULT_PUSH, description="Comma-separated signal types pushed back, 'all' or 'none'"),
+    stream_id: Optional[str] = Query(None, description="Client-chosen id for /ingest/streams acks; reusing it resumes the stream"),
+):
+    """
+    Persistent ingest connection.
+
+    Client -> server: text messages with one JSON record or an array (same
+    records as POST /ingest), or binary messages with application/x-serena-ecg
+    frames. Every message is answered with
+    {"type": "ack", "seq", "accepted", "shed", "persisted", "session_id"}
+    (or {"type": "error", "seq", "detail"}).
+
+    Server -> client: derived signals of this device selected by `push`
+    (same JSON as the /stream SSE events).
+    """
+    await websocket.accept()
+    db = await get_database()
+
+    want = set(s.strip() for s in push.split(",") if s.strip())
+    sessions = ActiveSessionCache()
+    stream = ingest_streams.open(stream_id)
+    stream["device_id"] = device_id
+    send_lock = asyncio.Lock()
+    records: List[dict] = []
+    last_flush = time.monotonic()
+    seq = 0
+
+    async def send(msg: dict):
+        async with send_lock:
+            await websocket.send_text(json.dumps(msg, ensure_ascii=False, default=ecg_binary.json_default))
+
+    async def forward():
+        try:
+            async for data in stream_manager.subscribe(device_id):
+                if data.get("device_id") != device_id:
+                    continue
+                if "all" not in want and data.get("signal") not in want:
+                    continue
+                await send(data)
+        except Exception as e:
+            # Socket gone; the receive loop notices the disconnect
+            logger.debug(f"/ws/ingest push stopped for {device_id}: {e}")
+
+    async def messages():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            yield message
+
+    def flush_due() -> Optional[float]:
+        if not records:
+            return None
+        return settings.ingest_flush_interval_s - (time.monotonic() - last_flush)
+
+    forwarder = asyncio.create_task(forward()) if want and "none" not in want else None
+    try:
+        async for message in with_idle_ticks(messages(), flush_due):
+            if message is None:
+                # Connection idle: persist what is pending instead of waiting for the next message
+                await flush_stream(db, records, stream)
+                last_flush = time.monotonic()
+                continue
+            seq += 1
+            try:
+                frames = message.get("bytes") is not None
+                if frames:
+                    items = ecg_binary.decode_frames(message["bytes"])
+                else:
+                    data = json.loads(message.get("text") or "null")
+                    items = [data] if isinstance(data, dict) else (data if isinstance(data, list) else [])
+                items = [it for it in items if isinstance(it, dict)]
+                for it in items:
+                    it.setdefault("device_id", device_id)
+                accepted, shed, session_id = await ingest_items(items, db, records, sessions, frames=frames, stream=stream)
+            except (ValueError, TypeError) as e:
+                await send({"type": "error", "seq": seq, "detail": str(e)})
+                continue
+
+            stream["accepted"] += accepted
+            stream["shed"] += shed
+            if records and (
+                len(records) >= settings.ingest_flush_records
+                or time.monotonic() - last_flush >= settings.ingest_flush_interval_s
+            ):
+                await flush_stream(db, records, stream)
+                last_flush = time.monotonic()
+            await send({
+                "type": "ack",
+                "seq": seq,
+                "accepted": accepted,
+                "shed": shed,
+                "persisted": stream["persisted"],
+                "session_id": session_id,
+                "stream_id": stream["stream_id"],
+            })
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        logger.exception("Error in /ws/ingest")
+    finally:
+        if forwarder is not None:
+            forwarder.cancel()
+        try:
+            await flush_stream(db, records, stream)
+        except Exception:
+            logger.exception("Flush on /ws/ingest close failed")
+        ingest_streams.close(stream)
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+Device-affine multi-process deployment.
+
+`python -m app.cluster --workers N` starts N shard workers (the normal app,
+each on a loopback port) behind a router on the public port. Every device
+id hashes to one live shard, so its session state (ECG buffer, feedback
+state, SSE subscribers) stays in one process while estimation runs on N
+cores.
+"""
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""python -m app.cluster --workers N --port 8000"""
+from __future__ import annotations
+
+import argparse
+import os
+
+import uvicorn
+
+from app.config import settings
+from app.utils.logging import setup_logging
+
+
+def main():
+    p = argparse.ArgumentParser(description="Serena Backend, sharded over worker processes by device id")
+    p.add_argument("--workers", type=int, default=settings.cluster_workers, help="Shard workers (0 = CPU cores)")
+    p.add_argument("--host", default=settings.server_host)
+    p.add_argument("--port", type=int, default=settings.server_port)
+    p.add_argument("--base-port", type=int, default=settings.cluster_base_port, help="Shard i listens on 127.0.0.1:(base + i)")
+    args = p.parse_args()
+
+    setup_logging()
+    from app.cluster.router import create_router_app
+    workers = args.workers or os.cpu_count() or 1
+    uvicorn.run(create_router_app(workers, args.base_port), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""Device -> shard assignment (rendezvous hashing)"""
+from __future__ import annotations
+
+import hashlib
+from typing import Iterable
+
+
+def _score(shard: int, device_id: str) -> int:
+    digest = hashlib.blake2b(f"{shard}:{device_id}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def owner(device_id: str, shards: Iterable[int]) -> int:
+    """
+    Owning shard of a device among the live shards.
+    When a shard leaves or joins only its own devices move.
+    """
+    shards = list(shards)
+    if not shards:
+        raise LookupError("No live shards")
+    return max(shards, key=lambda s: _score(s, device_id))
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""Router -> shard notifications (only mounted on shard workers)"""
+from __future__ import annotations
+
+from typing import List, Optional
+
+from fastapi import APIRouter
+from pydantic import BaseModel
+
+from app.config import settings
+from app.cluster.hashing import owner
+from app.services.catalog_cache import catalog_cache
+from app.services.signal_processor import signal_processor
+
+router = APIRouter(prefix="/_cluster", include_in_schema=False)
+
+
+class ClusterEvent(BaseModel):
+    event: str
+    session_id: Optional[str] = None
+    live: Optional[List[int]] = None
+
+
+@router.post("/notify")
+async def notify(ev: ClusterEvent):
+    """Apply a state change made on another shard"""
+    if ev.event == "catalog_changed":
+        catalog_cache.invalidate()
+    elif ev.event == "session_ended" and ev.session_id:
+        signal_processor.clear_buffer(ev.session_id)
+    elif ev.event == "rebalanced" and ev.live:
+        # Drop sessions of devices that moved to another shard
+        me = settings.cluster_shard
+        signal_processor.retain_devices(lambda device_id: owner(device_id, ev.live) == me)
+    return {"status": "ok", "shard": settings.cluster_shard}
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Front router for the sharded deployment.
+
+Requests are proxied to the shard that owns their device:
+- device from ?device_id= / ?device= / X-Device-Id, else (POST /ingest,
+  POST /sessions) peeked from the start of the body (JSON/NDJSON field or
+  binary frame header)
+- requests without a device go round-robin (catalog, sessions, ... are
+  MongoDB-backed and identical on every shard)
+- SSE for all devices (device_id=UNKNOWN) is merged from every shard
+  (unless the shards share a STREAM_BACKEND, then any shard has them all),
+  /ingest/streams/{id} is asked to every shard
+- catalog writes, session ends and shard changes are announced to the
+  shards via /_cluster/notify
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import re
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from app.cluster.hashing import owner
+from app.cluster.supervisor import ShardSupervisor
+from app.config import settings
+from app.utils import ecg_binary
+from app.utils.content_encoding import get_decoder
+
+logger = logging.getLogger(__name__)
+
+# Bytes of an ingest body inspected for the device id
+PEEK_BYTES = 64 * 1024
+# Merged SSE: keepalive while idle, reconnect backoff of a shard's event stream
+SSE_KEEPALIVE_S = 15.0
+SSE_RECONNECT_S = 0.5
+SSE_RECONNECT_MAX_S = 10.0
+
+HOP_HEADERS = frozenset({
+    "connection", "keep-alive", "proxy-connection", "transfer-encoding", "te",
+    "trailer", "upgrade", "host", "content-length",
+})
+CATALOG_PREFIXES = ("/api/v1/techniques", "/api/v1/param_versions", "/api/v1/feedback")
+SESSION_END = re.compile(r"^/api/v1/sessions/([^/]+)/end$")
+PEEK_PATHS = ("/api/v1/ingest", "/api/v1/sessions")
+DEVICE_FIELD = re.compile(rb'"device_id"\s*:\s*"([^"\\]{1,128})"')
+
+
+def _forward_headers(headers) -> List[Tuple[str, str]]:
+    return [(k, v) for k, v in headers.items() if k.lower() not in HOP_HEADERS]
+
+
+def device_from_body(prefix: bytes, content_type: str, content_encoding: Optional[str]) -> Optional[str]:
+    """Device id from the first bytes of an ingest body (None when not found)"""
+    try:
+        decoder = get_decoder(content_encoding)
+        data = decoder.decompress(prefix) if decoder else prefix
+    except ValueError:
+        return None
+    if ecg_binary.CONTENT_TYPE in content_type:
+        if len(data) < ecg_binary.HEADER.size:
+            return None
+        dev_len = ecg_binary.HEADER.unpack_from(data)[3]
+        dev = data[ecg_binary.HEADER.size:ecg_binary.HEADER.size + dev_len]
+        return dev.decode("utf-8", "replace") or None
+    m = DEVICE_FIELD.search(data)
+    return m.group(1).decode("utf-8", "replace") if m else None
+
+
+class ShardRouter:
+    """Routing state and proxy handlers (one instance per router process)"""
+
+    def __init__(self, workers: int, base_port: int):
+        self.supervisor = ShardSupervisor(workers, base_port, on_change=self._rebalanced)
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=None))
+        self._rr = itertools.count()
+
+    # ---------------- routing ----------------
+
+    def _pick(self, device_id: Optional[str]) -> int:
+        live = self.supervisor.live
+        if not live:
+            raise LookupError("No live shards")
+        if device_id:
+            return owner(device_id, live)
+        return live[next(self._rr) % len(live)]
+
+    @staticmethod
+    def _device_hint(conn) -> Optional[str]:
+        q = conn.query_params
+        return q.get("device_id") or q.get("device") or conn.headers.get("x-device-id")
+
+    async def _peek_device(self, request: Request) -> Tuple[Optional[str], AsyncIterator[bytes]]:
+        """Read enough of the body to find the device id; returns it plus the full body stream"""
+        stream = request.stream()
+        head: List[bytes] = []
+        size = 0
+        device_id = None
+        async for chunk in stream:
+            head.append(chunk)
+            size += len(chunk)
+            device_id = device_from_body(
+                b"".join(head),
+                request.headers.get("content-type", "").lower(),
+                request.headers.get("content-encoding"),
+            )
+            if device_id or size >= PEEK_BYTES:
+                break
+
+        async def body():
+            for chunk in head:
+                yield chunk
+            async for chunk in stream:
+                yield chunk
+
+        return device_id, body()
+
+    # ---------------- handlers ----------------
+
+    async def http(self, request: Request) -> Response:
+        path = request.url.path
+        if path.startswith("/_cluster"):
+            return JSONResponse({"detail": "Not Found"}, status_code=404)
+
+        device_id = self._device_hint(request)
+        if (path == "/api/v1/stream" and device_id in (None, "", "UNKNOWN")
+                and settings.stream_backend == "memory"):
+            return await self._merged_sse(request)
+        if path.startswith("/api/v1/ingest/streams/"):
+            return await self._first_found(request)
+
+        body = request.stream()
+        if device_id is None and path in PEEK_PATHS and request.method == "POST":
+            device_id, body = await self._peek_device(request)
+
+        try:
+            shard = self._pick(device_id)
+        except LookupError:
+            return JSONResponse({"detail": "No backend shard available"}, status_code=503,
+                                headers={"Retry-After": "1"})
+        resp = await self._send(shard, request, body)
+
+        if request.method in ("POST", "PUT", "PATCH", "DELETE") and resp.status_code < 400:
+            if path.startswith(CATALOG_PREFIXES):
+                await self._notify({"event": "catalog_changed"}, exclude=shard)
+            m = SESSION_END.match(path)
+            if m:
+                await self._notify({"event": "session_ended", "session_id": m.group(1)}, exclude=shard)
+
+        return StreamingResponse(
+            resp.aiter_raw(),
+            status_code=resp.status_code,
+            headers={k: v for k, v in resp.headers.items() if k.lower() not in HOP_HEADERS},
+            background=BackgroundTask(resp.aclose),
+        )
+
+    async def _send(self, shard: int, request: Request, body) -> httpx.Response:
+        url = self.supervisor.url(shard) + request.url.path
+        if request.url.query:
+            url += "?" + request.url.query
+        req = self.client.build_request(
+            request.method, url,
+            headers=_forward_headers(request.headers) + [("x-forwarded-for", request.client.host if request.client else "")],
+            content=body if request.method not in ("GET", "HEAD") else None,
+        )
+        return await self.client.send(req, stream=True)
+
+    async def _first_found(self, request: Request) -> Response:
+        """Per-process lookups (ingest stream acks): first shard that knows the id"""
+        for shard in self.supervisor.live:
+            r = await self.client.get(self.supervisor.url(shard) + request.url.path)
+            if r.status_code != 404:
+                return Response(r.content, status_code=r.status_code, media_type=r.headers.get("content-type"))
+        return JSONResponse({"detail": "Not Found"}, status_code=404)
+
+    async def _merged_sse(self, request: Request) -> Response:
+        """
+        SSE for all devices: merge the event streams of every live shard.
+        Each shard has a pump that reconnects (with backoff) while the shard is
+        live; shards that (re)join `supervisor.live` get a pump on the next
+        event or keepalive tick. While nothing arrives a keepalive comment is
+        sent, so the response never hangs silently.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+        pumps: Dict[int, asyncio.Task] = {}
+
+        async def pump(shard: int):
+            backoff = SSE_RECONNECT_S
+            while shard in self.supervisor.live:
+                try:
+                    resp = await self._send(shard, request, None)
+                    buf = b""
+                    try:
+                        async for chunk in resp.aiter_raw():
+                            backoff = SSE_RECONNECT_S
+                            buf += chunk
+                            *events, buf = buf.split(b"\n\n")
+                            for ev in events:
+                                await queue.put(ev + b"\n\n")
+                    finally:
+                        await resp.aclose()
+                    logger.debug(f"SSE pump shard {shard} ended, reconnecting")
+                except Exception as e:
+                    logger.debug(f"SSE pump shard {shard} failed, reconnecting: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(SSE_RECONNECT_MAX_S, backoff * 2)
+
+        def reconcile():
+            for shard in self.supervisor.live:
+                task = pumps.get(shard)
+                if task is None or task.done():
+                    pumps[shard] = asyncio.create_task(pump(shard))
+
+        async def events():
+            try:
+                while True:
+                    reconcile()
+                    try:
+                        yield await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_S)
+                    except asyncio.TimeoutError:
+                        yield b": keepalive\n\n"
+            finally:
+                for t in pumps.values():
+                    t.cancel()
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers={
+            "Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no",
+        })
+
+    async def websocket(self, websocket: WebSocket):
+        """Proxy a WebSocket (e.g. /api/v1/ws/ingest) to the owner of its device"""
+        from websockets.asyncio.client import connect
+        from websockets.exceptions import ConnectionClosed
+
+        try:
+            shard = self._pick(self._device_hint(websocket))
+        except LookupError:
+            await websocket.close(code=1013)
+            return
+        url = self.supervisor.url(shard).replace("http://", "ws://", 1) + websocket.url.path
+        if websocket.url.query:
+            url += "?" + websocket.url.query
+
+        await websocket.accept()
+        try:
+            async with connect(url, max_size=None) as upstream:
+                async def downstream():
+                    async for msg in upstream:
+                        if isinstance(msg, bytes):
+                            await websocket.send_bytes(msg)
+                        else:
+                            await websocket.send_text(msg)
+
+                down = asyncio.create_task(downstream())
+                try:
+                    while True:
+                        msg = await websocket.receive()
+                        if msg["type"] == "websocket.disconnect":
+                            break
+                        await upstream.send(msg["bytes"] if msg.get("bytes") is not None else msg.get("text", ""))
+                finally:
+                    down.cancel()
+        except (WebSocketDisconnect, ConnectionClosed, OSError) as e:
+            logger.debug(f"WebSocket proxy to shard {shard} closed: {e}")
+        finally:
+            try:
+                await websocket.close()
+            except (RuntimeError, WebSocketDisconnect):
+                pass
+
+    # ---------------- cluster events ----------------
+
+    async def _notify(self, event: dict, exclude: Optional[int] = None):
+        shards = [s for s in self.supervisor.live if s != exclude]
+
+        async def post(shard: int):
+            try:
+                await self.client.post(self.supervisor.url(shard) + "/_cluster/notify", json=event, timeout=5.0)
+            except httpx.HTTPError as e:
+                logger.warning(f"Notify shard {shard} failed: {e}")
+
+        await asyncio.gather(*(post(s) for s in shards))
+
+    async def _rebalanced(self, live: List[int]):
+        logger.info(f"Live shards: {live}")
+        await self._notify({"event": "rebalanced", "live": live})
+
+
+def create_router_app(workers: int, base_port: int) -> Starlette:
+    router = ShardRouter(workers, base_port)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await router.supervisor.start()
+        yield
+        await router.supervisor.stop()
+        await router.client.aclose()
+
+    methods = ["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
+    return Starlette(
+        routes=[
+            WebSocketRoute("/{path:path}", router.websocket),
+            Route("/{path:path}", router.http, methods=methods),
+        ],
+        lifespan=lifespan,
+    )
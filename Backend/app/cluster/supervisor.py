@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Spawns, health-checks and restarts the shard worker processes"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HEALTH_TIMEOUT_S = 30.0
+MONITOR_INTERVAL_S = 1.0
+MAX_RESTART_BACKOFF_S = 30.0
+
+
+class ShardSupervisor:
+    """
+    Runs `workers` copies of the app (uvicorn, one process each) on
+    127.0.0.1:(base_port + i) with CLUSTER_SHARD=i.
+
+    `live` only lists shards that answer /healthz; a crashed worker is
+    dropped from it (its devices fail over to the remaining shards) and
+    re-added once its replacement is healthy. `on_change(live)` is awaited
+    after every change so the router can tell the shards to rebalance.
+    """
+
+    def __init__(self, workers: int, base_port: int, app: str = "app.main:app",
+                 on_change: Optional[Callable[[List[int]], Awaitable[None]]] = None):
+        self.workers = workers
+        self.base_port = base_port
+        self.app = app
+        self.on_change = on_change
+        self.live: List[int] = []
+        self._procs: Dict[int, subprocess.Popen] = {}
+        self._restarts: Dict[int, int] = {}
+        self._monitor: Optional[asyncio.Task] = None
+        self._client = httpx.AsyncClient(timeout=2.0)
+
+    def url(self, shard: int) -> str:
+        return f"http://127.0.0.1:{self.base_port + shard}"
+
+    async def start(self):
+        for shard in range(self.workers):
+            self._spawn(shard)
+        results = await asyncio.gather(*(self._wait_healthy(s) for s in range(self.workers)))
+        await self._set_live([s for s, ok in zip(range(self.workers), results) if ok])
+        for shard, ok in zip(range(self.workers), results):
+            if not ok:
+                self._procs[shard].kill()
+                asyncio.create_task(self._restart(shard))
+        logger.info(f"Cluster up: {len(self.live)}/{self.workers} shards live")
+        self._monitor = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+        for proc in self._procs.values():
+            proc.terminate()
+        # Wait off the event loop (all shards in parallel); kill what does not exit
+        await asyncio.gather(*(self._reap(proc) for proc in self._procs.values()))
+        await self._client.aclose()
+
+    @staticmethod
+    async def _reap(proc: subprocess.Popen, timeout: float = 10.0):
+        try:
+            await asyncio.to_thread(proc.wait, timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            await asyncio.to_thread(proc.wait)
+
+    def _spawn(self, shard: int):
+        env = dict(os.environ, CLUSTER_SHARD=str(shard))
+        self._procs[shard] = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", self.app,
+             "--host", "127.0.0.1", "--port", str(self.base_port + shard),
+             "--no-access-log"],
+            env=env,
+        )
+        logger.info(f"Shard {shard} started (pid {self._procs[shard].pid})")
+
+    async def _wait_healthy(self, shard: int) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + HEALTH_TIMEOUT_S
+        while loop.time() < deadline:
+            if self._procs[shard].poll() is not None:
+                return False
+            try:
+                r = await self._client.get(self.url(shard) + "/healthz")
+                if r.status_code == 200:
+                    return True
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+        return False
+
+    async def _set_live(self, live: List[int]):
+        live = sorted(live)
+        if live == self.live:
+            return
+        self.live = live
+        if self.on_change is not None:
+            try:
+                await self.on_change(list(live))
+            except Exception as e:
+                logger.warning(f"Rebalance notification failed: {e}")
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(MONITOR_INTERVAL_S)
+            for shard, proc in list(self._procs.items()):
+                if proc.poll() is None or shard not in self.live:
+                    continue
+                logger.warning(f"Shard {shard} exited ({proc.returncode}), failing over")
+                await self._set_live([s for s in self.live if s != shard])
+                asyncio.create_task(self._restart(shard))
+
+    async def _restart(self, shard: int):
+        n = self._restarts[shard] = self._restarts.get(shard, 0) + 1
+        await asyncio.sleep(min(MAX_RESTART_BACKOFF_S, 0.5 * 2 ** (n - 1)))
+        self._spawn(shard)
+        if await self._wait_healthy(shard):
+            self._restarts[shard] = 0
+            await self._set_live(self.live + [shard])
+            logger.info(f"Shard {shard} back, rebalanced")
+        else:
+            self._procs[shard].kill()
+            asyncio.create_task(self._restart(shard))
@@ -31,6 +31,33 @@ class Settings(BaseSettings):
     server_host: str = "0.0.0.0"
     server_port: int = 8000
     
+    # Ingest admission control (in-flight requests per instance / per device)
+    ingest_max_inflight: int = 64
+    ingest_max_inflight_per_device: int = 8
+    ingest_retry_after_s: int = 1
+    
+    # NDJSON streams are persisted in batches of this size / at this interval
+    ingest_flush_records: int = 200
+    ingest_flush_interval_s: float = 1.0
+    
+    # Idempotency-Key on /ingest (client spool retries): keys kept in memory / in MongoDB (TTL)
+    ingest_idempotency_max_keys: int = 10000
+    ingest_idempotency_ttl_s: int = 86400
+    
+    # Catalog cache (techniques, parameter sets, feedback rules); 0 = no TTL
+    catalog_cache_ttl_s: float = 300.0
+    # Follow a MongoDB change stream to invalidate across instances (replica set only)
+    catalog_change_stream: bool = False
+    
+    # Sharded deployment (python -m app.cluster); CLUSTER_SHARD is set per worker
+    cluster_shard: Optional[int] = None
+    cluster_workers: int = 0  # 0 = one per CPU core
+    cluster_base_port: int = 8100  # shard i listens on 127.0.0.1:(base + i)
+    
+    # Live stream fan-out across instances: "memory" (single instance), "redis", "mongo" (replica set)
+    stream_backend: str = "memory"
+    stream_redis_url: str = "redis://localhost:6379/0"
+    
     @property
     def mongodb_uri(self) -> str:
         """Build MongoDB connection URI"""
@@ -93,6 +93,10 @@ async def create_indexes():
     await db.signals.create_index([("signal", 1), ("ts", -1)])
     await db.signals.create_index("ts")  # For time-range queries
     
+    # Ingest idempotency keys (expire after the retry horizon)
+    await db.ingest_keys.create_index("key", unique=True)
+    await db.ingest_keys.create_index("created_at", expireAfterSeconds=settings.ingest_idempotency_ttl_s)
+    
     # Technique indexes
     await db.techniques.create_index("name", unique=True)
     await db.techniques.create_index([("show_in_app", 1), ("is_active", 1)])
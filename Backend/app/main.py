@@ -2,6 +2,7 @@
 """FastAPI application main"""
 from __future__ import annotations
 
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
@@ -9,8 +10,11 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import settings
-from app.database import connect_to_mongo, close_mongo_connection
+from app.database import connect_to_mongo, close_mongo_connection, get_database
 from app.utils.logging import setup_logging
+from app.services.catalog_cache import catalog_cache
+from app.services.broadcast import create_backend
+from app.services.stream_manager import stream_manager
 from app.api.v1 import api_router
 
 # Setup logging
@@ -24,9 +28,16 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Serena Backend...")
     await connect_to_mongo()
+    await stream_manager.start(create_backend(
+        settings.stream_backend, redis_url=settings.stream_redis_url, db=await get_database(),
+    ))
+    catalog_watch = asyncio.create_task(catalog_cache.watch()) if settings.catalog_change_stream else None
     yield
     # Shutdown
     logger.info("Shutting down Serena Backend...")
+    if catalog_watch is not None:
+        catalog_watch.cancel()
+    await stream_manager.stop()
     await close_mongo_connection()
 
 
@@ -52,6 +63,11 @@ logger.info("CORS allowed origins: %s", cors_list)
 # Include API routes
 app.include_router(api_router)
 
+# Shard worker behind the cluster router: accept cross-shard notifications
+if settings.cluster_shard is not None:
+    from app.cluster import internal as cluster_internal
+    app.include_router(cluster_internal.router)
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -40,6 +40,8 @@ class SignalResponse(BaseModel):
     breath_cycle: Optional[Dict[str, Union[int, float]]] = None
     technique: Optional[str] = None
     active_param_version: Optional[str] = None
+    quality: Optional[float] = None
+    reason: Optional[str] = None
     
     class Config:
         populate_by_name = True
@@ -49,3 +51,6 @@ class IngestResponse(BaseModel):
     """Response model for ingest endpoint"""
     accepted: int = Field(..., description="Number of records accepted")
     session_id: Optional[str] = Field(None, description="Active session ID if applicable")
+    shed: int = Field(0, description="Number of records dropped by load shedding")
+    stream_id: Optional[str] = Field(None, description="NDJSON stream id for progress acks (GET /ingest/streams/{id})")
+    duplicate: bool = Field(False, description="Idempotency-Key seen before; stored response returned, nothing ingested")
@@ -23,6 +23,7 @@ class SignalRecord:
     SIGNAL_RESP_RR = "resp_rr"
     SIGNAL_GUIDANCE = "guidance"
     SIGNAL_BREATH_TARGET = "BreathTarget"
+    SIGNAL_QUALITY = "signal_quality"
     
     def __init__(
         self,
@@ -51,6 +52,9 @@ class SignalRecord:
         breath_cycle: Optional[Dict[str, Union[int, float]]] = None,
         technique: Optional[str] = None,
         active_param_version: Optional[str] = None,
+        # Signal quality fields
+        quality: Optional[float] = None,
+        reason: Optional[str] = None,
         # Metadata
         created_at: Optional[datetime] = None,
         _id: Optional[ObjectId] = None,
@@ -79,6 +83,8 @@ class SignalRecord:
         self.breath_cycle = breath_cycle
         self.technique = technique
         self.active_param_version = active_param_version
+        self.quality = quality
+        self.reason = reason
     
     def to_dict(self) -> dict:
         """Convert to dictionary for MongoDB"""
@@ -123,6 +129,10 @@ class SignalRecord:
             doc["technique"] = self.technique
         if self.active_param_version is not None:
             doc["active_param_version"] = self.active_param_version
+        if self.quality is not None:
+            doc["quality"] = self.quality
+        if self.reason is not None:
+            doc["reason"] = self.reason
         
         return doc
     
@@ -151,5 +161,7 @@ class SignalRecord:
             breath_cycle=data.get("breath_cycle"),
             technique=data.get("technique"),
             active_param_version=data.get("active_param_version"),
+            quality=data.get("quality"),
+            reason=data.get("reason"),
             created_at=data.get("created_at"),
         )
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Admission control and load shedding for ingest work"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Iterable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Signals that control the session or mark events; these are never shed
+PRIORITY_SIGNALS = frozenset({"BreathTarget", "marker"})
+
+
+class AdmissionController:
+    """
+    Counts in-flight ingest requests globally and per device.
+
+    Sheddable work (ECG) is only admitted while both budgets have room;
+    priority work is always admitted but still counted, so it pushes
+    ECG out first when the service is busy.
+
+    Background RR estimation is not part of these budgets (a batch of ECG
+    records would otherwise exhaust its own device budget). It runs as one
+    worker per session with at most one pending job: a job queued while
+    another is pending replaces it ("estimate latest"), so a busy session
+    sheds estimation steps but never the samples (those are buffered on
+    arrival, before the job is queued).
+    """
+
+    def __init__(self, max_inflight: int, max_per_device: int, retry_after_s: int = 1):
+        self.max_inflight = max_inflight
+        self.max_per_device = max_per_device
+        self.retry_after_s = retry_after_s
+        self._inflight = 0
+        self._per_device: Dict[str, int] = defaultdict(int)
+        self._released = asyncio.Event()
+        self._pending: Dict[str, Callable[[], Awaitable]] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self.shed = 0
+        self.shed_background = 0
+
+    @staticmethod
+    def is_priority(signals: Iterable[str]) -> bool:
+        return any(s in PRIORITY_SIGNALS for s in signals)
+
+    def saturated(self, device_id: str) -> bool:
+        return (self._inflight >= self.max_inflight
+                or self._per_device.get(device_id, 0) >= self.max_per_device)
+
+    async def wait_for_capacity(self, device_id: str, timeout: float) -> bool:
+        """Wait until the device is below budget (woken by `release`); False on timeout."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.saturated(device_id):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._released.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def try_acquire(self, device_id: str, priority: bool = False) -> bool:
+        """Reserve one unit of work; False (and counted as shed) when over budget."""
+        if not priority and self.saturated(device_id):
+            self.shed += 1
+            return False
+        self._inflight += 1
+        self._per_device[device_id] += 1
+        return True
+
+    def release(self, device_id: str):
+        self._inflight = max(0, self._inflight - 1)
+        n = self._per_device.get(device_id, 0) - 1
+        if n > 0:
+            self._per_device[device_id] = n
+        else:
+            self._per_device.pop(device_id, None)
+        # Wake every waiter; each re-checks its own budget (fresh event for the next round)
+        self._released.set()
+        self._released = asyncio.Event()
+
+    def spawn(self, job: Callable[[], Awaitable], key: str):
+        """Queue background work (a coroutine factory) for `key`, e.g. a session; replaces a pending job."""
+        if key in self._pending:
+            self.shed_background += 1
+        self._pending[key] = job
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._drain(key))
+
+    async def _drain(self, key: str):
+        try:
+            while key in self._pending:
+                job = self._pending.pop(key)
+                try:
+                    await job()
+                except Exception:
+                    logger.exception(f"Background work for {key} failed")
+        finally:
+            self._workers.pop(key, None)
+            if self._pending.pop(key, None) is not None:
+                # Cancelled with a job pending: it is dropped
+                self.shed_background += 1
+
+    def stats(self) -> dict:
+        return {
+            "inflight": self._inflight,
+            "max_inflight": self.max_inflight,
+            "max_per_device": self.max_per_device,
+            "shed": self.shed,
+            "background_workers": len(self._workers),
+            "background_pending": len(self._pending),
+            "background_shed": self.shed_background,
+        }
+
+
+# Global admission controller for /ingest
+admission = AdmissionController(
+    max_inflight=settings.ingest_max_inflight,
+    max_per_device=settings.ingest_max_inflight_per_device,
+    retry_after_s=settings.ingest_retry_after_s,
+)
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Broadcast backends for StreamManager (cross-instance pub/sub).
+
+StreamManager always delivers to its own subscribers directly; a backend
+only carries batches to *other* instances. One upstream subscription is
+held per device with local subscribers (ALL = every device, for
+device_id=UNKNOWN streams), however many SSE/WebSocket clients share it.
+
+- MemoryBackend:  single instance, nothing leaves the process (default)
+- LocalBroker:    in-process stand-in for a broker, for tests and for
+                  several StreamManagers in one process
+- RedisBackend:   Redis PUBLISH/SUBSCRIBE, channel per device
+- MongoBackend:   capped collection + change stream (replica set)
+"""
+from __future__ import annotations
+
+import abc
+import asyncio
+import json
+import logging
+import uuid
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from app.utils.ecg_binary import json_default
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:  # pragma: no cover - optional dependency
+    aioredis = None
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Upstream subscription for every device
+ALL = "*"
+CHANNEL_PREFIX = "serena:stream:"
+
+# on_message(device_id, items) -> None; called on the event loop
+MessageHandler = Callable[[str, List[dict]], None]
+
+
+def encode_batch(origin: str, device_id: str, items: List[dict]) -> bytes:
+    """Wire format of one published batch (ObjectId/datetime as strings, ndarray samples as lists)"""
+    return json.dumps(
+        {"o": origin, "d": device_id, "m": items}, ensure_ascii=False, default=json_default
+    ).encode("utf-8")
+
+
+def decode_batch(payload) -> Optional[dict]:
+    try:
+        msg = json.loads(payload)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(msg, dict) or not isinstance(msg.get("m"), list):
+        return None
+    return msg
+
+
+class BroadcastBackend(abc.ABC):
+    """
+    Base class of the backends. `remote = False` tells StreamManager to skip publishing
+    altogether (no queue, no encoding), so a single instance pays nothing.
+    """
+
+    remote = True
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self._on_message: Optional[MessageHandler] = None
+
+    async def start(self, on_message: MessageHandler):
+        self._on_message = on_message
+
+    async def stop(self):
+        pass
+
+    @abc.abstractmethod
+    async def publish(self, device_id: str, items: List[dict]):
+        """Send one batch of records of a device to the other instances"""
+
+    @abc.abstractmethod
+    async def subscribe(self, device_id: str):
+        """Start receiving a device (or ALL) from other instances"""
+
+    @abc.abstractmethod
+    async def unsubscribe(self, device_id: str):
+        """Stop receiving a device (or ALL)"""
+
+    def _dispatch(self, payload):
+        msg = decode_batch(payload)
+        if msg is None:
+            logger.warning("Dropping malformed broadcast batch")
+            return
+        if msg.get("o") == self.origin or self._on_message is None:
+            return  # own publish echoed back; local subscribers already have it
+        self._on_message(str(msg.get("d") or "UNKNOWN"), msg["m"])
+
+
+class MemoryBackend(BroadcastBackend):
+    """Single instance: local delivery only"""
+
+    remote = False
+
+    async def publish(self, device_id: str, items: List[dict]):
+        pass
+
+    async def subscribe(self, device_id: str):
+        pass
+
+    async def unsubscribe(self, device_id: str):
+        pass
+
+
+class LocalBroker:
+    """
+    In-process broker with Redis pub/sub semantics (channel per device,
+    ALL receives every channel, payloads are bytes). Stands in for Redis
+    when several StreamManagers share one process.
+    """
+
+    def __init__(self):
+        self._subs: Dict[str, Set["LocalBrokerBackend"]] = defaultdict(set)
+        self.published = 0
+
+    def publish(self, device_id: str, payload: bytes) -> int:
+        self.published += 1
+        receivers = self._subs.get(device_id, set()) | self._subs.get(ALL, set())
+        for backend in receivers:
+            backend._dispatch(payload)
+        return len(receivers)
+
+    def subscribe(self, backend: "LocalBrokerBackend", device_id: str):
+        self._subs[device_id].add(backend)
+
+    def unsubscribe(self, backend: "LocalBrokerBackend", device_id: Optional[str] = None):
+        for key in ([device_id] if device_id is not None else list(self._subs)):
+            self._subs.get(key, set()).discard(backend)
+
+
+class LocalBrokerBackend(BroadcastBackend):
+    def __init__(self, broker: LocalBroker):
+        super().__init__()
+        self.broker = broker
+
+    async def stop(self):
+        self.broker.unsubscribe(self)
+
+    async def publish(self, device_id: str, items: List[dict]):
+        self.broker.publish(device_id, encode_batch(self.origin, device_id, items))
+
+    async def subscribe(self, device_id: str):
+        self.broker.subscribe(self, device_id)
+
+    async def unsubscribe(self, device_id: str):
+        self.broker.unsubscribe(self, device_id)
+
+    def _dispatch(self, payload):
+        # A real broker delivers on a later loop iteration, not inside publish()
+        asyncio.get_running_loop().call_soon(super()._dispatch, payload)
+
+
+class RedisBackend(BroadcastBackend):
+    """Redis pub/sub: PUBLISH per device channel, one PSUBSCRIBE for ALL"""
+
+    def __init__(self, url: str):
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("STREAM_BACKEND=redis requires the 'redis' package")
+        super().__init__()
+        self.url = url
+        self._redis = None
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+        self._all = False
+
+    async def start(self, on_message: MessageHandler):
+        await super().start(on_message)
+        self._redis = aioredis.from_url(self.url)
+        self._pubsub = self._redis.pubsub()
+        self._reader = asyncio.create_task(self._read())
+        logger.info(f"Stream broadcast via Redis {self.url}")
+
+    async def stop(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    async def publish(self, device_id: str, items: List[dict]):
+        await self._redis.publish(CHANNEL_PREFIX + device_id, encode_batch(self.origin, device_id, items))
+
+    async def subscribe(self, device_id: str):
+        if device_id == ALL:
+            self._all = True
+            await self._pubsub.psubscribe(CHANNEL_PREFIX + ALL)
+        else:
+            await self._pubsub.subscribe(CHANNEL_PREFIX + device_id)
+
+    async def unsubscribe(self, device_id: str):
+        if device_id == ALL:
+            self._all = False
+            await self._pubsub.punsubscribe(CHANNEL_PREFIX + ALL)
+        else:
+            await self._pubsub.unsubscribe(CHANNEL_PREFIX + device_id)
+
+    async def _read(self):
+        while True:
+            try:
+                if not self._pubsub.subscribed:
+                    await asyncio.sleep(0.1)
+                    continue
+                msg = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Redis broadcast read failed, retrying: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            if msg is None:
+                continue
+            # With ALL active a device channel arrives twice (message + pmessage)
+            if msg["type"] == "message" and self._all:
+                continue
+            self._dispatch(msg["data"])
+
+
+class MongoBackend(BroadcastBackend):
+    """
+    Batches are inserted into a capped collection; every instance follows
+    it with one change stream and filters on its subscribed devices
+    locally (changing the $match would mean reopening the stream).
+    Needs a replica set; otherwise this instance stays local-only.
+    """
+
+    def __init__(self, db, collection: str = "stream_events", size_bytes: int = 16 * 1024 * 1024):
+        super().__init__()
+        self.db = db
+        self.collection = collection
+        self.size_bytes = size_bytes
+        self._devices: Set[str] = set()
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self, on_message: MessageHandler):
+        await super().start(on_message)
+        if self.collection not in await self.db.list_collection_names():
+            try:
+                await self.db.create_collection(self.collection, capped=True, size=self.size_bytes)
+            except Exception as e:
+                # Created concurrently by another instance
+                logger.debug(f"create_collection {self.collection}: {e}")
+        self._reader = asyncio.create_task(self._read())
+
+    async def stop(self):
+        if self._reader is not None:
+            self._reader.cancel()
+
+    async def publish(self, device_id: str, items: List[dict]):
+        await self.db[self.collection].insert_one(
+            {"o": self.origin, "d": device_id, "b": encode_batch(self.origin, device_id, items)}
+        )
+
+    async def subscribe(self, device_id: str):
+        self._devices.add(device_id)
+
+    async def unsubscribe(self, device_id: str):
+        self._devices.discard(device_id)
+
+    async def _read(self):
+        pipeline = [{"$match": {"operationType": "insert", "fullDocument.o": {"$ne": self.origin}}}]
+        while True:
+            try:
+                async with self.db[self.collection].watch(pipeline) as stream:
+                    logger.info("Stream broadcast following MongoDB change stream")
+                    async for change in stream:
+                        doc = change.get("fullDocument") or {}
+                        if ALL in self._devices or doc.get("d") in self._devices:
+                            self._dispatch(doc.get("b"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if "replica set" in str(e).lower() or getattr(e, "code", None) == 40573:
+                    logger.warning(f"Stream change stream not available, broadcasting locally only: {e}")
+                    return
+                logger.warning(f"Stream change stream interrupted, resuming: {e}")
+                await asyncio.sleep(1.0)
+
+
+def create_backend(kind: str, **options: Any) -> BroadcastBackend:
+    """Backend for settings.stream_backend ("memory", "redis", "mongo", "local")"""
+    kind = (kind or "memory").lower()
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "redis":
+        return RedisBackend(options["redis_url"])
+    if kind == "mongo":
+        return MongoBackend(options["db"])
+    if kind == "local":
+        return LocalBrokerBackend(options.get("broker") or local_broker)
+    raise ValueError(f"Unknown stream backend: {kind}")
+
+
+# Process-wide broker for the "local" backend
+local_broker = LocalBroker()
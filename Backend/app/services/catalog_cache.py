@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""In-process read-through cache for the small catalog collections"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.database import get_database
+
+logger = logging.getLogger(__name__)
+
+# Collections served from memory (a few dozen documents each)
+CATALOG_COLLECTIONS = ("techniques", "parameter_sets", "feedback_rules")
+
+
+class CatalogCache:
+    """
+    Loads a catalog collection once and serves it from memory.
+
+    Write endpoints call `invalidate(collection)` so edits are visible on the next
+    read. `settings.catalog_cache_ttl_s` bounds staleness for out-of-band
+    writes (seed scripts, other instances); `watch()` follows a MongoDB
+    change stream for immediate invalidation across instances.
+
+    Every invalidation bumps a generation counter; a load that was in flight
+    while its collection was invalidated is not cached (it may predate the
+    write) and is repeated.
+
+    Returned documents are shared; callers must not mutate them.
+    """
+
+    def __init__(self, ttl_s: float = 0.0):
+        self.ttl_s = ttl_s
+        self._entries: Dict[str, Tuple[List[dict], str, float]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0  # bumped by invalidate() of everything
+
+    async def get(self, collection: str) -> List[dict]:
+        """All documents of a catalog collection"""
+        return (await self._entry(collection))[0]
+
+    async def etag(self, collection: str) -> str:
+        """Content-based ETag (same value on every instance for the same data)"""
+        return (await self._entry(collection))[1]
+
+    async def find_one(self, collection: str, **match) -> Optional[dict]:
+        """First cached document whose fields equal `match` (no match -> None)"""
+        for doc in await self.get(collection):
+            if all(doc.get(k) == v for k, v in match.items()):
+                return doc
+        return None
+
+    def invalidate(self, collection: Optional[str] = None):
+        """Drop one collection (or everything); the next read reloads it"""
+        if collection is None:
+            self._epoch += 1
+            self._entries.clear()
+        else:
+            self._generations[collection] = self._generations.get(collection, 0) + 1
+            self._entries.pop(collection, None)
+
+    async def _entry(self, name: str) -> Tuple[List[dict], str, float]:
+        entry = self._entries.get(name)
+        if entry is not None and not self._expired(entry):
+            return entry
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(name)
+            while entry is None or self._expired(entry):
+                generation = self._generation(name)
+                loaded = await self._load(name)
+                if self._generation(name) == generation:
+                    entry = self._entries[name] = loaded
+                # else: invalidated during the load, read again
+        return entry
+
+    def _generation(self, name: str) -> Tuple[int, int]:
+        return self._epoch, self._generations.get(name, 0)
+
+    def _expired(self, entry) -> bool:
+        return self.ttl_s > 0 and time.monotonic() - entry[2] >= self.ttl_s
+
+    async def _load(self, name: str) -> Tuple[List[dict], str, float]:
+        db = await get_database()
+        docs = await db[name].find({}).to_list(length=None)
+        digest = hashlib.sha1(
+            json.dumps(docs, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()[:16]
+        logger.debug(f"Catalog '{name}' loaded: {len(docs)} docs")
+        return docs, f'W/"{name}-{digest}"', time.monotonic()
+
+    async def watch(self):
+        """
+        Invalidate on changes made by any instance (MongoDB change stream).
+        Needs a replica set; on a standalone server this logs and returns,
+        leaving the TTL as the only cross-instance bound.
+        """
+        db = await get_database()
+        pipeline = [{"$match": {"ns.coll": {"$in": list(CATALOG_COLLECTIONS)}}}]
+        while True:
+            try:
+                async with db.watch(pipeline) as stream:
+                    logger.info("Catalog cache following change stream")
+                    async for change in stream:
+                        self.invalidate(change.get("ns", {}).get("coll"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if "replica set" in str(e).lower() or getattr(e, "code", None) == 40573:
+                    logger.warning(f"Catalog change stream not available: {e}")
+                    return
+                logger.warning(f"Catalog change stream interrupted, resuming: {e}")
+                self.invalidate()
+                await asyncio.sleep(5.0)
+
+
+# Global catalog cache
+catalog_cache = CatalogCache(ttl_s=settings.catalog_cache_ttl_s)
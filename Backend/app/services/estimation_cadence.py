@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Adaptive RR estimation cadence per session"""
+from __future__ import annotations
+
+from typing import Optional, Sequence
+
+import numpy as np
+
+# Stride = number of ECG packets per estimate (1 = every packet)
+MAX_STRIDE = 4
+STABLE_BEATS = 8          # recent est_rr values considered
+STABLE_SPREAD_BPM = 0.5   # max-min of those values to count as stable
+GREEN_CATEGORY = "green"
+
+
+class EstimationCadence:
+    """
+    Decides per ECG packet whether a full estimate is due.
+
+    While recent estimates are stable and feedback is green the stride grows
+    one packet per estimate up to MAX_STRIDE. Anything that matters for the
+    user (target change, quality change, feedback category change, unstable
+    estimates) drops it back to 1 and makes the next packet due.
+    Skipped packets stay in the buffer, so their beats are emitted by the
+    next estimate.
+    """
+
+    def __init__(self):
+        self.stride = 1
+        self._pending = 0
+        self._category: Optional[str] = None
+
+    def due(self) -> bool:
+        """Count an incoming packet; True when an estimate should run for it."""
+        self._pending += 1
+        if self._pending >= self.stride:
+            self._pending = 0
+            return True
+        return False
+
+    def boost(self):
+        """Return to per-packet estimation, starting with the next packet."""
+        self.stride = 1
+        self._pending = 0
+
+    def record(self, est_rr: Sequence[float], category: Optional[str]):
+        """Adapt the stride after an estimate."""
+        if category != self._category:
+            self._category = category
+            self.boost()
+            return
+
+        recent = np.asarray(est_rr[-STABLE_BEATS:], dtype=float)
+        recent = recent[np.isfinite(recent)]
+        stable = recent.size >= STABLE_BEATS // 2 and np.ptp(recent) <= STABLE_SPREAD_BPM
+
+        if stable and category == GREEN_CATEGORY:
+            self.stride = min(MAX_STRIDE, self.stride + 1)
+        else:
+            self.boost()
@@ -2,52 +2,121 @@
 """Feedback generator service"""
 from __future__ import annotations
 
+import bisect
 import logging
 import random
 import time
-from typing import Dict, Any, Tuple, Optional
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Any, List, Mapping, Sequence, Tuple, Optional
 
-from app.database import get_database
 from app.schemas.feedback_rules import FeedbackRules
+from app.services.catalog_cache import catalog_cache
 
 logger = logging.getLogger(__name__)
 
+WAITING = ("Wachten...", "", "")
+
+
+@dataclass(frozen=True)
+class MessagePool:
+    """Messages of one category with cumulative weights for weighted picks"""
+    messages: Tuple[dict, ...]
+    cum_weights: Tuple[float, ...]
+
+    @classmethod
+    def from_messages(cls, messages: Sequence[dict]) -> "MessagePool":
+        msgs = tuple(m for m in messages or () if isinstance(m, dict))
+        total = 0.0
+        cum = []
+        for m in msgs:
+            total += max(0.0, float(m.get("weight", 1) or 0))
+            cum.append(total)
+        return cls(msgs, tuple(cum))
+
+    def pick(self, rng: random.Random) -> Optional[dict]:
+        if not self.messages or self.cum_weights[-1] <= 0:
+            return None
+        x = rng.random() * self.cum_weights[-1]
+        return self.messages[bisect.bisect_right(self.cum_weights, x)]
+
+
+@dataclass(frozen=True)
+class CompiledFeedbackRules:
+    """Feedback rules resolved once: float thresholds, settings and message pools"""
+    blue_sec: float
+    green_pct: float
+    orange_pct: float
+    stability_duration: float
+    repeat_interval: float
+    visual_interval: float
+    pools: Mapping[str, MessagePool]
+
+    @classmethod
+    def from_rules(cls, rules: Dict[str, Any]) -> "CompiledFeedbackRules":
+        settings = rules.get("settings", {})
+        return cls(
+            blue_sec=float(rules.get("blue", {}).get("threshold_sec", 30.0)),
+            green_pct=float(rules.get("green", {}).get("threshold_pct", 5)),
+            orange_pct=float(rules.get("orange", {}).get("threshold_pct", 15)),
+            stability_duration=float(settings.get("stability_duration", 3.0)),
+            repeat_interval=float(settings.get("repeat_interval", 7.0)),
+            visual_interval=float(settings.get("visual_interval", 7.0)),
+            pools=MappingProxyType({
+                name: MessagePool.from_messages(cat.get("messages"))
+                for name, cat in rules.items()
+                if isinstance(cat, dict) and "messages" in cat
+            }),
+        )
+
+    def classify(self, elapsed: float, target_rr: float, actual_rr: float) -> Tuple[str, str]:
+        """(category, color) for one beat"""
+        if elapsed < self.blue_sec:
+            return "blue", "accent"
+        diff = actual_rr - target_rr
+        pct = (abs(diff) / target_rr) * 100.0
+        if pct <= self.green_pct:
+            return "green", "ok"
+        if pct <= self.orange_pct:
+            return "orange", "warn"
+        return ("red_fast" if diff > 0 else "red_slow"), "bad"
+
+    def pick(self, category: str, rng: random.Random) -> Optional[dict]:
+        pool = self.pools.get(category)
+        return pool.pick(rng) if pool else None
+
 
 class FeedbackGenerator:
     """Generates feedback based on target vs actual respiratory rate"""
     
     def __init__(self):
-        self._rules_cache: Optional[Dict[str, Any]] = None
-        self._cache_ts = 0.0
-        self._cache_ttl = 60.0  # Cache for 60 seconds
+        # Compiled rules and the rules dict they were built from
+        self._compiled: Optional[CompiledFeedbackRules] = None
+        self._compiled_from: Optional[Dict[str, Any]] = None
+        self._default_rules = FeedbackRules().rules
         
         # State tracking per session
         self._session_state: Dict[str, Dict[str, Any]] = {}
     
     async def _load_rules(self) -> Dict[str, Any]:
-        """Load feedback rules from database (with caching)"""
-        now = time.time()
-        
-        if self._rules_cache and (now - self._cache_ts) < self._cache_ttl:
-            return self._rules_cache
-        
+        """Load feedback rules (catalog cache; edits are picked up on the next call)"""
         try:
-            db = await get_database()
-            rules_doc = await db.feedback_rules.find_one({})
-            
-            if rules_doc:
-                feedback_rules = FeedbackRules.from_dict(rules_doc)
-                self._rules_cache = feedback_rules.rules
-                self._cache_ts = now
-                return self._rules_cache
+            rules_doc = await catalog_cache.find_one("feedback_rules")
+            if rules_doc and rules_doc.get("rules"):
+                return rules_doc["rules"]
         except Exception as e:
             logger.error(f"Error loading feedback rules: {e}")
         
         # Return default rules
-        feedback_rules = FeedbackRules()
-        self._rules_cache = feedback_rules.rules
-        self._cache_ts = now
-        return self._rules_cache
+        return self._default_rules
+    
+    async def _load_compiled(self) -> CompiledFeedbackRules:
+        """Compiled rules; recompiled only when the cached rules document changes"""
+        rules = await self._load_rules()
+        if rules is not self._compiled_from:
+            self._compiled = CompiledFeedbackRules.from_rules(rules)
+            self._compiled_from = rules
+        return self._compiled
     
     def _get_session_state(self, session_id: str) -> Dict[str, Any]:
         """Get or create session state"""
@@ -62,19 +131,39 @@ class FeedbackGenerator:
                 "last_spoken_ts": 0.0,
                 "cached_text": "Wachten...",
                 "cached_color": "",
+                # Seeded per session: same beats give the same messages (replays)
+                "rng": random.Random(session_id),
             }
         return self._session_state[session_id]
     
-    async def get_feedback(self, session_id: str, target_rr: float, actual_rr: float) -> Tuple[str, str, str]:
+    async def get_feedback(self, session_id: str, target_rr: float, actual_rr: float,
+                           ts_ms: Optional[float] = None) -> Tuple[str, str, str]:
         """
         Returns: (visual_text, audio_text, color_code)
+        Time base is the beat timestamp `ts_ms` (wall clock when omitted).
         """
-        if not target_rr or target_rr <= 0 or not actual_rr or actual_rr <= 0:
-            return "Wachten...", "", ""
-        
-        rules = await self._load_rules()
+        if ts_ms is None:
+            ts_ms = time.time() * 1000.0
+        return (await self.evaluate_beats(session_id, target_rr, [(ts_ms, actual_rr)]))[0]
+    
+    async def evaluate_beats(self, session_id: str, target_rr: float,
+                             beats: Sequence[Tuple[float, float]]) -> List[Tuple[str, str, str]]:
+        """
+        Feedback for all new beats of one estimate in order.
+        beats: (ts_ms, actual_rr) per beat; returns (visual_text, audio_text, color_code) per beat.
+        """
+        if not target_rr or target_rr <= 0:
+            return [WAITING] * len(beats)
+        rules = await self._load_compiled()
         state = self._get_session_state(session_id)
-        now = time.time()
+        return [self._evaluate(rules, state, ts_ms / 1000.0, target_rr, actual_rr)
+                for ts_ms, actual_rr in beats]
+    
+    def _evaluate(self, rules: CompiledFeedbackRules, state: Dict[str, Any], now: float,
+                  target_rr: float, actual_rr: float) -> Tuple[str, str, str]:
+        """One beat at time `now` (seconds)"""
+        if not actual_rr or actual_rr <= 0:
+            return WAITING
         
         # Reset bij nieuwe sessie
         if target_rr != state["last_target_rr"]:
@@ -85,57 +174,29 @@ class FeedbackGenerator:
             state["pending_ts"] = now
         
         # Bepaal huidige categorie
-        blue_limit = rules.get("blue", {}).get("threshold_sec", 30.0)
-        elapsed = now - state["target_change_ts"]
-        
-        current_raw_category = ""
-        current_color = ""
-        
-        if elapsed < blue_limit:
-            current_raw_category = "blue"
-            current_color = "accent"
-        else:
-            diff = actual_rr - target_rr
-            pct = (abs(diff) / target_rr) * 100.0
-            
-            green_lim = rules.get("green", {}).get("threshold_pct", 5)
-            orange_lim = rules.get("orange", {}).get("threshold_pct", 15)
-            
-            if pct <= green_lim:
-                current_raw_category = "green"
-                current_color = "ok"
-            elif pct <= orange_lim:
-                current_raw_category = "orange"
-                current_color = "warn"
-            else:
-                current_color = "bad"
-                current_raw_category = "red_fast" if diff > 0 else "red_slow"
+        current_raw_category, current_color = rules.classify(
+            now - state["target_change_ts"], target_rr, actual_rr
+        )
         
         # Stabiliteit & Audio logica
         if current_raw_category != state["pending_category"]:
             state["pending_category"] = current_raw_category
             state["pending_ts"] = now
         
-        stability_time = now - state["pending_ts"]
-        settings = rules.get("settings", {})
-        stability_duration = settings.get("stability_duration", 3.0)
-        repeat_interval = settings.get("repeat_interval", 7.0)
-        visual_interval = settings.get("visual_interval", 7.0)
-        
-        is_stable = stability_time >= stability_duration
+        is_stable = (now - state["pending_ts"]) >= rules.stability_duration
         should_speak = False
         
         if is_stable:
             if state["pending_category"] != state["last_spoken_category"]:
                 should_speak = True
-            elif (now - state["last_spoken_ts"]) > repeat_interval:
+            elif (now - state["last_spoken_ts"]) > rules.repeat_interval:
                 should_speak = True
         
         audio_text = ""
         visual_text = state["cached_text"]
         
         if should_speak:
-            msg_obj = self._pick_message(rules, state["pending_category"])
+            msg_obj = rules.pick(state["pending_category"], state["rng"])
             if msg_obj:
                 visual_text = msg_obj.get("text", "")
                 audio_text = msg_obj.get("audio_text", visual_text)
@@ -143,8 +204,8 @@ class FeedbackGenerator:
                 state["last_visual_ts"] = now
                 state["last_spoken_category"] = state["pending_category"]
                 state["cached_text"] = visual_text
-        elif (now - state["last_visual_ts"]) > visual_interval:
-            msg_obj = self._pick_message(rules, current_raw_category)
+        elif (now - state["last_visual_ts"]) > rules.visual_interval:
+            msg_obj = rules.pick(current_raw_category, state["rng"])
             if msg_obj:
                 visual_text = msg_obj.get("text", "")
                 state["last_visual_ts"] = now
@@ -154,15 +215,10 @@ class FeedbackGenerator:
         
         return visual_text, audio_text, current_color
     
-    def _pick_message(self, rules: Dict[str, Any], category: str) -> dict:
-        """Pick a random message from category based on weights"""
-        cat_data = rules.get(category)
-        if not cat_data or "messages" not in cat_data or not cat_data["messages"]:
-            return {}
-        msgs = cat_data["messages"]
-        weights = [m.get("weight", 1) for m in msgs]
-        if not msgs: return {}
-        return random.choices(msgs, weights=weights, k=1)[0]
+    def current_category(self, session_id: str) -> Optional[str]:
+        """Feedback category of the last evaluated beat (blue/green/orange/red_fast/red_slow)"""
+        state = self._session_state.get(session_id)
+        return state["pending_category"] if state else None
     
     def clear_session_state(self, session_id: str):
         """Clear state for a session"""
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Idempotency keys for retried ingest uploads"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyRegistry:
+    """
+    Remembers the response per Idempotency-Key so a batch that a client
+    resends (timeout, spool replay after reconnect) is not ingested twice.
+
+    Recent keys are kept in memory; completed keys are also stored in the
+    `ingest_keys` collection (TTL index) so duplicates are caught across
+    restarts. A duplicate that arrives while the original request is still
+    being processed waits for it. Failed requests are not remembered.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._done: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Event] = {}
+        self.duplicates = 0
+
+    async def begin(self, key: str, db) -> Optional[Dict[str, Any]]:
+        """Stored response for a duplicate, or None (key is now in progress)"""
+        while key in self._pending:
+            await self._pending[key].wait()
+        hit = self._done.get(key)
+        if hit is None:
+            try:
+                doc = await db.ingest_keys.find_one({"key": key})
+            except Exception as e:
+                logger.warning(f"Idempotency lookup failed for {key}: {e}")
+                doc = None
+            if doc is not None:
+                hit = doc.get("response") or {}
+                self._remember(key, hit)
+        if hit is not None:
+            self.duplicates += 1
+            return hit
+        self._pending[key] = asyncio.Event()
+        return None
+
+    async def finish(self, key: str, db, response: Optional[Dict[str, Any]]):
+        """Store the response of a successful request (None = failed, may be retried)"""
+        try:
+            if response is not None:
+                self._remember(key, response)
+                try:
+                    await db.ingest_keys.update_one(
+                        {"key": key},
+                        {"$setOnInsert": {"key": key, "response": response, "created_at": datetime.utcnow()}},
+                        upsert=True,
+                    )
+                except Exception as e:
+                    logger.warning(f"Idempotency store failed for {key}: {e}")
+        finally:
+            event = self._pending.pop(key, None)
+            if event is not None:
+                event.set()
+
+    def _remember(self, key: str, response: Dict[str, Any]):
+        self._done[key] = response
+        self._done.move_to_end(key)
+        while len(self._done) > self.max_keys:
+            self._done.popitem(last=False)
+
+
+# Global idempotency registry
+idempotency = IdempotencyRegistry(max_keys=settings.ingest_idempotency_max_keys)
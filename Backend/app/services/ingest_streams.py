@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Progress registry for long-lived NDJSON ingest streams"""
+from __future__ import annotations
+
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Finished streams kept for late ack queries
+MAX_CLOSED_STREAMS = 256
+
+
+class IngestStreamRegistry:
+    """
+    Tracks accepted/persisted counts per open upload so devices can poll acks.
+
+    Per device and signal the stream also keeps the highest persisted ts. A
+    client that reconnects with the same stream id (after a dropped upload)
+    resumes the stream: the marks at that moment are the replay point, and
+    records at or before them were stored by an earlier upload and are
+    skipped, so re-sending from the last ack (or from the start) does not
+    store them twice. Per device/signal the check ends at the first record
+    past the mark; live data (and a stream that never resumed) is never
+    filtered. Only streams still in the registry can be resumed (not after a
+    restart or once evicted).
+    """
+
+    def __init__(self):
+        self._streams: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def open(self, stream_id: Optional[str] = None) -> Dict[str, Any]:
+        """Register a stream (client-chosen id via X-Stream-Id, or a new one); a known id resumes"""
+        stream_id = (stream_id or "").strip()
+        state = self._streams.get(stream_id) if stream_id else None
+        if state is not None:
+            state["open"] = True
+            state["resumed"] += 1
+            state["replay"] = dict(state["persisted_ts"])
+            state["updated_at"] = time.time()
+        else:
+            stream_id = stream_id or str(uuid.uuid4())
+            state = {
+                "stream_id": stream_id,
+                "device_id": None,
+                "accepted": 0,
+                "persisted": 0,
+                "shed": 0,
+                "skipped": 0,
+                "resumed": 0,
+                "last_ts": None,
+                "persisted_ts": {},
+                "replay": {},
+                "open": True,
+                "started_at": time.time(),
+                "updated_at": time.time(),
+            }
+            self._streams[stream_id] = state
+        self._streams.move_to_end(stream_id)
+        self._trim()
+        return state
+
+    def persisted(self, state: Dict[str, Any], records: list):
+        """Record a successful batch insert"""
+        state["persisted"] += len(records)
+        if records:
+            state["device_id"] = records[-1].get("device_id", state["device_id"])
+            state["last_ts"] = records[-1].get("ts", state["last_ts"])
+        marks = state["persisted_ts"]
+        for r in records:
+            ts = r.get("ts")
+            key = _mark_key(r.get("device_id"), r.get("signal"))
+            if ts is not None and (key not in marks or ts > marks[key]):
+                marks[key] = ts
+        state["updated_at"] = time.time()
+
+    def already_persisted(self, state: Dict[str, Any], device_id: Optional[str],
+                          signal: Optional[str], ts: int) -> bool:
+        """True while replaying a resumed stream, for records an earlier upload already stored"""
+        replay = state["replay"]
+        if not replay:
+            return False
+        key = _mark_key(device_id, signal)
+        mark = replay.get(key)
+        if mark is None:
+            return False
+        if ts <= mark:
+            return True
+        # Past the resume point for this device/signal: live data from here on
+        del replay[key]
+        return False
+
+    def close(self, state: Dict[str, Any]):
+        state["open"] = False
+        state["updated_at"] = time.time()
+        self._trim()
+
+    def get(self, stream_id: str) -> Optional[Dict[str, Any]]:
+        return self._streams.get(stream_id)
+
+    def _trim(self):
+        closed = [sid for sid, s in self._streams.items() if not s["open"]]
+        for sid in closed[:max(0, len(closed) - MAX_CLOSED_STREAMS)]:
+            del self._streams[sid]
+
+
+def _mark_key(device_id: Optional[str], signal: Optional[str]) -> str:
+    return f"{device_id or 'UNKNOWN'}/{signal}"
+
+
+# Global stream registry
+ingest_streams = IngestStreamRegistry()
@@ -4,11 +4,15 @@ from __future__ import annotations
 
 import logging
 import numpy as np
-from typing import Dict, Any, Optional, List
+from typing import Callable, Dict, Any, Optional, List
 from datetime import datetime
 
 from app.database import get_database
 from app.algorithms.resp_rr_estimator import estimate_from_records
+from app.algorithms.breath_phase import BreathPhaseDetector
+from app.algorithms.signal_quality import QualityTracker
+from app.services.estimation_cadence import EstimationCadence
+from app.services.catalog_cache import catalog_cache
 from app.services.stream_manager import stream_manager
 from app.services.feedback_generator import feedback_generator
 from app.schemas.signal import SignalRecord
@@ -18,6 +22,7 @@ logger = logging.getLogger(__name__)
 # ECG sampling frequency (Hz)
 FS_ECG = 130.0
 START_THRESHOLD = 20  # Minimum buffer size before processing
+DEFAULT_BUFFER_SIZE = 200  # BUFFER_SIZE until the session's parameter set is loaded
 
 
 class SignalProcessor:
@@ -26,23 +31,60 @@ class SignalProcessor:
     def __init__(self):
         # ECG buffers per session: session_id -> list of ECG records
         self._ecg_buffers: Dict[str, List[dict]] = {}
+        # Online inhale/exhale detector per session: session_id -> detector
+        self._breath_detectors: Dict[str, BreathPhaseDetector] = {}
+        # Signal quality per session: session_id -> tracker
+        self._quality: Dict[str, QualityTracker] = {}
+        # Adaptive estimation cadence per session: session_id -> cadence
+        self._cadence: Dict[str, EstimationCadence] = {}
+        # BUFFER_SIZE of the session's parameter set (last lookup): session_id -> records
+        self._buffer_sizes: Dict[str, int] = {}
     
-    async def process_ecg_signal(
-        self,
-        ecg_record: Dict[str, Any],
-        session_id: str,
-        db
-    ):
-        """Process ECG signal and generate RR estimation"""
+    async def add_ecg(self, ecg_record: Dict[str, Any], session_id: str) -> bool:
+        """
+        Arrival step for every ECG packet (never shed): buffer, quality and cadence.
+        Returns True when an estimate is due; the estimate itself runs in the
+        background (`estimate`) and always works on the latest buffer.
+        """
+        # Get or create buffer for session
+        if session_id not in self._ecg_buffers:
+            self._ecg_buffers[session_id] = []
+        
+        buffer = self._ecg_buffers[session_id]
+        buffer.append(ecg_record)
+        # Trim before any early return (bad signal, cadence skip): bounded buffer
+        buffer = self._trim(session_id)
+        
+        print(f"[SignalProcessor] Buffer size for session {session_id}: {len(buffer)} (threshold: {START_THRESHOLD})", flush=True)
+        
+        # Cheap quality check on arrival; skip estimation on unusable windows
+        quality = self._quality.get(session_id)
+        if quality is None:
+            quality = self._quality[session_id] = QualityTracker()
+        cadence = self._cadence.get(session_id)
+        if cadence is None:
+            cadence = self._cadence[session_id] = EstimationCadence()
+        samples = ecg_record.get("samples")
+        quality.add_packet(samples if samples is not None else [])
+        if await self._emit_quality_change(quality, ecg_record, session_id):
+            cadence.boost()
+        if not quality.estimable:
+            print(f"[SignalProcessor] Skipping estimation, signal quality {quality.index:.2f} ({quality.reason})", flush=True)
+            return False
+        
+        # Skip this packet if the session is stable (its beats are covered by the next estimate)
+        return len(buffer) < START_THRESHOLD or cadence.due()
+    
+    async def estimate(self, session_id: str, db):
+        """Generate RR estimation from the session's current ECG buffer"""
         try:
-            # Get or create buffer for session
-            if session_id not in self._ecg_buffers:
-                self._ecg_buffers[session_id] = []
-            
-            buffer = self._ecg_buffers[session_id]
-            buffer.append(ecg_record)
-            
-            print(f"[SignalProcessor] Buffer size for session {session_id}: {len(buffer)} (threshold: {START_THRESHOLD})", flush=True)
+            buffer = self._ecg_buffers.get(session_id)
+            quality = self._quality.get(session_id)
+            cadence = self._cadence.get(session_id)
+            if not buffer or quality is None or cadence is None:
+                # Buffer cleared (session ended, rebalanced) before this estimate ran
+                return
+            ecg_record = buffer[-1]
             
             # Get session to determine buffer size and parameters
             session_doc = await db.sessions.find_one({"session_id": session_id})
@@ -53,7 +95,7 @@ class SignalProcessor:
             # Get parameter set for this session
             param_version = session_doc.get("param_version", "v1_default")
             print(f"[SignalProcessor] Looking for param_version: '{param_version}'", flush=True)
-            param_doc = await db.parameter_sets.find_one({"version": param_version})
+            param_doc = await catalog_cache.find_one("parameter_sets", version=param_version)
             
             if not param_doc:
                 print(f"[SignalProcessor] !! Parameter set '{param_version}' NOT FOUND, using defaults !!", flush=True)
@@ -64,12 +106,9 @@ class SignalProcessor:
                 params = param_set.to_params_dict()
                 print(f"[SignalProcessor] Loaded params: HEARTBEAT_WINDOW={params.get('HEARTBEAT_WINDOW')}, BPM_MIN={params.get('BPM_MIN')}, BPM_MAX={params.get('BPM_MAX')}", flush=True)
             
-            buffer_size = params.get("BUFFER_SIZE", 200)
-            
-            # Keep buffer size limited
-            if len(buffer) > buffer_size:
-                buffer = buffer[-buffer_size:]
-                self._ecg_buffers[session_id] = buffer
+            # Keep buffer size limited; remembered for the trim on arrival (also on skipped packets)
+            self._buffer_sizes[session_id] = int(params.get("BUFFER_SIZE", DEFAULT_BUFFER_SIZE))
+            buffer = self._trim(session_id)
             
             # Minimum buffer size before processing
             if len(buffer) < START_THRESHOLD:
@@ -79,15 +118,23 @@ class SignalProcessor:
             
             # Process ECG buffer
             try:
+                detector = self._breath_detectors.get(session_id)
+                if detector is None:
+                    detector = self._breath_detectors[session_id] = BreathPhaseDetector()
                 result = estimate_from_records(
                     list(buffer),
                     fs_hint=FS_ECG,
-                    params=params
+                    params=params,
+                    breath_detector=detector,
                 )
             except Exception as e:
                 logger.error(f"Error in RR estimation: {e}", exc_info=True)
                 return
             
+            quality.note_estimate(result.get("rr_ms") if result else None)
+            if await self._emit_quality_change(quality, ecg_record, session_id):
+                cadence.boost()
+            
             if not result:
                 print(f"[SignalProcessor] !! estimate_from_records returned EMPTY result !!", flush=True)
                 return
@@ -124,6 +171,8 @@ class SignalProcessor:
             if est_rr is not None and ts_per_beat is not None:
                 derived_signals: List[dict] = []
                 
+                # New beats of this estimate: (index, ts_ms, estRR)
+                beats = []
                 for i in range(len(est_rr)):
                     v = est_rr[i]
                     ts_val = ts_per_beat[i] if i < len(ts_per_beat) else None
@@ -134,19 +183,28 @@ class SignalProcessor:
                         continue
                     if ts_val <= last_emitted_ts:
                         continue
-                    
-                    ts_ms_int = int(ts_val)
+                    beats.append((i, int(ts_val), float(v)))
+                    last_emitted_ts = max(last_emitted_ts, int(ts_val))
+                
+                # Feedback for all new beats in one pass, on beat time
+                feedback = []
+                if target_rr > 0 and beats:
+                    feedback = await feedback_generator.evaluate_beats(
+                        session_id, target_rr, [(ts, v) for _, ts, v in beats]
+                    )
+                
+                for k, (i, ts_ms_int, v) in enumerate(beats):
                     dt = self._parse_dt_from_ts(ts_ms_int)
                     
                     # Create resp_rr signal
-                    print(f"[SignalProcessor] Creating resp_rr signal with estRR={float(v):.2f}", flush=True)
+                    print(f"[SignalProcessor] Creating resp_rr signal with estRR={v:.2f}", flush=True)
                     resp_rr_signal = SignalRecord(
                         device_id=ecg_record["device_id"],
                         signal="resp_rr",
                         ts=ts_ms_int,
                         dt=dt,
                         session_id=session_id,
-                        estRR=float(v),
+                        estRR=v,
                         tijd=str(tijd[i]) if tijd is not None and i < len(tijd) else "",
                         inhale=str(inhale[i]) if inhale is not None and i < len(inhale) else "",
                         exhale=str(exhale[i]) if exhale is not None and i < len(exhale) else "",
@@ -154,10 +212,8 @@ class SignalProcessor:
                     derived_signals.append(resp_rr_signal.to_dict())
                     
                     # Generate feedback
-                    if target_rr > 0:
-                        visual_text, audio_text, color = await feedback_generator.get_feedback(
-                            session_id, target_rr, float(v)
-                        )
+                    if feedback:
+                        visual_text, audio_text, color = feedback[k]
                         
                         if visual_text:
                             # Build instruction text if in accent phase
@@ -175,11 +231,9 @@ class SignalProcessor:
                                 audio_text=f"{audio_text}... {instruction}".strip() if instruction else audio_text,
                                 color=color,
                                 target=target_rr,
-                                actual=float(v),
+                                actual=v,
                             )
                             derived_signals.append(guidance_signal.to_dict())
-                    
-                    last_emitted_ts = max(last_emitted_ts, ts_ms_int)
                 
                 # Generate hr_derived signal (from last valid RR interval)
                 if rr_ms is not None and ts_per_beat is not None and len(rr_ms) > 0:
@@ -216,6 +270,8 @@ class SignalProcessor:
                 else:
                     print(f"[SignalProcessor] !! No derived signals generated (filtered out) !!", flush=True)
                 
+                cadence.record(est_rr, feedback_generator.current_category(session_id) if target_rr > 0 else None)
+                
                 # Update session last_emitted_ts
                 if last_emitted_ts > 0:
                     await db.sessions.update_one(
@@ -226,6 +282,31 @@ class SignalProcessor:
         except Exception as e:
             logger.error(f"Error processing ECG signal: {e}", exc_info=True)
     
+    async def _emit_quality_change(self, quality: QualityTracker, ecg_record: Dict[str, Any], session_id: str) -> bool:
+        """Broadcast a signal_quality event when the window flips between usable and unusable"""
+        if not quality.changed():
+            return False
+        ts = int(ecg_record.get("ts") or 0)
+        event = SignalRecord(
+            device_id=ecg_record["device_id"],
+            signal=SignalRecord.SIGNAL_QUALITY,
+            ts=ts,
+            dt=ecg_record.get("dt") or self._parse_dt_from_ts(ts),
+            session_id=session_id,
+            quality=round(quality.index, 2),
+            reason=quality.reason,
+        )
+        await stream_manager.broadcast(event.to_dict())
+        return True
+    
+    def _trim(self, session_id: str) -> List[dict]:
+        """Keep the last BUFFER_SIZE records of a session buffer"""
+        buffer = self._ecg_buffers[session_id]
+        buffer_size = self._buffer_sizes.get(session_id, DEFAULT_BUFFER_SIZE)
+        if len(buffer) > buffer_size:
+            buffer = self._ecg_buffers[session_id] = buffer[-buffer_size:]
+        return buffer
+    
     def _parse_dt_from_ts(self, ts: int) -> str:
         """Convert timestamp (ms) to dt string format"""
         dt = datetime.fromtimestamp(ts / 1000.0)
@@ -260,10 +341,26 @@ class SignalProcessor:
         except Exception:
             return ""
     
+    def notify_target_change(self, session_id: str):
+        """BreathTarget changed: estimate on every packet again so feedback follows immediately"""
+        cadence = self._cadence.get(session_id)
+        if cadence is not None:
+            cadence.boost()
+    
+    def retain_devices(self, owns: Callable[[str], bool]):
+        """Drop per-session state of devices this process no longer owns (cluster rebalance)"""
+        for session_id, buffer in list(self._ecg_buffers.items()):
+            if buffer and not owns(buffer[-1].get("device_id") or "UNKNOWN"):
+                self.clear_buffer(session_id)
+    
     def clear_buffer(self, session_id: str):
         """Clear ECG buffer for a session"""
         if session_id in self._ecg_buffers:
             del self._ecg_buffers[session_id]
+        self._breath_detectors.pop(session_id, None)
+        self._quality.pop(session_id, None)
+        self._cadence.pop(session_id, None)
+        self._buffer_sizes.pop(session_id, None)
         feedback_generator.clear_session_state(session_id)
 
 
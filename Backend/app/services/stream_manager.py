@@ -4,27 +4,76 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from typing import Dict, Set, AsyncIterator
+from typing import Dict, List, Optional, Set, AsyncIterator
 from collections import defaultdict
 
+from app.services.broadcast import ALL, BroadcastBackend, MemoryBackend
+
 logger = logging.getLogger(__name__)
 
+# Per-subscriber backlog (a subscriber that falls further behind is dropped);
+# must hold a burst plus a whole remote batch
+SUBSCRIBER_QUEUE = 1000
+# Max records per published batch; publish queue bound (dropped beyond it)
+PUBLISH_BATCH = 256
+PUBLISH_QUEUE = 10000
+
 
 class StreamManager:
-    """Manages real-time data streams using in-memory pub/sub"""
-    
-    def __init__(self):
+    """
+    Manages real-time data streams using in-memory pub/sub.
+
+    Local subscribers are always served directly from `broadcast()`. With a
+    remote backend (see app.services.broadcast) records are additionally
+    queued and published in batches, and records published by other
+    instances are fanned out to the local subscribers. The backend holds
+    one upstream subscription per device with local subscribers.
+    """
+
+    def __init__(self, backend: Optional[BroadcastBackend] = None):
         # Map: device_id -> set of queues
         self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
         self._lock = asyncio.Lock()
-    
+        self._backend: BroadcastBackend = backend or MemoryBackend()
+        self._outbox: Optional[asyncio.Queue] = None
+        self._publisher: Optional[asyncio.Task] = None
+        self.published = 0
+        self.dropped = 0
+
+    @staticmethod
+    def _upstream_key(device_id: str) -> str:
+        return ALL if device_id == "UNKNOWN" else device_id
+
+    async def start(self, backend: Optional[BroadcastBackend] = None):
+        """Connect the broadcast backend (app startup)"""
+        if backend is not None:
+            self._backend = backend
+        await self._backend.start(self._on_remote)
+        async with self._lock:
+            for device_id, queues in self._subscribers.items():
+                if queues:
+                    await self._backend.subscribe(self._upstream_key(device_id))
+        if self._backend.remote:
+            self._outbox = asyncio.Queue(maxsize=PUBLISH_QUEUE)
+            self._publisher = asyncio.create_task(self._publish_loop())
+
+    async def stop(self):
+        if self._publisher is not None:
+            self._publisher.cancel()
+            self._publisher = None
+        self._outbox = None
+        await self._backend.stop()
+
     async def subscribe(self, device_id: str) -> AsyncIterator[dict]:
         """Subscribe to data stream for a device"""
-        q = asyncio.Queue(maxsize=100)
-        
+        q = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE)
+
         async with self._lock:
+            first = not self._subscribers[device_id]
             self._subscribers[device_id].add(q)
-        
+            if first:
+                await self._backend.subscribe(self._upstream_key(device_id))
+
         try:
             while True:
                 data = await q.get()
@@ -33,37 +82,70 @@ class StreamManager:
             pass
         finally:
             async with self._lock:
-                if q in self._subscribers[device_id]:
-                    self._subscribers[device_id].remove(q)
-    
+                subs = self._subscribers.get(device_id)
+                if subs is not None and q in subs:
+                    subs.remove(q)
+                    if not subs:
+                        del self._subscribers[device_id]
+                        await self._backend.unsubscribe(self._upstream_key(device_id))
+
     async def broadcast(self, data: dict):
         """Broadcast data to subscribers"""
         device_id = data.get("device_id", "UNKNOWN")
-        
-        # Broadcast to device-specific subscribers
-        async with self._lock:
-            queues = list(self._subscribers.get(device_id, set()))
-            # Also broadcast to UNKNOWN subscribers
-            if device_id != "UNKNOWN":
-                queues.extend(self._subscribers.get("UNKNOWN", set()))
-        
-        if not queues:
-            return
-        
-        # Send to all subscribers (non-blocking)
-        for queue in queues:
+        self._deliver(device_id, data)
+
+        if self._outbox is not None:
             try:
-                queue.put_nowait(data)
+                self._outbox.put_nowait((device_id, data))
             except asyncio.QueueFull:
-                # Remove full queue
-                async with self._lock:
-                    if queue in self._subscribers[device_id]:
-                        self._subscribers[device_id].remove(queue)
-            except Exception as e:
-                logger.warning(f"Error broadcasting to subscriber: {e}")
-                async with self._lock:
-                    if device_id in self._subscribers:
-                        self._subscribers[device_id].discard(queue)
+                self.dropped += 1
+
+    def _deliver(self, device_id: str, data: dict):
+        """Fan out to local device-specific and UNKNOWN subscribers"""
+        targets = [device_id] if device_id == "UNKNOWN" else [device_id, "UNKNOWN"]
+        for key in targets:
+            queues = self._subscribers.get(key)
+            if not queues:
+                continue
+            for queue in list(queues):
+                try:
+                    queue.put_nowait(data)
+                except asyncio.QueueFull:
+                    # Remove full queue (slow consumer)
+                    queues.discard(queue)
+
+    def _on_remote(self, device_id: str, items: List[dict]):
+        """Records published by another instance"""
+        for data in items:
+            self._deliver(device_id, data)
+
+    async def _publish_loop(self):
+        """Drain the outbox into per-device batches"""
+        while True:
+            batch = [await self._outbox.get()]
+            while len(batch) < PUBLISH_BATCH:
+                try:
+                    batch.append(self._outbox.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            by_device: Dict[str, List[dict]] = defaultdict(list)
+            for device_id, data in batch:
+                by_device[device_id].append(data)
+            for device_id, items in by_device.items():
+                try:
+                    await self._backend.publish(device_id, items)
+                    self.published += len(items)
+                except Exception as e:
+                    self.dropped += len(items)
+                    logger.warning(f"Publishing {len(items)} records for {device_id} failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self._backend).__name__,
+            "subscribers": sum(len(q) for q in self._subscribers.values()),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
 
 
 # Global stream manager instance
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary ECG ingest format (Content-Type: application/x-serena-ecg)
+
+A body is one or more frames, each:
+
+    offset  size  field
+    0       4     magic b"SECG"
+    4       1     version (1)
+    5       1     sample dtype: 1 = int16, 2 = int32 (little-endian)
+    6       1     device_id length in bytes (utf-8)
+    7       1     reserved (0)
+    8       8     ts, int64 milliseconds since epoch of the first sample
+    16      4     fs, float32 Hz (0 = unknown)
+    20      4     sample count, uint32
+    24      n     device_id
+    24+n    ...   samples
+
+Decoded samples stay numpy arrays (a view on the body) while a record is
+processed; `to_storable` turns them into lists right before the MongoDB
+insert and `json_default` does the same for JSON encoders.
+"""
+from __future__ import annotations
+
+import struct
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+CONTENT_TYPE = "application/x-serena-ecg"
+
+MAGIC = b"SECG"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBBqfI")
+
+_DTYPES = {1: np.dtype("<i2"), 2: np.dtype("<i4")}
+
+
+def decode_frames(body: bytes) -> List[Dict[str, Any]]:
+    """Decode a binary body into ECG records (JSON ingest shape, samples as read-only ndarray)."""
+    records: List[Dict[str, Any]] = []
+    view = memoryview(body)
+    off = 0
+    while off < len(view):
+        if len(view) - off < HEADER.size:
+            raise ValueError(f"Truncated frame header at byte {off}")
+        magic, version, dtype_code, dev_len, _, ts, fs, count = HEADER.unpack_from(view, off)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Bad frame magic/version at byte {off}")
+        dtype = _DTYPES.get(dtype_code)
+        if dtype is None:
+            raise ValueError(f"Unknown sample dtype {dtype_code}")
+        off += HEADER.size
+        end = off + dev_len + count * dtype.itemsize
+        if end > len(view):
+            raise ValueError(f"Truncated frame payload at byte {off}")
+        device_id = bytes(view[off:off + dev_len]).decode("utf-8") if dev_len else None
+        off += dev_len
+        samples = np.frombuffer(view, dtype=dtype, count=count, offset=off)
+        off = end
+
+        rec: Dict[str, Any] = {"signal": "ecg", "ts": ts, "samples": samples}
+        if device_id:
+            rec["device_id"] = device_id
+        if fs > 0:
+            rec["fs"] = float(fs)
+        records.append(rec)
+    return records
+
+
+def to_storable(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Records for insert_many: ndarray samples as lists (BSON has no ndarray).
+    Converted records are copies; the originals (e.g. in the RR estimation
+    buffer) keep their arrays.
+    """
+    out = []
+    for rec in records:
+        samples = rec.get("samples")
+        out.append({**rec, "samples": samples.tolist()} if isinstance(samples, np.ndarray) else rec)
+    return out
+
+
+def json_default(obj: Any) -> Any:
+    """json.dumps default: ndarray samples as lists, anything else (ObjectId, datetime) as str."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return str(obj)
+
+
+def encode_frame(samples: Sequence[int], ts: int, device_id: Optional[str] = None, fs: float = 0.0) -> bytes:
+    """Encode one ECG packet (int16 when the samples fit, else int32)."""
+    arr = np.asarray(samples, dtype=np.int64)
+    small = arr.size == 0 or (arr.min() >= -32768 and arr.max() <= 32767)
+    dtype_code = 1 if small else 2
+    dev = (device_id or "").encode("utf-8")
+    header = HEADER.pack(MAGIC, VERSION, dtype_code, len(dev), 0, int(ts), float(fs), arr.size)
+    return header + dev + arr.astype(_DTYPES[dtype_code]).tobytes()
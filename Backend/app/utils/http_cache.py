@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""Conditional GET helpers (ETag / If-None-Match)"""
+from __future__ import annotations
+
+from typing import Optional
+
+from fastapi import Request, Response
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Set the ETag on `response`; return a 304 response when the client
+    already has this version (If-None-Match), else None.
+    """
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    header = request.headers.get("if-none-match")
+    if header:
+        tags = {t.strip() for t in header.split(",")}
+        if "*" in tags or etag in tags or etag.removeprefix("W/") in tags:
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
@@ -8,6 +8,7 @@ Gebruikt motor (async); installeer: python -m pip install -r requirements.txt
 from __future__ import annotations
 
 import asyncio
+import io
 import json
 import logging
 import sys
@@ -43,6 +44,25 @@ def enrich_with_dt(obj: dict) -> str:
     return dt_str
 
 
+# serena_log.py (legacy server) leest .jsonl.zst via de frame-index
+SERENA_LOG_DIR = Path(__file__).resolve().parents[2] / "SerenaWebApp" / "pythonbleakgui_server"
+
+
+def open_log(file_path: Path):
+    """
+    .jsonl, of .jsonl.zst van de legacy server (LOG_FORMAT=zstd). In .zst bevat
+    elk frame één signaal; serena_log zet de regels terug in schrijfvolgorde
+    (volgnummers in de index) zodat sessies net als uit .jsonl ontstaan.
+    """
+    if file_path.suffix.lower() != ".zst":
+        return open(file_path, "r", encoding="utf-8")
+    if str(SERENA_LOG_DIR) not in sys.path:
+        sys.path.insert(0, str(SERENA_LOG_DIR))
+    import serena_log  # pip install zstandard
+    lines = serena_log.iter_lines(str(file_path), ordered=True)
+    return io.StringIO(b"".join(lines).decode("utf-8"))
+
+
 def parse_timestamp(ts: Any) -> Optional[int]:
     """Parse timestamp naar milliseconds"""
     if ts is None:
@@ -57,8 +77,6 @@ def parse_timestamp(ts: Any) -> Optional[int]:
         if 1_000_000_000 < ts_int < 10_000_000_000:
             return ts_int * 1000
         # Already milliseconds
-        if 1_000_000_000_000 < ts_int < 10_000_000_000_000:
-            return ts_int // 1000
         if 1_000_000_000_000 <= ts_int <= 10_000_000_000_000:
             return ts_int
         # Assume milliseconds if in reasonable range
@@ -106,7 +124,7 @@ class JSONLMigrator:
         }
         
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
+            with open_log(file_path) as f:
                 for line_num, line in enumerate(f, 1):
                     line = line.strip()
                     if not line:
@@ -274,7 +292,7 @@ class JSONLMigrator:
     async def migrate_directory(self, logs_dir: Path) -> None:
         """Migrate all JSONL files from logs directory"""
         logger.info(f"Starting migration from: {logs_dir}")
-        jsonl_files = list(logs_dir.rglob("*.jsonl"))
+        jsonl_files = list(logs_dir.rglob("*.jsonl")) + list(logs_dir.rglob("*.jsonl.zst"))
         if not jsonl_files:
             logger.warning(f"No JSONL files found in {logs_dir}")
             return
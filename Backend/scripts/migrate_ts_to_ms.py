@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Data Migration Script: ts van seconden naar milliseconden
+
+parse_timestamp deelde millisecond-timestamps door 1000, waardoor `ts` van
+opgeslagen signalen in seconden stond (en `dt` / `started_at` van sessies die
+via BreathTarget zijn aangemaakt in januari 1970). Sinds die tak verwijderd is
+slaat /ingest milliseconden op; dit script zet bestaande data om zodat de
+collecties niet gemengd blijven:
+
+- signals: ts in het secondenbereik -> ts * 1000, dt opnieuw berekend
+  (de milliseconden zelf zijn niet meer te herstellen, die worden :000)
+- sessions: started_at vóór 1971 -> opnieuw berekend uit dezelfde waarde
+
+Idempotent: omgezette documenten vallen buiten het filter. Gebruik --dry-run
+om eerst alleen te tellen.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from app.config import settings
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+logger = logging.getLogger(__name__)
+
+# ts in seconden (zelfde bereik als de 'Convert seconds' tak van parse_timestamp)
+SECONDS_FILTER = {"ts": {"$gt": 1_000_000_000, "$lt": 10_000_000_000}}
+EPOCH_1971 = datetime(1971, 1, 1)
+BATCH = 1000
+
+
+def parse_dt_from_ts(ts: int) -> str:
+    """Convert timestamp (ms) to dt string format"""
+    dt = datetime.fromtimestamp(ts / 1000.0)
+    ms = ts % 1000
+    return dt.strftime("%d-%m-%Y %H:%M:%S") + f":{ms:03d}"
+
+
+async def migrate_signals(db, dry_run: bool) -> int:
+    total = await db.signals.count_documents(SECONDS_FILTER)
+    logger.info(f"signals met ts in seconden: {total}")
+    if dry_run or not total:
+        return total
+    done = 0
+    ops = []
+    async for doc in db.signals.find(SECONDS_FILTER, {"_id": 1, "ts": 1}):
+        ts = int(doc["ts"]) * 1000
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"ts": ts, "dt": parse_dt_from_ts(ts)}}))
+        if len(ops) >= BATCH:
+            await db.signals.bulk_write(ops, ordered=False)
+            done += len(ops)
+            ops = []
+            logger.info(f"  {done}/{total}")
+    if ops:
+        await db.signals.bulk_write(ops, ordered=False)
+        done += len(ops)
+    return done
+
+
+async def migrate_sessions(db, dry_run: bool) -> int:
+    query = {"started_at": {"$lt": EPOCH_1971}}
+    total = await db.sessions.count_documents(query)
+    logger.info(f"sessions met started_at in 1970: {total}")
+    if dry_run or not total:
+        return total
+    ops = []
+    async for doc in db.sessions.find(query, {"_id": 1, "started_at": 1}):
+        # started_at = fromtimestamp(ts_s / 1000) -> fromtimestamp(ts_s)
+        started_at = datetime.fromtimestamp(doc["started_at"].timestamp() * 1000)
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"started_at": started_at}}))
+    await db.sessions.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Zet opgeslagen ts van seconden om naar milliseconden")
+    parser.add_argument("--dry-run", action="store_true", help="alleen tellen, niets wijzigen")
+    args = parser.parse_args()
+
+    logger.info(f"Connecting to MongoDB: {settings.mongodb_uri}")
+    client = AsyncIOMotorClient(settings.mongodb_uri, serverSelectionTimeoutMS=5000)
+    try:
+        await client.admin.command("ping")
+        db = client[settings.mongo_database]
+        signals = await migrate_signals(db, args.dry_run)
+        sessions = await migrate_sessions(db, args.dry_run)
+        verb = "te migreren" if args.dry_run else "gemigreerd"
+        logger.info(f"Klaar: {signals} signals, {sessions} sessions {verb}")
+    except Exception as e:
+        logger.error(f"Migration failed: {e}", exc_info=True)
+        sys.exit(1)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
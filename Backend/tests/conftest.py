@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""pytest setup: make the `app` package importable from Backend/tests"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""StreamManager fan-out across instances, using the in-process LocalBroker"""
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from app.services.broadcast import ALL, LocalBroker, LocalBrokerBackend
+from app.services.stream_manager import StreamManager
+
+pytestmark = pytest.mark.asyncio
+
+
+async def until(condition, timeout: float = 1.0):
+    """Yield to the loop until `condition()` holds (publish loop / broker dispatch)"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "condition not reached"
+        await asyncio.sleep(0.001)
+
+
+async def settle():
+    """Give queued publishes and dispatches time to arrive"""
+    await asyncio.sleep(0.05)
+
+
+class Collector:
+    """Consumes one StreamManager subscription into `items`"""
+
+    def __init__(self, manager: StreamManager, device_id: str):
+        self.manager = manager
+        self.device_id = device_id
+        self.items = []
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        async for data in self.manager.subscribe(self.device_id):
+            self.items.append(data)
+
+    async def ready(self):
+        await until(lambda: self.manager._subscribers.get(self.device_id))
+        return self
+
+    async def close(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+@pytest_asyncio.fixture
+async def cluster():
+    """Two StreamManagers ("instances") connected through one LocalBroker"""
+    broker = LocalBroker()
+    managers = [StreamManager(LocalBrokerBackend(broker)) for _ in range(2)]
+    for manager in managers:
+        await manager.start()
+    yield broker, managers
+    for manager in managers:
+        await manager.stop()
+
+
+def record(device_id: str, ts: int = 1) -> dict:
+    return {"device_id": device_id, "signal": "hr_derived", "ts": ts, "bpm": 60}
+
+
+async def test_record_reaches_subscriber_on_other_instance(cluster):
+    broker, (a, b) = cluster
+    sub = await Collector(b, "dev1").ready()
+
+    await a.broadcast(record("dev1", ts=1))
+    await a.broadcast(record("dev2", ts=2))
+    await until(lambda: sub.items)
+    await settle()
+
+    assert [r["ts"] for r in sub.items] == [1]
+    assert a.published == 2
+    await sub.close()
+
+
+async def test_own_publish_is_not_delivered_twice(cluster):
+    broker, (a, b) = cluster
+    local = await Collector(a, "dev1").ready()
+    remote = await Collector(b, "dev1").ready()
+
+    await a.broadcast(record("dev1"))
+    await until(lambda: remote.items)
+    await settle()
+
+    # a's upstream subscription receives its own batch back from the broker
+    assert broker.published == 1
+    assert len(local.items) == 1
+    assert len(remote.items) == 1
+    await local.close()
+    await remote.close()
+
+
+async def test_upstream_subscription_is_reference_counted(cluster):
+    broker, (a, b) = cluster
+    backend = a._backend
+
+    first = await Collector(a, "dev1").ready()
+    second = await Collector(a, "dev1").ready()
+    await until(lambda: len(a._subscribers["dev1"]) == 2)
+    assert backend in broker._subs["dev1"]
+
+    await first.close()
+    assert backend in broker._subs["dev1"]
+
+    await second.close()
+    assert backend not in broker._subs["dev1"]
+    assert "dev1" not in a._subscribers
+
+
+async def test_unknown_subscriber_receives_every_device(cluster):
+    broker, (a, b) = cluster
+    remote_all = await Collector(b, "UNKNOWN").ready()
+    local_all = await Collector(a, "UNKNOWN").ready()
+
+    # UNKNOWN maps to one upstream ALL subscription
+    assert b._backend in broker._subs[ALL]
+
+    await a.broadcast(record("dev1", ts=1))
+    await a.broadcast(record("dev2", ts=2))
+    await a.broadcast(record("UNKNOWN", ts=3))
+    await until(lambda: len(remote_all.items) == 3)
+    await settle()
+
+    assert sorted(r["ts"] for r in remote_all.items) == [1, 2, 3]
+    # Local fan-out: a record of UNKNOWN itself is delivered once
+    assert sorted(r["ts"] for r in local_all.items) == [1, 2, 3]
+    await remote_all.close()
+    await local_all.close()
@@ -3,27 +3,63 @@
 ECG Data Replay Tool — streaming (timestamp-paced) + bulk
 - Streaming: sends records one-by-one and SLEEPS between posts according to ts deltas.
 - Bulk: sends all (or in batches) as NDJSON or JSON array.
+- Optional gzip/zstd request bodies (--compress) for slow links / backfills.
 """
 
 from pathlib import Path
 import argparse
 import asyncio
 import aiohttp
+import gzip
 import json
+import sys
 from typing import Iterable, List, Optional, Set, Dict, Any
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
-def load_jsonl(path: Path) -> Iterable[Dict[str, Any]]:
-    with path.open("r", encoding="utf-8") as f:
-        for lineno, line in enumerate(f, 1):
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-                yield obj
-            except Exception as e:
-                print(f"[WARN] Skip malformed line {lineno}: {e}")
+
+def _parse_lines(f) -> Iterable[Dict[str, Any]]:
+    for lineno, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+            yield obj
+        except Exception as e:
+            print(f"[WARN] Skip malformed line {lineno}: {e}")
+
+
+def _import_serena_log():
+    """serena_log.py of the legacy server (frame index of .jsonl.zst logs)"""
+    try:
+        import serena_log
+        return serena_log
+    except ImportError:
+        pass
+    here = Path(__file__).resolve().parent
+    for folder in (here.parent / "pythonbleakgui_server", here.parent / "SerenaWebApp" / "pythonbleakgui_server"):
+        if (folder / "serena_log.py").exists():
+            sys.path.insert(0, str(folder))
+            import serena_log
+            return serena_log
+    raise RuntimeError("Reading .jsonl.zst requires serena_log.py (SerenaWebApp/pythonbleakgui_server)")
+
+
+def load_jsonl(path: Path, signals: Optional[Set[str]] = None) -> Iterable[Dict[str, Any]]:
+    if path.suffix.lower() != ".zst":
+        with path.open("r", encoding="utf-8") as f:
+            yield from _parse_lines(f)
+        return
+    # .jsonl.zst (server LOG_FORMAT=zstd): every zstd frame holds one signal.
+    # Only the frames of the replayed signals are decompressed (sidecar index),
+    # merged back into the order the server wrote them in.
+    if zstandard is None:
+        raise RuntimeError("Reading .jsonl.zst requires the 'zstandard' package")
+    yield from _import_serena_log().iter_records(str(path), signals, ordered=True)
 
 
 class ECGReplayer:
@@ -39,6 +75,7 @@ class ECGReplayer:
         batch_size: int = 0,
         bulk_format: str = "ndjson",
         verbose: bool = False,
+        compress: Optional[str] = None,
     ):
         self.file_path = Path(file_path)
         self.url = url
@@ -50,12 +87,15 @@ class ECGReplayer:
         self.batch_size = int(batch_size) if batch_size else 0
         self.bulk_format = bulk_format  # "ndjson" or "json"
         self.verbose = verbose
+        self.compress = compress  # None, "gzip" or "zstd" (Content-Encoding)
+        if self.compress == "zstd" and zstandard is None:
+            raise RuntimeError("--compress zstd requires the 'zstandard' package")
         self.session: Optional[aiohttp.ClientSession] = None
 
         self.last_sent_ts: Optional[int] = None
 
     def iter_records(self) -> Iterable[Dict[str, Any]]:
-        for obj in load_jsonl(self.file_path):
+        for obj in load_jsonl(self.file_path, None if self.signals == {"*"} else self.signals):
             sig = obj.get("signal")
             if self.signals != {"*"} and sig not in self.signals:
                 continue
@@ -63,13 +103,24 @@ class ECGReplayer:
                 continue
             yield obj
 
+    async def _post(self, payload: str, content_type: str) -> None:
+        data = payload.encode("utf-8")
+        headers = {"Content-Type": content_type}
+        if self.compress == "zstd":
+            data = zstandard.ZstdCompressor(level=3).compress(data)
+            headers["Content-Encoding"] = "zstd"
+        elif self.compress == "gzip":
+            data = gzip.compress(data, compresslevel=5, mtime=0)
+            headers["Content-Encoding"] = "gzip"
+        async with self.session.post(self.url, data=data, headers=headers) as resp:
+            if resp.status >= 400:
+                text = await resp.text()
+                print(f"[HTTP {resp.status}] {text[:300]}")
+
     async def send_record(self, record: Dict[str, Any]) -> None:
         assert self.session is not None, "HTTP session not initialized"
         try:
-            async with self.session.post(self.url, json=record) as resp:
-                if resp.status >= 400:
-                    text = await resp.text()
-                    print(f"[HTTP {resp.status}] {text[:300]}")
+            await self._post(json.dumps(record, ensure_ascii=False), "application/json")
         except Exception as e:
             print(f"[ERROR] POST single failed: {e}")
 
@@ -77,18 +128,10 @@ class ECGReplayer:
         assert self.session is not None, "HTTP session not initialized"
         try:
             if self.bulk_format == "ndjson":
-                payload = "\\n".join(json.dumps(r, ensure_ascii=False) for r in batch) + "\\n"
-                headers = {"Content-Type": "application/x-ndjson"}
-                async with self.session.post(self.url, data=payload.encode("utf-8"), headers=headers) as resp:
-                    if resp.status >= 400:
-                        text = await resp.text()
-                        print(f"[HTTP {resp.status}] {text[:300]}")
+                payload = "\n".join(json.dumps(r, ensure_ascii=False) for r in batch) + "\n"
+                await self._post(payload, "application/x-ndjson")
             else:  # json array
-                headers = {"Content-Type": "application/json"}
-                async with self.session.post(self.url, json=batch, headers=headers) as resp:
-                    if resp.status >= 400:
-                        text = await resp.text()
-                        print(f"[HTTP {resp.status}] {text[:300]}")
+                await self._post(json.dumps(batch, ensure_ascii=False), "application/json")
         except Exception as e:
             print(f"[ERROR] POST batch failed: {e}")
 
@@ -185,7 +228,7 @@ class ECGReplayer:
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="ECG replayer with timestamp-paced streaming and bulk modes.")
-    p.add_argument("--file", required=True, help="Path to source JSONL file")
+    p.add_argument("--file", required=True, help="Path to source JSONL file (.jsonl or .jsonl.zst)")
     p.add_argument("--url", required=True, help="Target ingest URL")
     p.add_argument("--signals", default="ecg", help="Comma-separated list of signals (default: ecg). Use * for all.")
     p.add_argument("--loop", action="store_true", help="Repeat the file indefinitely (stream mode only)")
@@ -196,6 +239,7 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--bulk", action="store_true", help="Enable bulk mode (send all or batches)")
     p.add_argument("--batch-size", type=int, default=0, help="Batch size for bulk mode (0 = all in one request)")
     p.add_argument("--format", dest="bulk_format", choices=["ndjson", "json"], default="ndjson", help="Bulk payload format")
+    p.add_argument("--compress", choices=["gzip", "zstd"], default=None, help="Compress request bodies (Content-Encoding)")
     return p.parse_args()
 
 
@@ -213,6 +257,7 @@ def main():
         batch_size=args.batch_size,
         bulk_format=args.bulk_format,
         verbose=args.verbose,
+        compress=args.compress,
     )
     asyncio.run(runner.run())
 
@@ -54,7 +54,7 @@ export interface SessionUpdate {
 }
 
 // Signal types
-export type SignalType = 'ecg' | 'hr_derived' | 'resp_rr' | 'guidance' | 'BreathTarget';
+export type SignalType = 'ecg' | 'hr_derived' | 'resp_rr' | 'guidance' | 'BreathTarget' | 'signal_quality';
 
 export interface SignalRecord {
   _id: string;
@@ -79,6 +79,10 @@ export interface SignalRecord {
   target?: number;
   actual?: number;
   
+  // Signal quality fields
+  quality?: number; // 0-1
+  reason?: 'flatline' | 'saturated' | 'noise' | 'irregular' | '';
+  
   // BreathTarget fields
   breath_cycle?: {
     in: number;
@@ -2,6 +2,9 @@
 from collections import deque
 from statistics import median
 
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
 class RobustECGHRDetector:
     """
     Live HR/RR (~130 Hz) met T-wave suppressie:
@@ -9,15 +12,24 @@ class RobustECGHRDetector:
     - smoothing
     - adaptieve drempel (MAD)
     - dynamische refractory window
+
+    Begrensd geheugen: alleen de laatste 1.5 s ruwe samples worden bewaard.
+    Baseline/smoothing lopen per sample (O(1) lopende sommen); de drempel
+    (mediaan + k*MAD over 1.5 s) wordt per batch met NumPy berekend, en alleen
+    voor lokale maxima. Met int-samples (Polar) zijn de pieken identiek aan de
+    oorspronkelijke per-sample versie (zelfde float-bewerkingen).
     """
     def __init__(self, sr_hz=130, base_win_s=0.6, smooth_win_s=0.12, k=3.0):
         self.sr = sr_hz
         self.dt_ms = 1000.0/sr_hz
         self.base_N = max(3, int(base_win_s*sr_hz))
         self.smooth_N = max(3, int(smooth_win_s*sr_hz))
+        self.hist_N = int(1.5*sr_hz)
         self.k = float(k)
 
-        self.raw = []                 
+        self.n_samples = 0            # totaal ontvangen (absolute index volgende sample)
+        self._tail = None             # laatste hist_N samples (np.ndarray)
+        self._head = []               # eerste 2 s, tot de polariteit gekozen is
         self.t0_ms = None             
         self.last_peak_idx = -10_000  
         self.peak_times_ms = []       
@@ -31,11 +43,6 @@ class RobustECGHRDetector:
         self.base_q = deque(); self.base_sum = 0.0
         self.smooth_q = deque(); self.smooth_sum = 0.0
 
-    def _mad(self, arr):
-        if not arr: return 0.0
-        m = median(arr)
-        return median([abs(x-m) for x in arr])
-
     def _choose_polarity(self, seg):
         if not seg: return 1
         pos = sorted([x for x in seg if x>0])
@@ -52,63 +59,84 @@ class RobustECGHRDetector:
         return self._startup_refrac_ms
 
     def add_batch(self, last_ts_ms: int, values):
-        if not values: return
+        if len(values) == 0: return
         start_ts_ms = int(last_ts_ms - (len(values)-1)*self.dt_ms)
         if self.t0_ms is None:
             self.t0_ms = start_ts_ms
 
-        start_idx = len(self.raw)
-        self.raw.extend(values)
-
-        if start_idx < int(2*self.sr) and len(self.raw)>=int(2*self.sr):
-            seg = self.raw[:int(2*self.sr)]
-            mu = sum(seg)/len(seg)
-            seg = [x-mu for x in seg]
-            self.polarity = self._choose_polarity(seg)
-
-        self._detect_range(start_idx, len(self.raw)-1)
-
-    def _detect_range(self, i0, i1):
-        if i0<0: i0=0
-        if i1-i0<3: return
-
-        for i in range(i0, i1+1):
-            x = float(self.raw[i])
-
-            self.base_q.append(x); self.base_sum += x
-            if len(self.base_q)>self.base_N:
-                self.base_sum -= self.base_q.popleft()
-            base = self.base_sum/len(self.base_q)
-
-            detr = (x - base) * self.polarity
-
-            self.smooth_q.append(detr); self.smooth_sum += detr
-            if len(self.smooth_q)>self.smooth_N:
-                self.smooth_sum -= self.smooth_q.popleft()
-            smooth = self.smooth_sum/len(self.smooth_q)
-
-            if i < self.base_N + self.smooth_N:
-                continue
-
-            hist_N = int(1.5*self.sr)
-            j0 = max(0, i-hist_N)
-            hist = self.raw[j0:i+1]
-            mu = sum(hist)/len(hist)
-            detr_hist = [(v-mu)*self.polarity for v in hist]
-            mad = self._mad(detr_hist)
-            thr = (median(detr_hist) if detr_hist else 0.0) + self.k*(mad if mad>0 else 1.0)
-
-            if smooth < thr:
-                continue
-
-            if i<=0 or i>=len(self.raw)-1: 
-                continue
-            left = (self.raw[i-1]-mu)*self.polarity
-            center = (self.raw[i]-mu)*self.polarity
-            right = (self.raw[i+1]-mu)*self.polarity
-            if not (left<=center>=right):
-                continue
-
+        new = np.asarray(values)
+        start_idx = self.n_samples
+        self.n_samples += len(new)
+
+        pol_N = int(2*self.sr)
+        if start_idx < pol_N:
+            self._head.extend(new[:pol_N - start_idx].tolist())
+            if self.n_samples >= pol_N:
+                seg = self._head
+                mu = sum(seg)/len(seg)
+                self.polarity = self._choose_polarity([x-mu for x in seg])
+                self._head = []
+
+        seg = new if self._tail is None else np.concatenate((self._tail, new))
+        # batches van < 4 samples worden (zoals altijd) niet gedetecteerd
+        if len(new) >= 4:
+            self._detect(seg, len(seg) - len(new), start_idx)
+        self._tail = seg[-self.hist_N:]
+
+    def _thresholds(self, wins):
+        """Drempel per venster (rij): mediaan + k*MAD van het ontdane venster"""
+        mu = wins.sum(axis=1) / wins.shape[1]
+        detr = (wins - mu[:, None]) * self.polarity
+        med = np.median(detr, axis=1)
+        mad = np.median(np.abs(detr - med[:, None]), axis=1)
+        return med + self.k * np.where(mad > 0, mad, 1.0)
+
+    def _detect(self, seg, p0, i0):
+        """seg[p0:] zijn de nieuwe samples, met absolute index i0.."""
+        pol = self.polarity
+        xs = seg[p0:].tolist()
+        smooth = np.empty(len(xs))
+        base_q, smooth_q = self.base_q, self.smooth_q
+        for j, v in enumerate(xs):
+            x = float(v)
+
+            base_q.append(x); self.base_sum += x
+            if len(base_q)>self.base_N:
+                self.base_sum -= base_q.popleft()
+            base = self.base_sum/len(base_q)
+
+            detr = (x - base) * pol
+
+            smooth_q.append(detr); self.smooth_sum += detr
+            if len(smooth_q)>self.smooth_N:
+                self.smooth_sum -= smooth_q.popleft()
+            smooth[j] = self.smooth_sum/len(smooth_q)
+
+        # Kandidaten: lokaal maximum (na polariteit), genoeg historie, niet het
+        # laatste sample (de rechterbuur komt pas met de volgende batch)
+        off = i0 - p0                       # absolute index van seg[0]
+        p_lo = max(p0, 1, self.base_N + self.smooth_N - off)
+        p_hi = len(seg) - 1
+        if p_lo >= p_hi:
+            return
+        y = seg * pol
+        p = np.arange(p_lo, p_hi)
+        p = p[(y[p-1] <= y[p]) & (y[p] >= y[p+1])]
+        if p.size == 0:
+            return
+
+        # Drempel over het venster [i-hist_N, i]; vroege (kortere) vensters apart
+        thr = np.empty(p.size)
+        full = p - self.hist_N >= 0
+        if full.any():
+            wins = sliding_window_view(seg, self.hist_N + 1)
+            thr[full] = self._thresholds(wins[p[full] - self.hist_N])
+        for j in np.flatnonzero(~full):
+            thr[j] = self._thresholds(seg[None, :p[j] + 1])[0]
+        p = p[smooth[p - p0] >= thr]
+
+        for pj in p.tolist():
+            i = off + pj
             dyn_ms = self._dyn_refrac_ms()
             dyn_samp = int(dyn_ms / self.dt_ms)
             if i - self.last_peak_idx < dyn_samp:
@@ -1,5 +1,8 @@
 # breathing_logic.py
 import math
+from functools import lru_cache
+
+import numpy as np
 
 def calculate_breath_y(t_in_cycle, a, b, c, d):
     """
@@ -8,25 +11,84 @@ def calculate_breath_y(t_in_cycle, a, b, c, d):
     b = Hold (na in)
     c = Uitademtijd
     d = Hold (na uit)
+    Werkt ook op numpy-arrays (alle argumenten broadcastbaar); scalar in -> float uit.
     """
-    if a + b + c + d <= 0: 
+    if np.ndim(t_in_cycle) or np.ndim(a) or np.ndim(b) or np.ndim(c) or np.ndim(d):
+        return _breath_y_array(t_in_cycle, a, b, c, d)
+
+    if a + b + c + d <= 0:
         return 0.0
 
     # Fase 1: Inademing (Sinus opgaand)
     if t_in_cycle < a and a > 0:
         return math.sin(-math.pi/2 + math.pi*(t_in_cycle/max(1e-6,a)))
-    
+
     t = t_in_cycle - a
-    
+
     # Fase 2: Hold 1 (Bovenin vast)
-    if t < b and b > 0: 
+    if t < b and b > 0:
         return 1.0
-    
+
     t -= b
-    
+
     # Fase 3: Uitademing (Sinus neergaand)
     if t < c and c > 0:
         return math.sin(math.pi/2 + math.pi*(t/max(1e-6,c)))
-    
+
     # Fase 4: Hold 2 (Onderin vast) -> implied -1.0 return
-    return -1.0
\ No newline at end of file
+    return -1.0
+
+def _breath_y_array(t_in_cycle, a, b, c, d):
+    """Zelfde fases als hierboven, met np.select (eerste ware conditie wint)"""
+    t0, a, b, c, d = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (t_in_cycle, a, b, c, d)))
+    t1 = t0 - a
+    t2 = t1 - b
+    y = np.select(
+        [(t0 < a) & (a > 0), (t1 < b) & (b > 0), (t2 < c) & (c > 0)],
+        [np.sin(-np.pi/2 + np.pi*(t0/np.maximum(1e-6, a))),
+         1.0,
+         np.sin(np.pi/2 + np.pi*(t2/np.maximum(1e-6, c)))],
+        -1.0)
+    y[a + b + c + d <= 0] = 0.0
+    return y
+
+def generate_preview_data(protocol_data, duration=300.0, step=0.05):
+    """
+    Preview-curve (x = s sinds start, y) van het protocol, rijen herhaald tot
+    `duration`. Elke cyclus wordt vanaf zijn eigen begin per `step` gesampled.
+    Gecachet per protocol: dezelfde tabel levert dezelfde (read-only) arrays.
+    """
+    if not protocol_data: return np.empty(0), np.empty(0)
+    return _preview(tuple(tuple(r) for r in protocol_data), float(duration), float(step))
+
+@lru_cache(maxsize=16)
+def _preview(rows, duration, step):
+    rows = [r for r in rows if r[0]+r[1]+r[2]+r[3] > 0 and r[4] > 0]
+    if not rows:
+        return np.empty(0), np.empty(0)
+    params = np.array([r[:4] for r in rows], dtype=float)          # (rij, a..d)
+    T_row = np.array([r[0]+r[1]+r[2]+r[3] for r in rows], dtype=float)
+    n_row = np.array([len(np.arange(0, T, step)) for T in T_row])  # samples per cyclus
+
+    # Eén protocolronde als reeks cycli, zo vaak herhaald dat `duration` vol is
+    one_pass = np.repeat(np.arange(len(rows)), [r[4] for r in rows])
+    passes = int(duration // T_row[one_pass].sum()) + 1
+    cyc_row = np.tile(one_pass, passes)
+    cyc_T = T_row[cyc_row]
+    # Cyclusgrenzen: begin = cumulatieve som (zelfde optelvolgorde als t += T)
+    starts = np.concatenate(([0.0], np.cumsum(cyc_T)[:-1]))
+    keep = starts < duration
+    cyc_row, starts = cyc_row[keep], starts[keep]
+
+    # Per sample: cyclus-index en tijd binnen de cyclus
+    counts = n_row[cyc_row]
+    cyc_of = np.repeat(np.arange(len(cyc_row)), counts)
+    first = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    dt = (np.arange(len(cyc_of)) - first[cyc_of]) * step
+
+    p = params[cyc_row[cyc_of]]
+    xs = starts[cyc_of] + dt
+    ys = calculate_breath_y(dt, p[:, 0], p[:, 1], p[:, 2], p[:, 3])
+    xs.setflags(write=False)
+    ys.setflags(write=False)
+    return xs, ys
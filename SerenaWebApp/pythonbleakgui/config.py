@@ -5,6 +5,7 @@ import os
 SAMPLE_RATE = 130          # Polar H10 ECG ~130 Hz
 WINDOW_SECONDS = 120       # ringbufferlengte voor de grafiek
 DISPLAY_SECONDS = 10       # hoeveelheid die we rechts in beeld schuiven
+PLOT_INTERVAL_MS = 50      # verversing live-grafiek (blitting, zie live_plot.py)
 
 # --- Bestanden en Mappen ---
 # Let op: dubbele backslashes voor Windows paden
@@ -14,4 +15,10 @@ INDEX_FILE = os.path.join(PROTOCOL_DIR, "protocol_index.jsonl")
 # --- Ingest (Server) Defaults ---
 DEFAULT_INGEST_URL = "http://127.0.0.1:8000/ingest"
 DEFAULT_BATCH_MS = 250
-DEFAULT_BATCH_SIZE = 200
\ No newline at end of file
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_BINARY_ECG = False  # ECG als application/x-serena-ecg i.p.v. JSON (Backend /ingest)
+DEFAULT_COMPRESS = None  # "gzip" of "zstd": ingest-body comprimeren (Content-Encoding)
+PUMP_INTERVAL_MS = 100     # ECG-pakketten per batch naar ingest/recording/CSV
+PUMP_MAX_RECORDS = 10000   # wachtrij BLE -> pump; daarboven worden pakketten gedropt
+SPOOL_DIR = os.path.join(PROTOCOL_DIR, "spool")  # onverstuurde ingest-batches (zie spool.py)
+INGEST_MAX_IN_FLIGHT = 4   # gelijktijdige uploads (bij inhalen na storing 2x zoveel)
@@ -0,0 +1,182 @@
+# live_plot.py
+"""
+Live ECG-grafiek met blitting (gedeeld door main.py en mainGUI.py).
+
+- SampleRing: vooraf gealloceerde numpy-ring i.p.v. deque -> np.array(list(...))
+- LiveEcgPlot: artists worden één keer gemaakt en per frame met set_data
+  bijgewerkt. Statische delen (titel, labels, y-as, spines) staan in een
+  gecachte achtergrond; per frame alleen achtergrond terugzetten, x-as
+  (ticks + grid, die scrollen mee), ECG-lijn en HR-punten tekenen en blitten.
+  Een volledige canvas.draw() alleen bij nieuwe titel, y-bereik of HR aan/uit.
+- Decimatie: zichtbare samples worden teruggebracht tot min/max per
+  pixelkolom, dus nooit meer punten dan de grafiek breed is (x2).
+"""
+import threading
+
+import numpy as np
+
+
+class SampleRing:
+    """Thread-safe ringbuffer (BLE-thread schrijft, Tk-thread leest)"""
+
+    def __init__(self, maxlen: int):
+        self.maxlen = int(maxlen)
+        self._buf = np.zeros(self.maxlen)
+        self._pos = 0        # volgende schrijfpositie
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        with self._lock:
+            self._pos = 0
+            self._count = 0
+
+    def extend(self, values):
+        v = np.asarray(values, dtype=float)[-self.maxlen:]
+        n = len(v)
+        if n == 0:
+            return
+        with self._lock:
+            end = self._pos + n
+            if end <= self.maxlen:
+                self._buf[self._pos:end] = v
+            else:
+                k = self.maxlen - self._pos
+                self._buf[self._pos:] = v[:k]
+                self._buf[:n - k] = v[k:]
+            self._pos = end % self.maxlen
+            self._count = min(self.maxlen, self._count + n)
+
+    def latest(self, n=None) -> np.ndarray:
+        """Kopie van de laatste n samples (oudste eerst)"""
+        with self._lock:
+            n = self._count if n is None else min(int(n), self._count)
+            start = self._pos - n
+            if start >= 0:
+                return self._buf[start:self._pos].copy()
+            return np.concatenate((self._buf[start:], self._buf[:self._pos]))
+
+    def min_max(self):
+        with self._lock:
+            if self._count == 0:
+                return 0.0, 0.0
+            data = self._buf if self._count == self.maxlen else self._buf[:self._count]
+            return float(data.min()), float(data.max())
+
+
+def decimate_minmax(x: np.ndarray, y: np.ndarray, columns: int):
+    """Min/max per kolom (behoudt pieken); ongewijzigd als er al weinig punten zijn"""
+    columns = max(1, int(columns))
+    if len(y) <= 2 * columns:
+        return x, y
+    per = len(y) // columns
+    n = per * columns
+    skip = len(y) - n          # oudste samples vallen buiten de kolommen
+    yb = y[skip:].reshape(columns, per)
+    xb = x[skip:].reshape(columns, per)
+    lo_i = yb.argmin(axis=1)
+    hi_i = yb.argmax(axis=1)
+    first = np.minimum(lo_i, hi_i)
+    second = np.maximum(lo_i, hi_i)
+    rows = np.arange(columns)
+    xo = np.column_stack((xb[rows, first], xb[rows, second])).ravel()
+    yo = np.column_stack((yb[rows, first], yb[rows, second])).ravel()
+    return xo, yo
+
+
+class LiveEcgPlot:
+    Y_MARGIN = 0.05     # zoals matplotlib-autoscale
+    Y_SHRINK = 0.75     # y-bereik pas verkleinen als de data < 75% ervan beslaat
+
+    def __init__(self, canvas, ax, ax2, sample_rate: float, display_seconds: float):
+        self.canvas = canvas
+        self.fig = canvas.figure
+        self.ax = ax
+        self.ax2 = ax2
+        self.fs = float(sample_rate)
+        self.display_seconds = float(display_seconds)
+
+        self._title = None
+        self._hr_on = None
+        self._bg = None
+
+        ax.set_xlabel("Tijd (s)", color='white')
+        ax.set_ylabel("Amplitude (µV)", color='white')
+        ax.grid(True, alpha=0.5, color='gray')
+        ax.set_xlim(0.0, self.display_seconds)
+        (self.line,) = ax.plot([], [], color='cyan', linewidth=0.5, animated=True)
+        # x-as (ticks, labels, verticale grid) schuift mee -> per frame tekenen
+        ax.xaxis.set_animated(True)
+
+        ax2.set_ylabel("HR (BPM)", color='red')
+        ax2.set_ylim([40, 180])
+        ax2.tick_params(axis='y', labelcolor='red')
+        (self.hr_line,) = ax2.plot([], [], color='red', marker='.', linestyle='None', animated=True)
+
+        self._cid = canvas.mpl_connect("draw_event", self._on_draw)
+
+    # ---------- blitting ----------
+
+    def _on_draw(self, event):
+        """Na elke volledige draw (ook resize): nieuwe achtergrond + animated artists"""
+        self._bg = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        self.ax.draw_artist(self.ax.xaxis)
+        self.ax.draw_artist(self.line)
+        if self._hr_on:
+            self.ax2.draw_artist(self.hr_line)
+
+    def _blit(self):
+        self.canvas.restore_region(self._bg)
+        self._draw_animated()
+        self.canvas.blit(self.fig.bbox)
+
+    # ---------- data ----------
+
+    def _update_ylim(self, lo: float, hi: float) -> bool:
+        span = (hi - lo) or 1.0
+        want = (lo - self.Y_MARGIN * span, hi + self.Y_MARGIN * span)
+        cur = self.ax.get_ylim()
+        if want[0] >= cur[0] and want[1] <= cur[1] and (want[1] - want[0]) >= self.Y_SHRINK * (cur[1] - cur[0]):
+            return False
+        self.ax.set_ylim(want)
+        return True
+
+    def update(self, ring: SampleRing, t_end: float, title: str, hr_points=None):
+        """
+        ring: ECG-samples; t_end: tijd (s) van het laatste sample; hr_points:
+        (tijden_s, bpm) of None (HR-overlay uit).
+        """
+        full = False
+        if title != self._title:
+            self._title = title
+            self.ax.set_title(title, color='white')
+            full = True
+        hr_on = hr_points is not None
+        if hr_on != self._hr_on:
+            self._hr_on = hr_on
+            self.ax2.yaxis.set_visible(hr_on)
+            full = True
+
+        if len(ring) >= 2:
+            # x zoals voorheen: laatste sample op t_end, 1/fs ertussen
+            x_lim = (max(0.0, t_end - self.display_seconds), max(self.display_seconds, t_end))
+            y = ring.latest(int(self.display_seconds * self.fs) + 2)
+            x = t_end - (len(y) - 1 - np.arange(len(y))) / self.fs
+            cols = int(self.ax.bbox.width) or 1
+            self.line.set_data(*decimate_minmax(x, y, cols))
+            self.ax.set_xlim(x_lim)
+            full |= self._update_ylim(*ring.min_max())
+
+        if hr_on:
+            self.hr_line.set_data(*hr_points)
+
+        if full or self._bg is None:
+            self.canvas.draw()      # -> _on_draw: achtergrond + animated artists
+        else:
+            self._blit()
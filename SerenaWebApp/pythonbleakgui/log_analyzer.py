@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import argparse
+import io
 import json
 import glob
 import os
@@ -38,12 +39,20 @@ def parse_target_from_filename(filename):
     except Exception:
         return None
 
+def open_log(filepath):
+    """.jsonl, of .jsonl.zst (aaneengesloten zstd-frames) als tekststream"""
+    if filepath.lower().endswith(".zst"):
+        import zstandard  # pip install zstandard
+        reader = zstandard.ZstdDecompressor().stream_reader(open(filepath, "rb"), read_across_frames=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return open(filepath, 'r', encoding='utf-8')
+
 def analyze_file(filepath):
     est_rr_values = []
     version = "Onbekend"
     
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
+        with open_log(filepath) as f:
             for line in f:
                 line = line.strip()
                 if not line: continue
@@ -79,9 +88,8 @@ def main():
         print(f"[FOUT] Map bestaat niet: {args.folder}")
         return
 
-    # Zoek alle .jsonl bestanden
-    pattern = os.path.join(args.folder, "*.jsonl")
-    files = sorted(glob.glob(pattern))
+    # Zoek alle .jsonl en .jsonl.zst bestanden
+    files = sorted(glob.glob(os.path.join(args.folder, "*.jsonl")) + glob.glob(os.path.join(args.folder, "*.jsonl.zst")))
 
     if not files:
         print(f"[INFO] Geen .jsonl bestanden gevonden in {args.folder}")
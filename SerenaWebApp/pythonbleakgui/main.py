@@ -14,7 +14,6 @@ import time
 import csv
 import os
 import sys 
-import collections
 import traceback
 import numpy as np
 import json
@@ -27,13 +26,15 @@ import matplotlib
 matplotlib.use("TkAgg")
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.pyplot as plt
+from matplotlib.transforms import Affine2D
 
 # --- EIGEN MODULES ---
 import config
 from algorithms import RobustECGHRDetector
-from network import IngestClient
+from live_plot import LiveEcgPlot, SampleRing
+from network import IngestClient, RecordPump
 from theme import apply_dark_theme
-from breathing_logic import calculate_breath_y
+from breathing_logic import calculate_breath_y, generate_preview_data
 import manual_event_api 
 
 # ----------------------------- Globals --------------------------------
@@ -43,7 +44,7 @@ polar_device = None
 streaming = False          
 
 # Buffers & Detector
-ecg_buffer = collections.deque(maxlen=config.SAMPLE_RATE * config.WINDOW_SECONDS)
+ecg_buffer = SampleRing(config.SAMPLE_RATE * config.WINDOW_SECONDS)
 _hrdet = RobustECGHRDetector(sr_hz=config.SAMPLE_RATE)
 
 # Opslag en Logging
@@ -84,10 +85,12 @@ _row_start_time = 0.0
 _repeats_left = 0 
 _hist_x, _hist_y, _hist_last_t = [], [], 0.0
 _curve_past, _curve_future, _ball_dot, _last_plot_T = None, None, None, 0.0
+_curve_src = None                  # preview-array die nu in _curve_past staat
+_curve_shift = Affine2D()          # schuift de preview met de tijd mee (x relatief t.o.v. nu)
 
 # Nieuwe global voor de vooraf berekende lijn en snapshot data
-_preview_x = []
-_preview_y = []
+_preview_x = np.empty(0)
+_preview_y = np.empty(0)
 _active_protocol_data = [] 
 
 # -------------------- UI Logging Helpers --------------------------
@@ -149,6 +152,34 @@ def restart_program():
         print(f"Fout bij herstarten: {e}")
         sys.exit(1)
 
+# --- Sinks voor de ECG-stroom (draaien op de asyncio-loop, één batch per keer) ---
+def _sink_ingest(batch):
+    if ingest_client is not None:
+        ingest_client.extend(batch)
+
+def _sink_recording(batch):
+    f = recording_file
+    if f is not None:
+        f.write("".join(json.dumps(r) + '\n' for r in batch))
+        f.flush()
+
+def _sink_csv(batch):
+    f, writer = save_file, csv_writer
+    if writer is not None:
+        writer.writerows([r["ts"], s] for r in batch for s in r["samples"])
+        f.flush()
+
+record_pump = RecordPump(config.PUMP_INTERVAL_MS, config.PUMP_MAX_RECORDS, log_fn=ui_warn)
+record_pump.sinks.update(ingest=_sink_ingest, recording=_sink_recording, csv=_sink_csv)
+
+def _close_recording(f):
+    """Op de loop: eerst wat nog in de pump zit naar het bestand, dan sluiten"""
+    global recording_file
+    record_pump.pump_once()
+    if recording_file is f:
+        recording_file = None
+    f.close()
+
 # -------------------- Polar callbacks (DATA) --------------------------
 
 def on_data(data):
@@ -238,27 +269,9 @@ def on_data(data):
         # Stap C: Data toevoegen (samples achteraan ivm leesbaarheid)
         base_record["samples"] = samples
 
-        # 6. CSV Logging (Legacy format, blijft ongewijzigd)
-        if csv_writer:
-            for s in samples:
-                csv_writer.writerow([ts_ms, s])
-            save_file.flush()
-            
-        # 7. Frontend Recording (JSONL)
-        # We gebruiken hier een kopie van base_record zodat we zeker weten dat het de juiste structuur is
-        if recording_active and recording_file is not None:
-            try:
-                loop.call_soon_threadsafe(
-                    lambda: (recording_file.write(json.dumps(base_record) + '\n'), recording_file.flush()) 
-                    if recording_file else None
-                )
-            except Exception as e:
-                ui_error(f"[FE-LOG] Fout bij wegschrijven: {e}")
-                
-        # 8. Ingest Server
-        if ingest_client is not None:
-            # We sturen hetzelfde object door
-            loop.call_soon_threadsafe(asyncio.create_task, ingest_client.add(base_record))
+        # 6-8. CSV (legacy formaat), frontend recording (JSONL) en ingest server:
+        # één thread-safe overdracht, de pump-taak schrijft per batch (zie _sink_*)
+        record_pump.put(base_record)
 
         # 9. HR Detector update
         _hrdet.add_batch(ts_ms, samples)
@@ -323,6 +336,8 @@ async def do_disconnect():
     """
     global polar_device, save_file, csv_writer, streaming, ingest_client
     try:
+        # Wat nog in de pump zit eerst naar ingest/bestanden
+        record_pump.pump_once()
         if ingest_client is not None:
             try:
                 await ingest_client.__aexit__(None, None, None)
@@ -337,6 +352,7 @@ async def do_disconnect():
         
         streaming = False
         if save_file:
+            record_pump.pump_once()
             save_file.close()
             save_file, csv_writer = None, None
             
@@ -360,7 +376,10 @@ async def start_session():
             ingest_ms, ingest_sz = config.DEFAULT_BATCH_MS, config.DEFAULT_BATCH_SIZE
         try:
             ingest_client = await IngestClient(
-                url, batch_ms=ingest_ms, batch_size=ingest_sz, log_fn=ui_info
+                url, batch_ms=ingest_ms, batch_size=ingest_sz, log_fn=ui_info,
+                binary_ecg=config.DEFAULT_BINARY_ECG, fs=config.SAMPLE_RATE,
+                compress=config.DEFAULT_COMPRESS, spool_dir=config.SPOOL_DIR,
+                max_in_flight=config.INGEST_MAX_IN_FLIGHT, catchup_in_flight=2 * config.INGEST_MAX_IN_FLIGHT
             ).__aenter__()
             ui_info("Ingest (Server) gestart.")
         except Exception as e:
@@ -420,13 +439,12 @@ def start_recording():
         recording_active = False
 
 def stop_recording():
-    global recording_active, recording_file
+    global recording_active
     if not recording_active: return
     try:
-        if recording_file:
-            loop.call_soon_threadsafe(recording_file.close)
-            recording_file = None
         recording_active = False
+        if recording_file:
+            loop.call_soon_threadsafe(_close_recording, recording_file)
         ui_info("Frontend recording gestopt.")
         update_button_states()
     except Exception as e:
@@ -612,67 +630,24 @@ def clear_alerts():
 def update_plot():
     if not _running: return
     if len(ecg_buffer) < 2:
-        root.after(200, update_plot)
+        root.after(config.PLOT_INTERVAL_MS, update_plot)
         return
 
-    arr = np.array(list(ecg_buffer))
-    time_total = len(arr) / config.SAMPLE_RATE
-    x = np.linspace(time_total - len(arr)/config.SAMPLE_RATE, time_total, len(arr))
-    x_lim = (max(0.0, x[-1] - config.DISPLAY_SECONDS), x[-1])
-
-    ax.clear()
-    ax.set_title("Live ECG", color='white')
-    ax.set_xlabel("Tijd (s)", color='white')
-    ax.set_ylabel("Amplitude (µV)", color='white')
-    ax.plot(x, arr, color='cyan', linewidth=0.5)
-    ax.set_xlim(x_lim)
-    ax.grid(True, alpha=0.5, color='gray')
-
+    # HR-overlay: None = uit (rechter as verborgen)
+    hr_points = None
     if rr_display_var.get():
+        hr_points = ([], [])
         rr_list = _hrdet.rr_list_ms(200)
         if len(rr_list) >= 2:
             rr_times_ms = _hrdet.peak_times_ms[-len(rr_list):]
-            rr_times_s = np.array(rr_times_ms) / 1000.0
-            rr_bpm = [60000.0/r for r in rr_list]
-            ax2.clear()
-            ax2.set_ylabel("HR (BPM)", color='red')
-            ax2.plot(rr_times_s, rr_bpm, color='red', marker='.', linestyle='None')
-            ax2.set_ylim([40, 180])
-            ax2.tick_params(axis='y', labelcolor='red')
-            ax2.set_xlim(x_lim)
-    else:
-        ax2.clear()
-    canvas.draw()
-    root.after(200, update_plot)
+            # Let op: dit kan afwijken van de X-as als rr_times_ms absolute timestamps zijn
+            hr_points = (np.array(rr_times_ms) / 1000.0, [60000.0/r for r in rr_list])
 
-# ---------------------- Adem-animatie & Preview ----------------------
+    # Artists bestaan al; alleen data/x-as bijwerken en blitten (zie live_plot.py)
+    live_plot.update(ecg_buffer, len(ecg_buffer) / config.SAMPLE_RATE, "Live ECG", hr_points)
+    root.after(config.PLOT_INTERVAL_MS, update_plot)
 
-def generate_preview_data(protocol_data, duration=300.0, step=0.05):
-    if not protocol_data: return [], []
-    rows_data = protocol_data
-    total_protocol_time = sum([(r[0]+r[1]+r[2]+r[3])*r[4] for r in rows_data])
-    if total_protocol_time <= 0: return [], []
-
-    xs, ys = [], []
-    t = 0.0
-    row_idx = 0
-    while t < duration:
-        cycle_idx = row_idx % len(rows_data)
-        a, b, c, d, rep = rows_data[cycle_idx]
-        T = a + b + c + d
-        if T <= 0 or rep <= 0:
-            row_idx += 1
-            continue
-        for _ in range(rep):
-            if t >= duration: break
-            cycle_ts = np.arange(0, T, step)
-            for dt in cycle_ts:
-                y = calculate_breath_y(dt, a, b, c, d)
-                xs.append(t + dt)
-                ys.append(y)
-            t += T
-        row_idx += 1
-    return xs, ys
+# ---------------------- Adem-animatie & Preview ----------------------
 
 def breath_start():
     global _anim_running, _last_tick, _anim_time, breathing_active
@@ -784,6 +759,7 @@ split.add(text_box)
 fig, ax = plt.subplots(figsize=(10, 3))
 ax2 = ax.twinx()
 canvas = FigureCanvasTkAgg(fig, master=split)
+live_plot = LiveEcgPlot(canvas, ax, ax2, config.SAMPLE_RATE, config.DISPLAY_SECONDS)
 split.add(canvas.get_tk_widget())
 
 alerts_frame = ttk.Frame(root)
@@ -933,7 +909,7 @@ def _advance_if_needed(now_anim):
 
 def update_breath_plot():
     global _last_tick, _anim_time, _hist_x, _hist_y, _hist_last_t
-    global _curve_past, _curve_future, _ball_dot, _last_plot_T
+    global _curve_past, _curve_future, _ball_dot, _last_plot_T, _curve_src
     global _current_row_idx, _row_start_time, _repeats_left 
     global _active_protocol_data 
     if not _running: return
@@ -970,16 +946,16 @@ def update_breath_plot():
         apply_dark_theme(root, listbox, text_box, alerts_text, [fig, breath_fig], [ax, ax2, breath_ax, ax2_breath])
         breath_ax.set_ylim(-1.2, 1.2)
         breath_ax.grid(True, alpha=0.25, color='gray')
-        _curve_past, = breath_ax.plot([], [], linewidth=1.5, color='cyan', zorder=2)
+        _curve_past, = breath_ax.plot([], [], linewidth=1.5, color='cyan', zorder=2,
+                                      transform=_curve_shift + breath_ax.transData)
         _ball_dot = breath_ax.scatter([0], [0], s=50, zorder=3, color='#4a90e2')
-    if _preview_x:
-        px = np.array(_preview_x)
-        py = np.array(_preview_y)
-        mask = (px >= now_anim - window - 1) & (px <= now_anim + window + 1)
-        visible_x = px[mask]
-        visible_y = py[mask]
-        rel_x = visible_x - now_anim
-        _curve_past.set_data(rel_x, visible_y)
+        _curve_src = None
+    # Preview-data alleen zetten als het protocol gewijzigd is; per frame
+    # schuift alleen de transform mee (geen masker/kopie van 12k punten)
+    if _curve_src is not _preview_x:
+        _curve_past.set_data(_preview_x, _preview_y)
+        _curve_src = _preview_x
+    _curve_shift.clear().translate(-now_anim, 0)
     y_now = calculate_breath_y((now_anim - _row_start_time) % max(1e-6, T_active), a,b,c,d)
     _ball_dot.set_offsets(np.array([[0, y_now]]))
     breath_ax.set_xlim(-window, window)
@@ -1003,6 +979,7 @@ def on_closing():
     async def graceful_exit():
         # 1. Stop Ingest
         global ingest_client
+        await record_pump.stop()
         if ingest_client:
             try: await ingest_client.__aexit__(None, None, None)
             except: pass
@@ -1030,6 +1007,7 @@ def on_closing():
 root.protocol("WM_DELETE_WINDOW", on_closing)
 loop = asyncio.new_event_loop()
 threading.Thread(target=lambda: loop.run_forever(), daemon=True).start()
+loop.call_soon_threadsafe(record_pump.start)
 apply_dark_theme(root, listbox, text_box, alerts_text, [fig, breath_fig], [ax, ax2, breath_ax, ax2_breath])
 update_button_states()
 root.after(500, scan_clicked)
@@ -1,23 +1,185 @@
 # network.py
 import asyncio
+import collections
+import gzip
+import json
+import struct
 import aiohttp
+import numpy as np
+
+from spool import Spool, SpoolEntry
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Binair ECG-formaat (zie Backend app/utils/ecg_binary.py)
+ECG_BINARY_CONTENT_TYPE = "application/x-serena-ecg"
+_ECG_HEADER = struct.Struct("<4sBBBBqfI")
+_ECG_PLAIN_KEYS = {"signal", "ts", "samples", "device_id"}
+
+
+def encode_ecg_frame(samples, ts: int, device_id=None, fs: float = 0.0) -> bytes:
+    """Eén ECG-pakket als binair frame (int16 als het past, anders int32)."""
+    arr = np.asarray(samples, dtype=np.int64)
+    small = arr.size == 0 or (arr.min() >= -32768 and arr.max() <= 32767)
+    dev = (device_id or "").encode("utf-8")
+    header = _ECG_HEADER.pack(b"SECG", 1, 1 if small else 2, len(dev), 0, int(ts), float(fs), arr.size)
+    return header + dev + arr.astype("<i2" if small else "<i4").tobytes()
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    """Body comprimeren voor Content-Encoding 'gzip' of 'zstd'."""
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    return gzip.compress(body, compresslevel=5, mtime=0)
+
+
+class SpscQueue:
+    """
+    Begrensde overdracht van een producer-thread (BLE-callback, Tk) naar één
+    consumer-taak op de asyncio-loop. deque.append/popleft zijn atomair: geen
+    lock en geen call_soon_threadsafe/create_task per record, de consumer
+    haalt periodiek alles op. Vol -> record vervalt en `dropped` telt op.
+    """
+    def __init__(self, maxlen: int = 10000):
+        self.maxlen = max(1, int(maxlen))
+        self.dropped = 0
+        self._q = collections.deque()
+
+    def __len__(self):
+        return len(self._q)
+
+    def put(self, item) -> bool:
+        if len(self._q) >= self.maxlen:
+            self.dropped += 1
+            return False
+        self._q.append(item)
+        return True
+
+    def drain(self) -> list:
+        q = self._q
+        return [q.popleft() for _ in range(len(q))]
+
+
+class RecordPump:
+    """
+    Eén consumer voor de ECG-stroom: `put()` vanuit de BLE-callback; een taak op
+    de loop haalt elke `interval_ms` alles op en geeft het als één batch aan elke
+    sink (ingest, recording-bestand, CSV): één write + flush per batch i.p.v.
+    per pakket. Sinks zijn gewone functies fn(batch) en draaien op de loop.
+    """
+    def __init__(self, interval_ms: int = 100, maxlen: int = 10000, log_fn=None):
+        self.interval_s = max(10, int(interval_ms)) / 1000.0
+        self.queue = SpscQueue(maxlen)
+        self.sinks = {}           # naam -> fn(batch)
+        self._task = None
+        self._reported = 0
+        self._log = log_fn or (lambda s: None)
+
+    def put(self, rec: dict) -> bool:
+        """Thread-safe; False als de wachtrij vol is (record gedropt)"""
+        return self.queue.put(rec)
+
+    @property
+    def dropped(self) -> int:
+        return self.queue.dropped
+
+    def start(self):
+        """Op de loop aanroepen (bv. via loop.call_soon_threadsafe)"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.pump_once()
+
+    def pump_once(self) -> int:
+        batch = self.queue.drain()
+        if batch:
+            for name, fn in list(self.sinks.items()):
+                try:
+                    fn(batch)
+                except Exception as e:
+                    self._log(f"[PUMP] sink '{name}' fout: {e}")
+        if self.queue.dropped != self._reported:
+            self._log(f"[PUMP] {self.queue.dropped - self._reported} records gedropt (wachtrij vol)")
+            self._reported = self.queue.dropped
+        return len(batch)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_s)
+            self.pump_once()
+
 
 class IngestClient:
     """
     Simpele batched HTTP-ingest:
-    - `add(record)` stopt record in batch
-    - background task pusht elke `batch_ms` of zodra `batch_size` bereikt is
+    - `enqueue(record)` (thread-safe) of `extend(records)` (op de loop) stopt
+      records in de batch; `add(record)` blijft bestaan als coroutine
+    - background task (enige consumer) pusht elke `batch_ms` of zodra
+      `batch_size` bereikt is
+    - loopt het netwerk achter, dan worden boven `max_pending` wachtende records
+      de oudste weggegooid; `dropped` telt wat niet verstuurd is
+    - `binary_ecg=True`: kale ECG-pakketten gaan als application/x-serena-ecg,
+      overige records (en ECG met extra velden zoals TargetRR) blijven JSON
+    - `compress="gzip"|"zstd"`: body gecomprimeerd versturen (Content-Encoding)
+    - elke batch gaat eerst naar de spool (`spool_dir`, zie spool.py) en wordt
+      pas na een 2xx bevestigd; bij timeout/5xx/429 blijft hij staan en wordt
+      opnieuw geprobeerd (backoff, offline één probe tegelijk). Header
+      Idempotency-Key voorkomt dubbele records op de server.
+    - uploads lopen parallel tot `max_in_flight`; met achterstand (na een
+      storing of uit de spool van een vorige run) tot `catchup_in_flight`.
+      ECG gaat per device in een eigen batch en lane: per lane één upload
+      tegelijk, strikt in volgorde (de server-analyse verwacht ECG op
+      tijdvolgorde), een batch die opnieuw moet blijft vooraan zijn lane.
+      Parallel dus alleen tussen devices en voor niet-ECG.
     """
-    def __init__(self, url: str, batch_ms: int = 250, batch_size: int = 200, log_fn=None):
+    def __init__(self, url: str, batch_ms: int = 250, batch_size: int = 200, log_fn=None,
+                 binary_ecg: bool = False, fs: float = 0.0, compress=None,
+                 max_pending: int = 20000, spool_dir=None, max_in_flight: int = 4,
+                 catchup_in_flight: int = 8, retry_max_s: float = 30.0,
+                 close_timeout_s: float = 5.0):
         self.url = url
         self.batch_ms = max(50, int(batch_ms))
         self.batch_size = max(1, int(batch_size))
+        self.binary_ecg = bool(binary_ecg)
+        self.fs = float(fs)
         self._session = None
         self._task = None
         self._closed = False
         self._batch = []
         self._last_flush = 0.0
+        self.max_pending = max(self.batch_size, int(max_pending))
+        self.inbox = SpscQueue(self.max_pending)
+        self._trimmed = 0
+        self._reported = 0
+        self._wake = None
+        self.spool = Spool(spool_dir)
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.catchup_in_flight = max(self.max_in_flight, int(catchup_in_flight))
+        self.retry_max_s = float(retry_max_s)
+        self.close_timeout_s = float(close_timeout_s)
+        self.sent = 0               # bevestigde batches
+        self._queue = collections.deque()   # SpoolEntry's zonder lane die (opnieuw) verstuurd moeten worden
+        self._lanes = {}                    # lane -> deque van SpoolEntry's (ECG per device, op volgorde)
+        self._inflight = {}                 # upload-taak -> lane
+        self._uploader = None
+        self._kick = None
+        self._offline = False
+        self._retry_s = 0.0
+        self._retry_at = 0.0
         self._log = log_fn or (lambda s: None)
+        self.compress = (compress or "").lower() or None
+        if self.compress not in (None, "gzip", "zstd"):
+            raise ValueError(f"Onbekende compressie: {compress}")
+        if self.compress == "zstd" and zstandard is None:
+            self._log("[INGEST] zstandard niet geinstalleerd, val terug op gzip")
+            self.compress = "gzip"
 
     async def __aenter__(self):
         self._session = aiohttp.ClientSession(
@@ -25,42 +187,233 @@ class IngestClient:
             timeout=aiohttp.ClientTimeout(total=10)
         )
         self._closed = False
+        self._wake = asyncio.Event()
+        self._kick = asyncio.Event()
         self._last_flush = asyncio.get_event_loop().time()
+        try:
+            recovered = self.spool.recover()
+        except OSError as e:
+            recovered = []
+            self._log(f"[INGEST ERR] spool niet leesbaar: {e}")
+        if recovered:
+            for entry in recovered:
+                self._enqueue(entry)
+            self._log(f"[INGEST] {len(recovered)} batches uit de spool worden nagestuurd")
         self._task = asyncio.create_task(self._flush_loop())
+        self._uploader = asyncio.create_task(self._upload_loop())
         self._log(f"[INGEST] Actief: {self.url} (batch {self.batch_size} / {self.batch_ms}ms)")
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
         self._closed = True
+        if self._wake is not None:
+            self._wake.set()
         if self._task:
             await self._task
+        if self._uploader:
+            # Laatste batches nog proberen; wat niet lukt blijft in de spool
+            self._kick.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._uploader), timeout=self.close_timeout_s)
+            except asyncio.TimeoutError:
+                for t in [self._uploader, *self._inflight]:
+                    t.cancel()
+                await asyncio.gather(self._uploader, *self._inflight, return_exceptions=True)
+        self.spool.close()
+        if len(self.spool):
+            self._log(f"[INGEST] {len(self.spool)} batches blijven in de spool (volgende start)")
         if self._session:
             await self._session.close()
         self._log("[INGEST] Gesloten.")
 
+    @property
+    def dropped(self) -> int:
+        return self.inbox.dropped + self._trimmed
+
+    def enqueue(self, rec: dict) -> bool:
+        """Thread-safe (BLE-callback, Tk-thread); False als de inbox vol is"""
+        return self.inbox.put(rec)
+
+    def extend(self, records: list):
+        """Op de loop: records direct in de batch (bv. vanuit RecordPump)"""
+        self._batch.extend(records)
+        self._trim()
+        if len(self._batch) >= self.batch_size and self._wake is not None:
+            self._wake.set()
+
     async def add(self, rec: dict):
-        self._batch.append(rec)
-        now = asyncio.get_event_loop().time()
-        if len(self._batch) >= self.batch_size or (now - self._last_flush) >= (self.batch_ms/1000.0):
-            await self._send_batch()
+        self.extend([rec])
+
+    def _trim(self):
+        over = len(self._batch) - self.max_pending
+        if over > 0:
+            del self._batch[:over]
+            self._trimmed += over
 
     async def _flush_loop(self):
         while not self._closed:
-            await asyncio.sleep(self.batch_ms/1000.0)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.batch_ms/1000.0)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            self._batch.extend(self.inbox.drain())
+            self._trim()
             if self._batch:
                 await self._send_batch()
+            if self.dropped != self._reported:
+                self._log(f"[INGEST] {self.dropped - self._reported} records gedropt (netwerk loopt achter)")
+                self._reported = self.dropped
+        self._batch.extend(self.inbox.drain())
         if self._batch:
             await self._send_batch()
 
     async def _send_batch(self):
-        assert self._session is not None
+        """Batch coderen en in de spool zetten; de upload-taak verstuurt"""
         batch = self._batch
         self._batch = []
         self._last_flush = asyncio.get_event_loop().time()
+        # ECG per device apart (eigen lane), de rest samen
+        ecg, other = {}, []
+        for r in batch:
+            if r.get("signal") == "ecg":
+                ecg.setdefault(r.get("device_id"), []).append(r)
+            else:
+                other.append(r)
+        for device_id, records in ecg.items():
+            lane = f"ecg:{device_id or ''}"
+            if self.binary_ecg:
+                frames = [r for r in records if r.keys() <= _ECG_PLAIN_KEYS]
+                if frames:
+                    body = b"".join(
+                        encode_ecg_frame(r.get("samples") or [], r.get("ts", 0), r.get("device_id"), self.fs)
+                        for r in frames
+                    )
+                    self._submit(body, ECG_BINARY_CONTENT_TYPE, lane)
+                    records = [r for r in records if not r.keys() <= _ECG_PLAIN_KEYS]
+            if records:
+                self._submit(json.dumps(records, separators=(",", ":")).encode("utf-8"), "application/json", lane)
+        if other:
+            self._submit(json.dumps(other, separators=(",", ":")).encode("utf-8"), "application/json")
+
+    def _submit(self, body: bytes, content_type: str, lane=None):
+        if self.compress:
+            body = compress_body(body, self.compress)
         try:
-            async with self._session.post(self.url, json=batch) as r:
-                if r.status >= 300:
+            entry = self.spool.append(body, content_type, self.compress, lane)
+        except OSError as e:
+            self._log(f"[INGEST ERR] spool schrijven mislukt, batch verloren: {e}")
+            return
+        self._enqueue(entry)
+        self._kick.set()
+
+    def _enqueue(self, entry: SpoolEntry):
+        if entry.lane is None:
+            self._queue.append(entry)
+        else:
+            self._lanes.setdefault(entry.lane, collections.deque()).append(entry)
+
+    def _requeue(self, entry: SpoolEntry):
+        """Terug vooraan: de lane stond nog bezet, dus niets is hem voorbijgegaan"""
+        if entry.lane is None:
+            self._queue.appendleft(entry)
+        else:
+            self._lanes.setdefault(entry.lane, collections.deque()).appendleft(entry)
+
+    @property
+    def backlog(self) -> int:
+        """Batches die wachten op (opnieuw) versturen"""
+        return len(self._queue) + sum(len(q) for q in self._lanes.values())
+
+    # ---------- upload (pipelined, met retry) ----------
+
+    async def _upload_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if now >= self._retry_at:
+                # offline: één probe tegelijk; achterstand: groter venster (inhalen)
+                if self._offline:
+                    window = 1
+                elif self.backlog > self.max_in_flight:
+                    window = self.catchup_in_flight
+                else:
+                    window = self.max_in_flight
+                # lanes: alleen de oudste batch, en pas als de vorige klaar is
+                busy = set(self._inflight.values())
+                for lane, queue in list(self._lanes.items()):
+                    if len(self._inflight) >= window:
+                        break
+                    if lane in busy:
+                        continue
+                    if queue:
+                        self._start_upload(queue.popleft())
+                    else:
+                        del self._lanes[lane]
+                while self._queue and len(self._inflight) < window:
+                    self._start_upload(self._queue.popleft())
+            backlog = self.backlog
+            if self._closed and self._task.done() and not backlog and not self._inflight:
+                return
+            self._kick.clear()
+            timeout = max(0.01, self._retry_at - now) if backlog and now < self._retry_at else None
+            try:
+                await asyncio.wait_for(self._kick.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start_upload(self, entry: SpoolEntry):
+        t = asyncio.create_task(self._upload(entry))
+        self._inflight[t] = entry.lane
+        t.add_done_callback(self._upload_done)
+
+    def _upload_done(self, task):
+        self._inflight.pop(task, None)
+        self._kick.set()
+
+    async def _upload(self, entry: SpoolEntry):
+        try:
+            body = self.spool.read(entry)
+        except OSError as e:
+            self._log(f"[INGEST ERR] spool lezen mislukt, batch {entry.key} overgeslagen: {e}")
+            self.spool.ack(entry)
+            return
+        headers = {"Content-Type": entry.content_type, "Idempotency-Key": entry.key}
+        if entry.encoding:
+            headers["Content-Encoding"] = entry.encoding
+        txt = ""
+        try:
+            async with self._session.post(self.url, data=body, headers=headers) as r:
+                status = r.status
+                retry_after = r.headers.get("Retry-After")
+                if status >= 300:
                     txt = await r.text()
-                    self._log(f"[INGEST ERR] {r.status}: {txt[:300]}")
         except Exception as e:
-            self._log(f"[INGEST ERR] {e}")
\ No newline at end of file
+            self._retry(entry, str(e) or type(e).__name__)
+            return
+        if status < 300:
+            self.spool.ack(entry)
+            self.sent += 1
+            self._retry_s = 0.0
+            if self._offline:
+                self._offline = False
+                self._log(f"[INGEST] Verbinding hersteld, {self.backlog} batches uit de spool inhalen")
+        elif status in (408, 429) or status >= 500:
+            self._retry(entry, f"{status}: {txt[:300]}", retry_after)
+        else:
+            # Client-fout: opnieuw sturen helpt niet -> loggen en uit de spool
+            self._log(f"[INGEST ERR] {status}: {txt[:300]}")
+            self.spool.ack(entry)
+
+    def _retry(self, entry: SpoolEntry, reason: str, retry_after=None):
+        self._requeue(entry)
+        self._retry_s = min(self.retry_max_s, self._retry_s * 2 or 1.0)
+        delay = self._retry_s
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        self._retry_at = asyncio.get_running_loop().time() + delay
+        if not self._offline:
+            self._offline = True
+            self._log(f"[INGEST ERR] {reason}; offline, batches blijven in de spool (opnieuw over {delay:.0f}s)")
@@ -0,0 +1,181 @@
+# spool.py
+"""
+Append-only schijfspool voor ingest-batches (offline buffer van IngestClient).
+
+- Elke batch krijgt een volgnummer (seq) en wordt eerst hier weggeschreven,
+  pas daarna verstuurd. Na een 2xx-antwoord wordt hij bevestigd (ack).
+- Segmenten: <run_id>_<eerste seq>.spool, records: header <QIBBB> (seq,
+  lengte body, lengte content-type, lengte encoding, lengte lane)
+  + content-type + encoding + lane + body (body zoals verstuurd, evt.
+  gecomprimeerd).
+- lane: batches met dezelfde lane (ECG van één device) moeten in volgorde
+  aankomen; None = volgorde maakt niet uit.
+- <segment>.ack: bevestigde seqs (8 bytes per stuk). Een segment waarvan
+  alles bevestigd is wordt verwijderd.
+- Idempotency key = <run_id>-<seq>: uniek per run, blijft gelijk als een
+  batch na een herstart uit de spool opnieuw verstuurd wordt.
+- Bij openen wordt altijd een nieuw segment begonnen; een half geschreven
+  laatste record (crash) wordt bij herstel genegeerd.
+
+directory=None: alleen in het geheugen (geen herstel na afsluiten).
+"""
+import os
+import struct
+import uuid
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set
+
+_HEAD = struct.Struct("<QIBBB")
+_ACK = struct.Struct("<Q")
+SEGMENT_SUFFIX = ".spool"
+ACK_SUFFIX = ".ack"
+
+
+class SpoolEntry(NamedTuple):
+    key: str                 # idempotency key (<run_id>-<seq>)
+    seq: int
+    segment: Optional[Path]
+    offset: int              # offset van de body in het segment
+    length: int
+    content_type: str
+    encoding: Optional[str]
+    lane: Optional[str] = None
+
+
+class Spool:
+    def __init__(self, directory=None, segment_bytes: int = 4 * 1024 * 1024):
+        self.dir = Path(directory) if directory else None
+        self.segment_bytes = max(64 * 1024, int(segment_bytes))
+        self.run_id = uuid.uuid4().hex[:12]
+        self._seq = 0
+        self._fh = None
+        self._cur: Optional[Path] = None
+        self._cur_size = 0
+        self._open: Dict[Optional[Path], Set[int]] = {}   # segment -> onbevestigde seqs
+        self._mem: Dict[int, bytes] = {}                   # alleen zonder directory
+        if self.dir is not None:
+            self.dir.mkdir(parents=True, exist_ok=True)
+
+    def __len__(self):
+        return sum(len(s) for s in self._open.values())
+
+    # ---------- schrijven ----------
+
+    def append(self, body: bytes, content_type: str, encoding: Optional[str] = None,
+               lane: Optional[str] = None) -> SpoolEntry:
+        seq = self._seq
+        self._seq += 1
+        key = f"{self.run_id}-{seq}"
+        if self.dir is None:
+            self._mem[seq] = body
+            self._open.setdefault(None, set()).add(seq)
+            return SpoolEntry(key, seq, None, 0, len(body), content_type, encoding, lane)
+
+        if self._fh is None or self._cur_size >= self.segment_bytes:
+            self._roll(seq)
+        ct, enc = content_type.encode("utf-8"), (encoding or "").encode("utf-8")
+        ln = (lane or "").encode("utf-8")
+        head = _HEAD.pack(seq, len(body), len(ct), len(enc), len(ln)) + ct + enc + ln
+        self._fh.write(head + body)
+        self._fh.flush()
+        offset = self._cur_size + len(head)
+        self._cur_size += len(head) + len(body)
+        self._open.setdefault(self._cur, set()).add(seq)
+        return SpoolEntry(key, seq, self._cur, offset, len(body), content_type, encoding, lane)
+
+    def _roll(self, first_seq: int):
+        prev = self._cur
+        if self._fh is not None:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._fh.close()
+        self._cur = self.dir / f"{self.run_id}_{first_seq:010d}{SEGMENT_SUFFIX}"
+        self._fh = open(self._cur, "ab")
+        self._cur_size = 0
+        if prev is not None and not self._open.get(prev):
+            self._remove(prev)
+
+    # ---------- lezen / bevestigen ----------
+
+    def read(self, entry: SpoolEntry) -> bytes:
+        if entry.segment is None:
+            return self._mem[entry.seq]
+        with open(entry.segment, "rb") as f:
+            f.seek(entry.offset)
+            return f.read(entry.length)
+
+    def ack(self, entry: SpoolEntry):
+        pending = self._open.get(entry.segment)
+        if pending is None or entry.seq not in pending:
+            return
+        pending.discard(entry.seq)
+        if entry.segment is None:
+            self._mem.pop(entry.seq, None)
+            return
+        if not pending and entry.segment != self._cur:
+            self._remove(entry.segment)
+            return
+        with open(str(entry.segment) + ACK_SUFFIX, "ab") as f:
+            f.write(_ACK.pack(entry.seq))
+
+    def _remove(self, segment: Path):
+        self._open.pop(segment, None)
+        for p in (segment, Path(str(segment) + ACK_SUFFIX)):
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+
+    # ---------- herstel / afsluiten ----------
+
+    def recover(self) -> List[SpoolEntry]:
+        """Onbevestigde batches van eerdere runs (oudste eerst)"""
+        if self.dir is None:
+            return []
+        out: List[SpoolEntry] = []
+        segments = sorted(self.dir.glob(f"*{SEGMENT_SUFFIX}"), key=lambda p: (p.stat().st_mtime, p.name))
+        for seg in segments:
+            if seg == self._cur:
+                continue
+            run_id = seg.name.split("_", 1)[0]
+            acked = set()
+            ack_path = Path(str(seg) + ACK_SUFFIX)
+            if ack_path.exists():
+                data = ack_path.read_bytes()
+                acked = {s for (s,) in _ACK.iter_unpack(data[:len(data) - len(data) % _ACK.size])}
+            entries = []
+            with open(seg, "rb") as f:
+                data = f.read()
+            pos = 0
+            while pos + _HEAD.size <= len(data):
+                seq, n, n_ct, n_enc, n_lane = _HEAD.unpack_from(data, pos)
+                p_ct = pos + _HEAD.size
+                p_enc = p_ct + n_ct
+                p_lane = p_enc + n_enc
+                start = p_lane + n_lane
+                if start + n > len(data):
+                    break        # half geschreven (crash)
+                ct = data[p_ct:p_enc].decode("utf-8")
+                enc = data[p_enc:p_lane].decode("utf-8") or None
+                lane = data[p_lane:start].decode("utf-8") or None
+                if seq not in acked:
+                    entries.append(SpoolEntry(f"{run_id}-{seq}", seq, seg, start, n, ct, enc, lane))
+                pos = start + n
+            if entries:
+                self._open[seg] = {e.seq for e in entries}
+                out += entries
+            else:
+                self._remove(seg)
+        return out
+
+    def close(self):
+        """Huidig segment sluiten (fsync); volledig bevestigd -> verwijderen"""
+        if self._fh is None:
+            return
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._fh.close()
+        self._fh = None
+        cur, self._cur = self._cur, None
+        if not self._open.get(cur):
+            self._remove(cur)
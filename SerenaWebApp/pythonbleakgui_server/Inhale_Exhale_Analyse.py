@@ -5,19 +5,21 @@ import tkinter as tk
 from tkinter import filedialog, scrolledtext, messagebox
 from typing import List, Dict, Optional
 
+import serena_log
+
 # --- 1. Kern Analyse Functie (Overgenomen en aangepast van de eerdere stap) ---
 
 def analyze_file_intervals(file_path: str) -> Optional[Dict]:
     """
-    Analyseert de ademhalingsintervallen ('I' en 'E') in een enkel JSONL-bestand.
+    Analyseert de ademhalingsintervallen ('I' en 'E') in een enkel JSONL-bestand
+    (.jsonl of .jsonl.zst; van een .zst worden alleen de resp_rr-frames gelezen).
     Filtert de eerste 30 seconden (starttijd wordt bepaald door de eerste 'ts').
     """
     
     filename = os.path.basename(file_path)
     
     try:
-        with open(file_path, 'r') as f:
-            file_content = f.readlines()
+        resp_records = list(serena_log.iter_records(file_path, ["resp_rr"]))
     except Exception as e:
         return {
             "Bestandsnaam": filename,
@@ -37,19 +39,13 @@ def analyze_file_intervals(file_path: str) -> Optional[Dict]:
     parsed_data = []
     first_timestamp = None
 
-    for line in file_content:
-        if line.strip():
-            try:
-                record = json.loads(line)
-                if record.get("signal") == "resp_rr":
-                    if first_timestamp is None:
-                        first_timestamp = record["ts"]
-                    
-                    # Filter de eerste 30 seconden (30000 milliseconden)
-                    if first_timestamp is not None and record["ts"] - first_timestamp > 30000:
-                        parsed_data.append(record)
-            except json.JSONDecodeError:
-                continue # Sla niet-JSON regels over
+    for record in resp_records:
+        if first_timestamp is None:
+            first_timestamp = record["ts"]
+
+        # Filter de eerste 30 seconden (30000 milliseconden)
+        if first_timestamp is not None and record["ts"] - first_timestamp > 30000:
+            parsed_data.append(record)
 
     if not parsed_data:
         return {
@@ -152,7 +148,7 @@ class LogFileAnalyzer(tk.Tk):
             self.current_log_dir.set(new_dir)
 
     def run_analysis(self):
-        """Voert de analyse uit op alle .jsonl bestanden in de geselecteerde map."""
+        """Voert de analyse uit op alle .jsonl(.zst) bestanden in de geselecteerde map."""
         log_dir = self.current_log_dir.get()
         self.output_text.delete(1.0, tk.END)
         self.output_text.insert(tk.END, f"Start analyse in map: {log_dir}\n\n")
@@ -162,8 +158,8 @@ class LogFileAnalyzer(tk.Tk):
             self.output_text.insert(tk.END, "FOUT: Map bestaat niet of is ontoegankelijk.")
             return
 
-        # Zoek alle .jsonl bestanden
-        all_files = [f for f in os.listdir(log_dir) if f.endswith('.jsonl')]
+        # Zoek alle .jsonl / .jsonl.zst bestanden
+        all_files = [f for f in os.listdir(log_dir) if serena_log.is_log_file(f)]
         
         if not all_files:
             self.output_text.insert(tk.END, "Geen .jsonl bestanden gevonden in deze map.")
@@ -21,8 +21,8 @@ if __name__ == "__main__":
     path = sys.argv[1]
 
     if os.path.isdir(path):
-        # Als het een map is → verwerk alle .jsonl-bestanden
-        jsonl_files = [os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(".jsonl")]
+        # Als het een map is → verwerk alle .jsonl- en .jsonl.zst-bestanden
+        jsonl_files = [os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith((".jsonl", ".jsonl.zst"))]
         if not jsonl_files:
             print(f"❌ Geen .jsonl-bestanden gevonden in {path}")
             raise SystemExit(1)
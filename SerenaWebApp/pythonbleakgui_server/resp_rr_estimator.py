@@ -168,29 +168,37 @@ def _estimate_bpm_from_section(section: np.ndarray, rr_med_ms: float, cfg: Dict)
         if bpm_min <= bpm2 <= bpm_max: bpm = bpm2
     return float(bpm)
 
+def _iter_jsonl(path: str):
+    if path.lower().endswith(".zst"):
+        # .jsonl.zst: alleen de ECG-frames (en regels zonder signaal) decomprimeren
+        import serena_log
+        yield from serena_log.iter_records(path, ["ecg", "?"])
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            s = line.strip()
+            if s:
+                yield json.loads(s)
+
 def _load_jsonl_signal(path: str):
-    # (Ongewijzigd, standaard laadfunctie)
+    # Standaard laadfunctie (.jsonl of .jsonl.zst)
     all_samples: List[int] = []
     ts_list: List[int] = []
     per_sample_t: List[float] = []
     block_sizes: List[int] = []
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            s = line.strip()
-            if not s: continue
-            rec = json.loads(s)
-            if "samples" in rec and isinstance(rec["samples"], list):
-                all_samples.extend(int(v) for v in rec["samples"])
-                block_sizes.append(len(rec["samples"]))
-                if "ts" in rec:
-                    ts_list.append(int(rec["ts"]))
-            elif "ecg" in rec:
-                all_samples.append(int(rec["ecg"]))
-                if "timestamp" in rec:
-                    try:
-                        per_sample_t.append(float(rec["timestamp"]))
-                    except Exception:
-                        pass
+    for rec in _iter_jsonl(path):
+        if "samples" in rec and isinstance(rec["samples"], list):
+            all_samples.extend(int(v) for v in rec["samples"])
+            block_sizes.append(len(rec["samples"]))
+            if "ts" in rec:
+                ts_list.append(int(rec["ts"]))
+        elif "ecg" in rec:
+            all_samples.append(int(rec["ecg"]))
+            if "timestamp" in rec:
+                try:
+                    per_sample_t.append(float(rec["timestamp"]))
+                except Exception:
+                    pass
     if not all_samples:
         raise ValueError("Geen ECG-samples in JSONL gevonden.")
     fs_est = None
@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+"""
+serena_log.py - sessielogs lezen (en omzetten): .jsonl of .jsonl.zst
+
+Formaat .jsonl.zst (server met LOG_FORMAT=zstd, of `serena_log.py compress`):
+- Aaneengesloten, onafhankelijke zstd-frames. Elk frame bevat hele
+  JSONL-regels van één signaal, in volgorde; `zstd -dc bestand` geeft
+  gewoon JSONL (per signaal op volgorde, signalen per frame door elkaar).
+- Sidecar <bestand>.idx: per frame één JSON-regel
+    {"off": byte-offset, "len": gecomprimeerde lengte, "n": regels,
+     "signals": ["resp_rr"], "ts0": eerste ts, "ts1": laatste ts,
+     "seq0": schrijfvolgnummer eerste regel, "dseq": [verschil per volgende regel]}
+  Ontbreekt de index (of mist het staartstuk na een crash), dan worden
+  de frames gescand (zonder volgnummers).
+- Schrijfvolgorde: iter_records(ordered=True) voegt de signalen samen op
+  volgnummer, dus in dezelfde volgorde als de platte .jsonl. Frames zonder
+  volgnummer (oude bestanden, gescande staart) volgen op ts.
+
+Lezen zonder alles te decoderen:
+    iter_records(path, signals={"resp_rr"})             alleen resp_rr-frames
+    iter_records(path, t0=first_ts(path) + 30_000)      vanaf 30 s
+    tail(path, "resp_rr", 20)                           laatste 20 schattingen
+Platte .jsonl-bestanden werken met dezelfde functies (dan wel volledig gelezen).
+
+CLI:
+    python serena_log.py cat LOG [--signal resp_rr] [--from-s 30] [--to-s 60] [--ordered]
+    python serena_log.py tail LOG --signal resp_rr [-n 20]
+    python serena_log.py index LOG.jsonl.zst          (sidecar opnieuw opbouwen)
+    python serena_log.py compress LOG.jsonl [...]      (-> LOG.jsonl.zst + .idx)
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import json
+import os
+import re
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LOG_SUFFIXES = (".jsonl", ".jsonl.zst")
+ZST_SUFFIX = ".zst"
+INDEX_SUFFIX = ".idx"
+HEADER_SIGNAL = "parameters"
+
+# Frame-grenzen: per signaal max zoveel ruwe bytes of ts-bereik (ms); ~5x kleiner dan .jsonl
+FRAME_BYTES = 256 * 1024
+FRAME_SPAN_MS = 30_000
+ZSTD_LEVEL = 3
+
+# Schrijfvolgnummers: procesbreed oplopend, beginnend bij de huidige tijd in µs,
+# zodat een later proces dat aan hetzelfde bestand toevoegt hoger uitkomt
+_SEQ = itertools.count(time.time_ns() // 1000)
+# Header (parameters-regel) staat altijd vooraan
+HEADER_SEQ = -1
+
+_SIGNAL_RE = re.compile(rb'"signal":\s*"([^"]*)"')
+_TS_RE = re.compile(rb'"ts":\s*(-?\d+)')
+
+
+def is_log_file(name: str) -> bool:
+    return name.lower().endswith(LOG_SUFFIXES)
+
+
+def find_logs(folder: str, recursive: bool = False) -> List[str]:
+    """Alle .jsonl/.jsonl.zst logs in een map (gesorteerd)"""
+    out = []
+    if recursive:
+        for root, _, files in os.walk(folder):
+            out += [os.path.join(root, f) for f in files if is_log_file(f)]
+    else:
+        out = [os.path.join(folder, f) for f in os.listdir(folder) if is_log_file(f)]
+    return sorted(out)
+
+
+def _require_zstd():
+    if zstandard is None:
+        raise RuntimeError("Voor .jsonl.zst logs is het pakket 'zstandard' nodig (pip install zstandard)")
+
+
+def line_meta(line: bytes) -> Tuple[str, Optional[int]]:
+    """(signal, ts) van een JSONL-regel zonder volledige JSON-decode"""
+    m = _SIGNAL_RE.search(line)
+    if m:
+        signal = m.group(1).decode("utf-8", "replace")
+    else:
+        signal = HEADER_SIGNAL if b'"parameters"' in line else "?"
+    t = _TS_RE.search(line)
+    return signal, (int(t.group(1)) if t else None)
+
+
+# ---------------------------------------------------------------------------
+# Schrijven (gedeeld met server/log_writer.py)
+# ---------------------------------------------------------------------------
+
+class _OpenFrame:
+    __slots__ = ("lines", "seqs", "size", "ts0", "ts1", "opened")
+
+    def __init__(self, opened: float):
+        self.lines: List[bytes] = []
+        self.seqs: List[int] = []
+        self.size = 0
+        self.ts0: Optional[int] = None
+        self.ts1: Optional[int] = None
+        self.opened = opened
+
+
+class FrameBuffer:
+    """
+    Verzamelt regels per signaal tot een frame vol is (FRAME_BYTES ruwe bytes
+    of FRAME_SPAN_MS ts-bereik), of - met max_age_s - te lang open staat.
+    Gesloten frames: (signal, lines, ts0, ts1, seqs); seqs = schrijfvolgnummer
+    per regel, in volgorde van add().
+    """
+
+    def __init__(self, frame_bytes: int = FRAME_BYTES, span_ms: int = FRAME_SPAN_MS):
+        self.frame_bytes = frame_bytes
+        self.span_ms = span_ms
+        self._open: Dict[str, _OpenFrame] = {}
+
+    def add(self, signal: str, ts: Optional[int], line: bytes, now: float = 0.0) -> List[tuple]:
+        closed = []
+        fr = self._open.get(signal)
+        if fr is not None and ts is not None and fr.ts0 is not None and ts - fr.ts0 >= self.span_ms:
+            closed.append(self._close(signal))
+            fr = None
+        if fr is None:
+            fr = self._open[signal] = _OpenFrame(now)
+        fr.lines.append(line)
+        fr.seqs.append(next(_SEQ))
+        fr.size += len(line)
+        if ts is not None:
+            if fr.ts0 is None:
+                fr.ts0 = ts
+            fr.ts1 = ts
+        if fr.size >= self.frame_bytes:
+            closed.append(self._close(signal))
+        return closed
+
+    def take_due(self, now: float, max_age_s: float) -> List[tuple]:
+        """Frames die langer dan max_age_s open staan (levende writer)"""
+        return [self._close(s) for s, fr in list(self._open.items()) if now - fr.opened >= max_age_s]
+
+    def take_all(self) -> List[tuple]:
+        return [self._close(s) for s in list(self._open)]
+
+    def _close(self, signal: str) -> tuple:
+        fr = self._open.pop(signal)
+        return signal, fr.lines, fr.ts0, fr.ts1, fr.seqs
+
+    def __bool__(self) -> bool:
+        return bool(self._open)
+
+
+def encode_frame(cctx, frame: tuple, offset: int) -> Tuple[bytes, dict]:
+    """Gesloten frame (signal, lines, ts0, ts1[, seqs]) -> (zstd-bytes, indexregel)"""
+    signal, lines, ts0, ts1 = frame[:4]
+    seqs = frame[4] if len(frame) > 4 else None
+    data = cctx.compress(b"".join(lines))
+    entry = {"off": offset, "len": len(data), "n": len(lines), "signals": [signal], "ts0": ts0, "ts1": ts1}
+    if seqs:
+        entry["seq0"] = seqs[0]
+        entry["dseq"] = [b - a for a, b in zip(seqs, seqs[1:])]
+    return data, entry
+
+
+def index_line(entry: dict) -> bytes:
+    return (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+def _is_zst(path: str) -> bool:
+    return path.lower().endswith(ZST_SUFFIX)
+
+
+def _frame_entries(data: bytes, offset: int) -> Iterator[Tuple[dict, bytes]]:
+    """Frames in data vanaf offset scannen; een afgebroken laatste frame wordt genegeerd"""
+    _require_zstd()
+    dctx = zstandard.ZstdDecompressor()
+    pos = 0
+    while pos < len(data):
+        dobj = dctx.decompressobj()
+        try:
+            raw = dobj.decompress(data[pos:])
+        except zstandard.ZstdError:
+            break
+        if not dobj.eof:
+            break
+        used = len(data) - pos - len(dobj.unused_data)
+        lines = [ln for ln in raw.splitlines(True) if ln.strip()]
+        metas = [line_meta(ln) for ln in lines]
+        ts = [t for _, t in metas if t is not None]
+        entry = {
+            "off": offset + pos, "len": used, "n": len(lines),
+            "signals": sorted({s for s, _ in metas}),
+            "ts0": ts[0] if ts else None, "ts1": ts[-1] if ts else None,
+        }
+        yield entry, raw
+        pos += used
+
+
+def read_index(path: str) -> List[dict]:
+    """Frame-index van een .jsonl.zst (sidecar, aangevuld met een scan van de staart)"""
+    entries: List[dict] = []
+    idx_path = path + INDEX_SUFFIX
+    size = os.path.getsize(path)
+    if os.path.exists(idx_path):
+        with open(idx_path, "rb") as f:
+            for line in f:
+                try:
+                    e = json.loads(line)
+                except ValueError:
+                    break
+                if e["off"] + e["len"] > size:
+                    break
+                entries.append(e)
+    end = entries[-1]["off"] + entries[-1]["len"] if entries else 0
+    if end < size:
+        with open(path, "rb") as f:
+            f.seek(end)
+            entries += [e for e, _ in _frame_entries(f.read(), end)]
+    return entries
+
+
+def write_index(path: str) -> int:
+    """Sidecar opnieuw opbouwen door alle frames te scannen"""
+    with open(path, "rb") as f:
+        entries = [e for e, _ in _frame_entries(f.read(), 0)]
+    with open(path + INDEX_SUFFIX, "wb") as f:
+        f.writelines(index_line(e) for e in entries)
+    return len(entries)
+
+
+# ---------------------------------------------------------------------------
+# Lezen
+# ---------------------------------------------------------------------------
+
+def _in_range(ts: Optional[int], t0: Optional[int], t1: Optional[int]) -> bool:
+    if t0 is None and t1 is None:
+        return True
+    if ts is None:
+        return False
+    return (t0 is None or ts >= t0) and (t1 is None or ts <= t1)
+
+
+def _select(entries: List[dict], signals: Optional[Set[str]], t0: Optional[int], t1: Optional[int]) -> List[dict]:
+    out = []
+    for e in entries:
+        if signals is not None and not signals.intersection(e["signals"]):
+            continue
+        if t0 is not None or t1 is not None:
+            if e["ts0"] is None:
+                continue
+            if (t0 is not None and e["ts1"] < t0) or (t1 is not None and e["ts0"] > t1):
+                continue
+        out.append(e)
+    return out
+
+
+def _frame_lines(f, e: dict, dctx) -> List[bytes]:
+    f.seek(e["off"])
+    raw = dctx.decompress(f.read(e["len"]), max_output_size=1 << 30)
+    return [ln for ln in raw.splitlines(True) if ln.strip()]
+
+
+def _frame_seqs(e: dict) -> Optional[List[int]]:
+    """Schrijfvolgnummer per regel uit de index (None: onbekend)"""
+    if "seq0" not in e or len(e.get("dseq", ())) != e["n"] - 1:
+        return None
+    return list(itertools.accumulate(e["dseq"], initial=e["seq0"]))
+
+
+def _order_key(seq: Optional[int], line: bytes) -> Tuple[int, int]:
+    """Sorteersleutel: eerst alles met volgnummer, daarna (crash-staart/oud bestand) op ts"""
+    if seq is not None:
+        return 0, seq
+    ts = line_meta(line)[1]
+    return 1, (ts if ts is not None else -1)
+
+
+def _iter_keyed(path: str, want: Optional[Set[str]], t0: Optional[int], t1: Optional[int],
+                keyed: bool) -> Iterator[Tuple[Optional[tuple], bytes]]:
+    """(sorteersleutel of None, regel) uit een .jsonl.zst, via de index"""
+    _require_zstd()
+    dctx = zstandard.ZstdDecompressor()
+    with open(path, "rb") as f:
+        for e in _select(read_index(path), want, t0, t1):
+            whole = want is None or (len(e["signals"]) == 1 and e["signals"][0] in want)
+            inside = (t0 is None or (e["ts0"] is not None and e["ts0"] >= t0)) and \
+                     (t1 is None or (e["ts1"] is not None and e["ts1"] <= t1))
+            lines = _frame_lines(f, e, dctx)
+            seqs = _frame_seqs(e) if keyed else None
+            if seqs is None or len(seqs) != len(lines):
+                seqs = [None] * len(lines)
+            for seq, line in zip(seqs, lines):
+                if not (whole and inside):
+                    signal, ts = line_meta(line)
+                    if not ((want is None or signal in want) and _in_range(ts, t0, t1)):
+                        continue
+                yield (_order_key(seq, line) if keyed else None), line
+
+
+def iter_lines(path: str, signals: Optional[Iterable[str]] = None,
+               t0: Optional[int] = None, t1: Optional[int] = None,
+               ordered: bool = False) -> Iterator[bytes]:
+    """
+    Ruwe JSONL-regels (bytes), gefilterd op signaal en ts-bereik [t0, t1] (ms).
+    ordered=True geeft ze in schrijfvolgorde, zoals in de platte .jsonl (in .zst
+    wisselen signalen per frame; elk signaal is op zich al op volgorde en wordt
+    samengevoegd op het volgnummer uit de index).
+    """
+    want = set(signals) if signals is not None else None
+    if not _is_zst(path):
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                if want is None and t0 is None and t1 is None:
+                    yield line
+                    continue
+                signal, ts = line_meta(line)
+                if (want is None or signal in want) and _in_range(ts, t0, t1):
+                    yield line
+        return
+    if not ordered:
+        for _, line in _iter_keyed(path, want, t0, t1, keyed=False):
+            yield line
+        return
+    names = sorted(want if want is not None else {s for e in read_index(path) for s in e["signals"]})
+    streams = [_iter_keyed(path, {s}, t0, t1, keyed=True) for s in names]
+    for _, line in heapq.merge(*streams, key=lambda kl: kl[0]):
+        yield line
+
+
+def iter_records(path: str, signals: Optional[Iterable[str]] = None,
+                 t0: Optional[int] = None, t1: Optional[int] = None,
+                 ordered: bool = False) -> Iterator[Dict[str, Any]]:
+    """Records (dicts); ordered=True: in schrijfvolgorde (zie iter_lines)"""
+    for line in iter_lines(path, signals, t0, t1, ordered):
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue
+
+
+def first_ts(path: str, signal: Optional[str] = None) -> Optional[int]:
+    """Eerste ts in het bestand (optioneel van één signaal)"""
+    if _is_zst(path):
+        ts = [e["ts0"] for e in read_index(path)
+              if e["ts0"] is not None and (signal is None or signal in e["signals"])]
+        return min(ts) if ts else None
+    for line in iter_lines(path, [signal] if signal else None):
+        _, ts = line_meta(line)
+        if ts is not None:
+            return ts
+    return None
+
+
+def tail(path: str, signal: str, n: int) -> List[Dict[str, Any]]:
+    """Laatste n records van een signaal; in .zst alleen de laatste frames van dat signaal"""
+    if not _is_zst(path):
+        buf: List[bytes] = []
+        for line in iter_lines(path, [signal]):
+            buf.append(line)
+            if len(buf) > n:
+                buf.pop(0)
+        return [json.loads(ln) for ln in buf]
+
+    _require_zstd()
+    dctx = zstandard.ZstdDecompressor()
+    picked: List[bytes] = []
+    with open(path, "rb") as f:
+        for e in reversed(_select(read_index(path), {signal}, None, None)):
+            lines = [ln for ln in _frame_lines(f, e, dctx) if line_meta(ln)[0] == signal]
+            picked = lines + picked
+            if len(picked) >= n:
+                break
+    return [json.loads(ln) for ln in picked[-n:]] if n > 0 else []
+
+
+# ---------------------------------------------------------------------------
+# Omzetten
+# ---------------------------------------------------------------------------
+
+def compress_file(src: str, dst: Optional[str] = None, level: int = ZSTD_LEVEL) -> str:
+    """Bestaande .jsonl omzetten naar .jsonl.zst + .idx"""
+    _require_zstd()
+    dst = dst or src + ZST_SUFFIX
+    cctx = zstandard.ZstdCompressor(level=level)
+    frames = FrameBuffer()
+    off = 0
+    with open(src, "rb") as fin, open(dst, "wb") as fout, open(dst + INDEX_SUFFIX, "wb") as fidx:
+        def emit(closed):
+            nonlocal off
+            for fr in closed:
+                data, entry = encode_frame(cctx, fr, off)
+                fout.write(data)
+                fidx.write(index_line(entry))
+                off += len(data)
+
+        for line in fin:
+            if not line.strip():
+                continue
+            if not line.endswith(b"\n"):
+                line += b"\n"
+            signal, ts = line_meta(line)
+            emit(frames.add(signal, ts, line))
+        emit(frames.take_all())
+    return dst
+
+
+def _main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    import sys
+
+    p = argparse.ArgumentParser(description="Serena sessielogs (.jsonl / .jsonl.zst)")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("cat", help="Records als JSONL naar stdout")
+    c.add_argument("log")
+    c.add_argument("--signal", action="append", help="Alleen dit signaal (herhaalbaar)")
+    c.add_argument("--from-s", type=float, help="Vanaf N seconden na de eerste ts")
+    c.add_argument("--to-s", type=float, help="Tot N seconden na de eerste ts")
+    c.add_argument("--ordered", action="store_true", help="Signalen samenvoegen in schrijfvolgorde")
+    t = sub.add_parser("tail", help="Laatste N records van een signaal")
+    t.add_argument("log")
+    t.add_argument("--signal", required=True)
+    t.add_argument("-n", type=int, default=20)
+    i = sub.add_parser("index", help="Sidecar-index opnieuw opbouwen")
+    i.add_argument("log")
+    z = sub.add_parser("compress", help=".jsonl -> .jsonl.zst + .idx")
+    z.add_argument("logs", nargs="+")
+    args = p.parse_args(argv)
+
+    out = sys.stdout.buffer
+    if args.cmd == "cat":
+        t0 = t1 = None
+        if args.from_s is not None or args.to_s is not None:
+            start = first_ts(args.log)
+            if start is not None:
+                t0 = start + int(args.from_s * 1000) if args.from_s is not None else None
+                t1 = start + int(args.to_s * 1000) if args.to_s is not None else None
+        for line in iter_lines(args.log, args.signal, t0, t1, ordered=args.ordered):
+            out.write(line)
+    elif args.cmd == "tail":
+        for rec in tail(args.log, args.signal, args.n):
+            out.write((json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8"))
+    elif args.cmd == "index":
+        print(f"{write_index(args.log)} frames -> {args.log + INDEX_SUFFIX}")
+    elif args.cmd == "compress":
+        for src in args.logs:
+            t_start = time.perf_counter()
+            dst = compress_file(src)
+            a, b = os.path.getsize(src), os.path.getsize(dst)
+            print(f"{src} -> {dst}: {a} -> {b} bytes ({a / max(b, 1):.1f}x, {time.perf_counter() - t_start:.2f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_main())
@@ -0,0 +1,137 @@
+# server/config_cache.py
+# -*- coding: utf-8 -*-
+"""
+Gedeelde cache voor de JSON-configbestanden (techniques.json,
+feedback_rules.json, resp_rr_param_sets.json).
+
+Elk bestand wordt één keer geparsed. Bij `get()` wordt hooguit elke
+CONFIG_CHECK_MS een stat() gedaan; alleen als mtime of grootte veranderd is
+wordt opnieuw geladen en de geparste inhoud in één toewijzing vervangen.
+Lezers krijgen dus altijd een complete versie - de cache is gedeeld, dus
+nooit in-place wijzigen maar een kopie via `write()` opslaan.
+
+`write()` schrijft naar een tijdelijk bestand in dezelfde map en doet dan
+os.replace(): een lezer (of een crash) ziet nooit een half bestand.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import stat
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+log = logging.getLogger("sensor-ingest")
+
+CONFIG_CHECK_MS = int(os.getenv("CONFIG_CHECK_MS", "1000"))
+
+_UNKNOWN = (-1, -1)   # stempel vóór de eerste load / na reload()
+
+
+class JsonFile:
+    def __init__(
+        self,
+        path: Path,
+        default: Callable[[], Any] = dict,
+        build: Optional[Callable[[Any], Any]] = None,   # bv. lijst -> dict per versie
+        check_interval_s: float = CONFIG_CHECK_MS / 1000.0,
+    ):
+        self.path = Path(path)
+        self.default = default
+        self.build = build
+        self.check_interval_s = check_interval_s
+        self.version = 0          # +1 bij elke nieuwe inhoud (afgeleide state bijwerken)
+
+        self._value: Any = None
+        self._stamp: Optional[Tuple[int, int]] = _UNKNOWN   # (mtime_ns, size); None = bestand ontbreekt
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _set(self, raw: Any, stamp):
+        self._value = self.build(raw) if self.build else raw
+        self._stamp = stamp
+        self.version += 1
+
+    def get(self) -> Any:
+        """Geparste inhoud; herlaadt als het bestand gewijzigd is"""
+        now = time.monotonic()
+        if self._stamp is not _UNKNOWN and now - self._checked < self.check_interval_s:
+            return self._value
+        with self._lock:
+            self._checked = now
+            stamp = self._stat()
+            if stamp == self._stamp:
+                return self._value
+            if stamp is None:
+                self._set(self.default(), stamp)
+                return self._value
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    raw = json.load(f)
+            except (OSError, ValueError) as e:
+                # Half geschreven door een externe editor o.i.d.: vorige versie houden
+                log.error(f"Fout bij laden {self.path.name}: {e}")
+                if not self.version:
+                    self._set(self.default(), stamp)
+                else:
+                    self._stamp = stamp
+                return self._value
+            self._set(raw, stamp)
+            return self._value
+
+    def reload(self) -> Any:
+        """Direct opnieuw van schijf lezen (stat-interval overslaan)"""
+        with self._lock:
+            self._stamp = _UNKNOWN
+        return self.get()
+
+    def write(self, data: Any, indent: Optional[int] = 2):
+        """Atomisch opslaan (temp-bestand + rename); cache meteen bijgewerkt. Raises OSError."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            fd, tmp = tempfile.mkstemp(prefix=f".{self.path.name}.", suffix=".tmp", dir=self.path.parent)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=indent)
+                    f.flush()
+                    os.fsync(f.fileno())
+                # mkstemp maakt 0600; rechten van het bestaande bestand overnemen
+                try:
+                    mode = stat.S_IMODE(os.stat(self.path).st_mode)
+                except FileNotFoundError:
+                    mode = 0o644
+                os.chmod(tmp, mode)
+                os.replace(tmp, self.path)
+            except BaseException:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+                raise
+            self._set(data, self._stat())
+            self._checked = time.monotonic()
+
+
+_files: Dict[Path, JsonFile] = {}
+_files_lock = threading.Lock()
+
+
+def json_file(path: Path, **options: Any) -> JsonFile:
+    """Gedeelde JsonFile per pad (options gelden bij het eerste gebruik)"""
+    key = Path(path).resolve()
+    with _files_lock:
+        jf = _files.get(key)
+        if jf is None:
+            jf = _files[key] = JsonFile(key, **options)
+        return jf
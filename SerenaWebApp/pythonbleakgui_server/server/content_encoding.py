@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# server/content_encoding.py
+"""
+Request body decompression (Content-Encoding: gzip / zstd)
+
+Bodies are decoded incrementally, so chunked NDJSON uploads never need the
+whole compressed stream in memory. Concatenated gzip members / zstd frames
+are accepted (a client may compress every flushed batch separately).
+Output is produced in bounded steps and counted against a limit while it
+expands, so a small compressed chunk cannot blow up in memory first.
+"""
+from __future__ import annotations
+
+import zlib
+from typing import AsyncIterable, AsyncIterator, Optional
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+# Upper bound for bodies that are decoded as a whole (JSON array / binary ECG)
+MAX_DECODED_BODY = 64 * 1024 * 1024
+# Upper bound for one streamed (NDJSON) upload; a whole session stays far below this
+MAX_DECODED_STREAM = 1024 * 1024 * 1024
+
+# Decompression steps: gzip output per call (max_length), zstd input per call
+# (decompressobj has no output cap; a 128 KiB zstd block can be encoded in
+# ~4 bytes, so 128 input bytes expand to at most ~4 MiB per step)
+GZIP_STEP = 1024 * 1024
+ZSTD_STEP = 128
+
+
+class UnsupportedEncoding(ValueError):
+    """Content-Encoding we cannot decode (maps to 415)"""
+
+
+class BodyDecodeError(ValueError):
+    """Corrupt or oversized compressed body (maps to 400)"""
+
+
+def _new_gzip():
+    return zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+
+
+def _new_zstd():
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+class StreamDecoder:
+    """Incremental decoder for one Content-Encoding, across member/frame boundaries"""
+
+    def __init__(self, encoding: str, limit: Optional[int] = None):
+        self.encoding = encoding
+        self.limit = limit
+        self.total = 0
+        self._factory = _new_gzip if encoding == "gzip" else _new_zstd
+        self._obj = self._factory()
+        self._fresh = True
+
+    def decompress(self, data: bytes) -> bytes:
+        """Decode the next chunk; BodyDecodeError as soon as more than `limit` bytes come out."""
+        out = []
+        data = memoryview(data)
+        try:
+            while data:
+                if self.encoding == "gzip":
+                    piece = self._obj.decompress(data, GZIP_STEP)
+                    rest = self._obj.unconsumed_tail
+                    # Output cap reached: zlib may still hold output for the consumed input
+                    while not rest and len(piece) == GZIP_STEP and not self._obj.eof:
+                        self._count(out, piece)
+                        piece = self._obj.decompress(b"", GZIP_STEP)
+                else:
+                    piece = self._obj.decompress(data[:ZSTD_STEP])
+                    rest = data[ZSTD_STEP:]
+                self._fresh = False
+                self._count(out, piece)
+                if self._obj.eof:
+                    # Member/frame finished; the rest belongs to the next one
+                    # (zlib keeps the leftover in unused_data and unconsumed_tail)
+                    rest = self._obj.unused_data if self.encoding == "gzip" else self._obj.unused_data + rest
+                    self._obj = self._factory()
+                    self._fresh = True
+                data = memoryview(rest)
+        except (zlib.error, getattr(zstandard, "ZstdError", zlib.error)) as e:
+            raise BodyDecodeError(f"Invalid {self.encoding} body: {e}") from e
+        return b"".join(out)
+
+    def _count(self, out: list, piece: bytes):
+        self.total += len(piece)
+        if self.limit is not None and self.total > self.limit:
+            raise BodyDecodeError(f"Decoded body exceeds {self.limit} bytes")
+        out.append(piece)
+
+    def finish(self):
+        """Raise when the body ended in the middle of a member/frame."""
+        if not self._fresh and not self._obj.eof:
+            raise BodyDecodeError(f"Truncated {self.encoding} body")
+
+
+def get_decoder(content_encoding: Optional[str]) -> Optional[StreamDecoder]:
+    """Decoder for a Content-Encoding header value; None for identity."""
+    codings = [c.strip().lower() for c in (content_encoding or "").split(",")]
+    codings = [c for c in codings if c and c != "identity"]
+    if not codings:
+        return None
+    if len(codings) > 1:
+        raise UnsupportedEncoding(f"Stacked encodings not supported: {content_encoding}")
+    coding = "gzip" if codings[0] == "x-gzip" else codings[0]
+    if coding == "zstd" and not ZSTD_AVAILABLE:
+        raise UnsupportedEncoding("zstd not available on this server (pip install zstandard)")
+    if coding not in ("gzip", "zstd"):
+        raise UnsupportedEncoding(f"Unsupported Content-Encoding: {content_encoding}")
+    return StreamDecoder(coding)
+
+
+async def iter_decoded(chunks: AsyncIterable[bytes], decoder: Optional[StreamDecoder],
+                       limit: int = MAX_DECODED_STREAM) -> AsyncIterator[bytes]:
+    """Decode a chunked body as it arrives (passthrough without decoder), at most `limit` bytes."""
+    if decoder:
+        decoder.limit = limit
+    size = 0
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        data = decoder.decompress(chunk) if decoder else chunk
+        size += len(data)
+        if size > limit:
+            raise BodyDecodeError(f"Decoded body exceeds {limit} bytes")
+        if data:
+            yield data
+    if decoder:
+        decoder.finish()
+
+
+async def read_decoded(chunks: AsyncIterable[bytes], decoder: Optional[StreamDecoder],
+                       limit: int = MAX_DECODED_BODY) -> bytes:
+    """Read and decode a whole body, refusing to expand beyond `limit` bytes."""
+    return b"".join([data async for data in iter_decoded(chunks, decoder, limit)])
@@ -14,26 +14,40 @@ from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
 from .session import manager
 
 from .models import IngestResponse, Record
+from .idempotency import idempotency
+from .content_encoding import (
+    BodyDecodeError, UnsupportedEncoding, get_decoder, iter_decoded, read_decoded,
+)
 from .utils import (
     _append_lines, _derive_resp_lines, _today_file, 
-    dumps, log, WEB_DIR, 
+    log, WEB_DIR, 
     reset_runtime_state, rotate_logfile, 
     BULK_MINIMAL_LOG, BULK_SIGNAL_WHITELIST,
     _to_epoch_ms,
-    enrich_with_dt # <--- NIEUWE IMPORT
+    enrich_with_dt, # <--- NIEUWE IMPORT
+    StreamRecord,
 )
 from pathlib import Path  
 
 async def healthz(): return {"status": "ok", "now": datetime.utcnow().isoformat() + "Z"}
 async def reset(request: Request): return {"status": "ok"}
-async def rotate(request: Request): return {"status": "ok"}
+async def rotate(request: Request):
+    # ?name=<bestand>: alle devices loggen naar LOG_DIR/<bestand> (replay); zonder naam: nieuwe bestanden per device
+    path = await rotate_logfile(request.query_params.get("name"))
+    return {"status": "ok", "file": path}
 async def rotate_get(request: Request): return await rotate(request)
 
 async def ingest(request: Request):
     ctype = request.headers.get("content-type", "").lower()
-    lines_to_write: List[str] = []
+    lines_to_write: List[StreamRecord] = []
     accepted = 0
 
+    # gzip/zstd body (Content-Encoding) wordt tijdens het lezen gedecomprimeerd
+    try:
+        decoder = get_decoder(request.headers.get("content-encoding"))
+    except UnsupportedEncoding as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
     # Helper: verwerk record
     async def handle_record(rec: Record, bulk_mode: bool, device_id: str = None):
         nonlocal accepted, lines_to_write
@@ -48,37 +62,26 @@ async def ingest(request: Request):
         session = manager.get_session(final_dev_id)
 
         # 3. GEEF SESSIE MEE AAN DE REKENFUNCTIE
-        # utils.py zorgt nu zelf voor de 'dt' tag in deze derived lines
-        derived_lines = _derive_resp_lines(rec_dict, session)
+        # utils.py zorgt nu zelf voor de 'dt' tag in deze derived records
+        derived = [StreamRecord(d, final_dev_id) for d in _derive_resp_lines(rec_dict, session)]
+        # RUWE data met datum (na _derive_resp_lines: BreathTarget krijgt daar active_param_version)
+        raw = StreamRecord(enrich_with_dt(rec_dict), final_dev_id)
 
         # Logging naar disk (Nu met BULK_MINIMAL_LOG=False schrijft hij ALLES)
+        # .line wordt één keer gecodeerd en hergebruikt door de SSE-sink
         if bulk_mode and BULK_MINIMAL_LOG:
-            for ln in derived_lines:
-                try:
-                    obj = json.loads(ln)
-                except Exception: continue
-                sig = obj.get("signal")
-                if (not BULK_SIGNAL_WHITELIST) or (sig in BULK_SIGNAL_WHITELIST):
-                    lines_to_write.append(ln)
+            for r in derived:
+                if (not BULK_SIGNAL_WHITELIST) or (r.signal in BULK_SIGNAL_WHITELIST):
+                    lines_to_write.append(r)
         else:
-            # We schrijven de RUWE data (rec_dict).
-            # HIER VOEGEN WE DE DATUM TOE AAN HET RUWE RECORD:
-            lines_to_write.append(dumps(enrich_with_dt(rec_dict)))
-            
-            # De derived lines hebben de dt al gekregen in _derive_resp_lines
-            lines_to_write.extend(derived_lines)
+            lines_to_write.append(raw)
+            lines_to_write.extend(derived)
 
         # Broadcast naar browsers (Live View)
-        # Eerst het originele ECG packet
-        await manager.distribute_data(rec_dict) 
-        
-        # Dan de afgeleide data (RR, BPM, Guidance, etc.)
-        for ln in derived_lines:
-            try:
-                d_obj = json.loads(ln)
-                if "device_id" not in d_obj: d_obj["device_id"] = final_dev_id
-                await manager.distribute_data(d_obj)
-            except Exception: pass
+        # Eerst het originele ECG packet, dan de afgeleide data (RR, BPM, Guidance, etc.)
+        await manager.distribute_data(raw)
+        for r in derived:
+            await manager.distribute_data(r)
         
         accepted += 1
         return final_dev_id # Geef ID terug voor map-bepaling
@@ -86,11 +89,18 @@ async def ingest(request: Request):
     # We houden het laatste device ID bij voor logging folder
     final_dev_id_for_log = "UNKNOWN"
 
+    # Herhaalde batch (spool van de desktop-client): opgeslagen antwoord teruggeven
+    idem_key = (request.headers.get("idempotency-key") or "").strip() or None
+    if idem_key:
+        stored = await idempotency.begin(idem_key)
+        if stored is not None:
+            return IngestResponse(**{**stored, "duplicate": True})
+    response = None
+
     try:
         if "application/x-ndjson" in ctype:
             buf = b""
-            async for chunk in request.stream():
-                if not chunk: continue
+            async for chunk in iter_decoded(request.stream(), decoder):
                 buf += chunk
                 while True:
                     nl = buf.find(b"\n")
@@ -104,7 +114,7 @@ async def ingest(request: Request):
                             rec = Record(**item)
                             final_dev_id_for_log = await handle_record(rec, True, item.get("device_id"))
         else:
-            payload = await request.json()
+            payload = json.loads(await read_decoded(request.stream(), decoder))
             if isinstance(payload, dict):
                 rec = Record(**payload)
                 final_dev_id_for_log = await handle_record(rec, False, payload.get("device_id"))
@@ -119,27 +129,31 @@ async def ingest(request: Request):
         else:
             file_path = str(_today_file(device_id=final_dev_id_for_log).resolve())
             
-        return IngestResponse(accepted=accepted, file=file_path)
+        response = IngestResponse(accepted=accepted, file=file_path)
+        return response
 
+    except BodyDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         log.exception("Fout in /ingest")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if idem_key:
+            idempotency.finish(idem_key, response.dict() if response is not None else None)
 
 async def recent(signal: str = "hr_est", limit: int = 300, device: str = Query(None)):
     target_device = device or "UNKNOWN"
     session = manager.get_session(target_device)
-    history_items = list(session.history)
     out: List[dict] = []
     
-    for obj in reversed(history_items):
-        if obj.get("signal") != signal: continue
+    # Ring per signaal, in aankomstvolgorde: geen filter/sort nodig
+    for item in session.recent(signal, limit):
+        obj = item.data
         ts = _to_epoch_ms(obj.get("ts")) or _to_epoch_ms(obj.get("ts_ms")) or int(datetime.now().timestamp() * 1000)
         
         if signal in ("hr_est", "hr_derived"): out.append({"ts": ts, "bpm": obj.get("bpm")})
-        else: c = obj.copy(); c["ts"] = ts; out.append(c)
-        if len(out) >= limit: break
+        else: c = dict(item.as_dict()); c["ts"] = ts; out.append(c)
             
-    out.sort(key=lambda x: x.get("ts", 0))
     return {"signal": signal, "count": len(out), "items": out}
 
 async def stream(signals: str = "hr_est", device: str = Query(None)):
@@ -147,14 +161,15 @@ async def stream(signals: str = "hr_est", device: str = Query(None)):
     target_device = device or "UNKNOWN"
 
     async def event_gen() -> AsyncIterator[bytes]:
-        async for data in manager.subscribe(target_device):
-            sig = data.get("signal")
+        async for rec in manager.subscribe(target_device):
+            sig = rec.signal
             
             # Filter logica
             if want and "all" not in want and sig not in want: 
                 continue
             
-            yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+            # Gedeelde bytes: gecodeerd bij de eerste sink die erom vroeg
+            yield rec.event
 
     return StreamingResponse(event_gen(), media_type="text/event-stream")
 
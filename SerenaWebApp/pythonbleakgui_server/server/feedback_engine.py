@@ -1,10 +1,12 @@
 # server/feedback_engine.py
-import json
 import random
 import time
 from pathlib import Path
 from typing import Dict, Any, Tuple
 
+try: from .config_cache import json_file
+except ImportError: from server.config_cache import json_file
+
 RULES_FILE = Path(__file__).parent / "feedback_rules.json"
 
 class FeedbackEngine:
@@ -18,7 +20,9 @@ class FeedbackEngine:
         self.REPEAT_INTERVAL = self.DEFAULT_REPEAT
         self.VISUAL_INTERVAL = self.DEFAULT_VISUAL
 
-        self.rules = {}
+        # Regels uit de gedeelde config-cache; settings opnieuw toepassen bij nieuwe versie
+        self._file = json_file(RULES_FILE)
+        self._applied_version = 0
         self.load_rules()
         
         # State tracking
@@ -53,28 +57,29 @@ class FeedbackEngine:
         # print(f"[FEEDBACK] Settings geladen: Stab={self.STABILITY_DURATION}s, "
         #       f"Rep={self.REPEAT_INTERVAL}s, Vis={self.VISUAL_INTERVAL}s")
 
+    @property
+    def rules(self) -> Dict[str, Any]:
+        """Huidige regels; een gewijzigd bestand wordt (hooguit elke CONFIG_CHECK_MS) opgepikt"""
+        rules = self._file.get()
+        if self._file.version != self._applied_version:
+            self._applied_version = self._file.version
+            # Pas de instellingen direct toe na het laden
+            self._apply_settings(rules)
+        return rules
+
     def load_rules(self):
-        if not RULES_FILE.exists():
-            self.rules = {} 
-        else:
-            try:
-                with open(RULES_FILE, "r", encoding="utf-8") as f:
-                    self.rules = json.load(f)
-                
-                # Pas de instellingen direct toe na het laden
-                self._apply_settings(self.rules)
-                    
-            except Exception as e:
-                print(f"[FEEDBACK] Fout bij laden regels: {e}")
+        """Forceer herladen van schijf"""
+        self._file.reload()
+        return self.rules
 
     def save_rules(self, new_rules: Dict[str, Any]):
         try:
-            with open(RULES_FILE, "w", encoding="utf-8") as f:
-                json.dump(new_rules, f, indent=2)
-            
-            self.rules = new_rules
+            # temp-bestand + rename: lezers zien nooit een half bestand
+            self._file.write(new_rules, indent=2)
+
             # Update de timers direct in het geheugen
             self._apply_settings(new_rules)
+            self._applied_version = self._file.version
             
             return True
         except Exception as e:
@@ -0,0 +1,52 @@
+# server/idempotency.py
+# -*- coding: utf-8 -*-
+"""
+Idempotency-Key voor /ingest: een batch die de desktop-client opnieuw stuurt
+(timeout, spool na herverbinden) wordt niet twee keer gelogd/gebroadcast.
+
+Alleen in het geheugen (laatste IDEMPOTENCY_KEYS sleutels): na een herstart
+van de server kan een al verwerkte batch dus nog één keer binnenkomen.
+Een duplicaat dat binnenkomt terwijl het origineel nog loopt wacht daarop;
+mislukte requests worden niet onthouden.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+IDEMPOTENCY_KEYS = int(os.getenv("IDEMPOTENCY_KEYS", "10000"))
+
+
+class IdempotencyRegistry:
+    def __init__(self, max_keys: int = IDEMPOTENCY_KEYS):
+        self.max_keys = max_keys
+        self._done: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Event] = {}
+        self.duplicates = 0
+
+    async def begin(self, key: str) -> Optional[Dict[str, Any]]:
+        """Opgeslagen antwoord bij een duplicaat, anders None (sleutel loopt nu)"""
+        while key in self._pending:
+            await self._pending[key].wait()
+        hit = self._done.get(key)
+        if hit is not None:
+            self.duplicates += 1
+            return hit
+        self._pending[key] = asyncio.Event()
+        return None
+
+    def finish(self, key: str, response: Optional[Dict[str, Any]]):
+        """response=None: mislukt, mag opnieuw"""
+        if response is not None:
+            self._done[key] = response
+            self._done.move_to_end(key)
+            while len(self._done) > self.max_keys:
+                self._done.popitem(last=False)
+        event = self._pending.pop(key, None)
+        if event is not None:
+            event.set()
+
+
+idempotency = IdempotencyRegistry()
@@ -0,0 +1,290 @@
+# server/log_writer.py
+# -*- coding: utf-8 -*-
+"""
+Gebufferde JSONL-logwriter, één open bestand per device.
+
+/ingest zet regels alleen in een geheugenbuffer; een achtergrondtaak schrijft
+ze elke `flush_interval_s` (of eerder bij `flush_bytes`) weg via één
+worker-thread. Bestanden blijven open tussen requests (geen open/stat/close
+per request) en roteren op grootte of leeftijd. Bij afsluiten: flush + fsync.
+
+Zonder draaiende achtergrondtaak (bv. TestClient zonder startup) wordt bij
+elke append direct geflusht, zoals voorheen.
+
+fmt="zstd": .jsonl.zst met per-signaal zstd-frames en een .idx-sidecar (zie
+serena_log.py). Een frame wordt geschreven als het vol is of `frame_age_s` open
+staat; zoveel seconden log staan dus in het geheugen (afsluiten/rotate schrijft
+alles weg).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+    import serena_log
+except ImportError:
+    zstandard = serena_log = None
+
+log = logging.getLogger("sensor-ingest")
+
+OVERRIDE_KEY = "\0override"
+
+
+def _run_ts() -> str:
+    return datetime.now().strftime('%Y%m%d_%H%M%S')
+
+
+# (regel, signaal, ts); signaal/ts alleen nodig voor zstd-frames
+Pending = Tuple[bytes, Optional[str], Optional[int]]
+
+
+def _pending(rec: Any) -> Pending:
+    """bytes/str-regel of record met .line/.signal/.ts (utils.StreamRecord)"""
+    if isinstance(rec, bytes):
+        return rec, None, None
+    if isinstance(rec, str):
+        return rec.encode("utf-8"), None, None
+    return rec.line, rec.signal, rec.ts
+
+
+class _DeviceLog:
+    __slots__ = ("path", "fh", "idx", "size", "opened", "pending", "pending_bytes", "frames")
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.fh: Optional[BinaryIO] = None
+        self.idx: Optional[BinaryIO] = None
+        self.size = 0
+        self.opened = 0.0
+        self.pending: List[Pending] = []
+        self.pending_bytes = 0
+        self.frames = serena_log.FrameBuffer() if serena_log is not None else None
+
+
+class LogWriter:
+    def __init__(
+        self,
+        log_dir: Path,
+        header: Callable[[], bytes],
+        run_ts: Optional[str] = None,
+        flush_interval_s: float = 1.0,
+        flush_bytes: int = 256 * 1024,
+        max_bytes: int = 0,          # 0 = niet roteren op grootte
+        max_age_s: float = 0.0,      # 0 = niet roteren op tijd
+        fmt: str = "jsonl",          # "jsonl" of "zstd"
+        frame_age_s: float = 30.0,
+    ):
+        if fmt not in ("jsonl", "zstd"):
+            raise ValueError(f"Onbekend logformaat: {fmt}")
+        if fmt == "zstd" and serena_log is None:
+            log.warning("LOG_FORMAT=zstd vereist 'zstandard' (en serena_log.py); terug naar jsonl")
+            fmt = "jsonl"
+        self.fmt = fmt
+        self.suffix = ".jsonl.zst" if fmt == "zstd" else ".jsonl"
+        self.frame_age_s = frame_age_s
+        self._cctx = zstandard.ZstdCompressor(level=serena_log.ZSTD_LEVEL) if fmt == "zstd" else None
+        self.log_dir = log_dir
+        self.header = header
+        self.run_ts = run_ts or _run_ts()
+        self.flush_interval_s = flush_interval_s
+        self.flush_bytes = flush_bytes
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.override: Optional[Path] = None  # /rotate?name=...: alle devices in één bestand
+
+        self._logs: Dict[str, _DeviceLog] = {}
+        self._lock = asyncio.Lock()   # serialiseert alle bestandsoperaties
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- paden ----------
+
+    def _key(self, device_id: Optional[str]) -> str:
+        if self.override is not None:
+            return OVERRIDE_KEY
+        return device_id if device_id and device_id != "UNKNOWN" else ""
+
+    def path_for(self, device_id: Optional[str] = None) -> Path:
+        """Huidig logbestand van een device (maakt niets aan)"""
+        entry = self._logs.get(self._key(device_id))
+        if entry is not None:
+            return entry.path
+        if self.override is not None:
+            return self.override
+        filename = f"ingest_{self.run_ts}{self.suffix}"
+        if device_id and device_id != "UNKNOWN":
+            return self.log_dir / device_id / filename
+        return self.log_dir / filename
+
+    # ---------- schrijven ----------
+
+    async def append(self, device_id: Optional[str], records: List[Any]) -> str:
+        key = self._key(device_id)
+        entry = self._logs.get(key)
+        if entry is None:
+            entry = self._logs[key] = _DeviceLog(self.path_for(device_id))
+        for rec in records:
+            p = _pending(rec)
+            entry.pending.append(p)
+            entry.pending_bytes += len(p[0])
+
+        if self._task is None:
+            await self.flush()
+        elif entry.pending_bytes >= self.flush_bytes:
+            self._wake.set()
+        return str(entry.path.resolve())
+
+    async def flush(self, fsync: bool = False):
+        """Buffers wegschrijven; fsync=True ook alle open zstd-frames sluiten"""
+        async with self._lock:
+            jobs: List[Tuple[_DeviceLog, list]] = []
+            now = time.monotonic()
+            for entry in self._logs.values():
+                if self.fmt == "zstd":
+                    chunks = self._close_frames(entry, now, force=fsync)
+                else:
+                    chunks = [b"".join(ln for ln, _, _ in entry.pending)] if entry.pending else []
+                entry.pending = []
+                entry.pending_bytes = 0
+                if chunks or (fsync and entry.fh is not None):
+                    jobs.append((entry, chunks))
+            if jobs:
+                await asyncio.to_thread(self._write_jobs, jobs, fsync)
+
+    def _close_frames(self, entry: _DeviceLog, now: float, force: bool) -> list:
+        closed = []
+        for line, signal, ts in entry.pending:
+            if signal is None:
+                signal, ts = serena_log.line_meta(line)
+            closed += entry.frames.add(signal, ts, line, now)
+        closed += entry.frames.take_all() if force else entry.frames.take_due(now, self.frame_age_s)
+        return closed
+
+    def _write_jobs(self, jobs: List[Tuple[_DeviceLog, list]], fsync: bool):
+        for entry, chunks in jobs:
+            try:
+                incoming = sum(len(c) if isinstance(c, bytes) else sum(map(len, c[1])) for c in chunks)
+                if entry.fh is not None and chunks and self._rotation_due(entry, incoming):
+                    self._close(entry)
+                    entry.path = self._next_path(entry.path.parent)
+                if entry.fh is None:
+                    if not chunks:
+                        continue
+                    self._open(entry)
+                for chunk in chunks:
+                    self._write_chunk(entry, chunk)
+                entry.fh.flush()
+                if entry.idx is not None:
+                    entry.idx.flush()
+                if fsync:
+                    os.fsync(entry.fh.fileno())
+                    if entry.idx is not None:
+                        os.fsync(entry.idx.fileno())
+            except OSError as e:
+                log.error(f"Schrijven naar {entry.path} mislukt ({len(chunks)} blokken verloren): {e}")
+
+    def _write_chunk(self, entry: _DeviceLog, chunk):
+        if isinstance(chunk, bytes):  # jsonl
+            entry.fh.write(chunk)
+            entry.size += len(chunk)
+            return
+        data, idx = serena_log.encode_frame(self._cctx, chunk, entry.size)
+        entry.fh.write(data)
+        entry.idx.write(serena_log.index_line(idx))
+        entry.size += len(data)
+
+    def _open(self, entry: _DeviceLog):
+        entry.path.parent.mkdir(parents=True, exist_ok=True)
+        entry.fh = open(entry.path, "ab")
+        entry.size = os.fstat(entry.fh.fileno()).st_size
+        entry.opened = time.monotonic()
+        if self.fmt == "zstd":
+            entry.idx = open(str(entry.path) + serena_log.INDEX_SUFFIX, "ab")
+        if entry.size == 0:
+            head = self.header()
+            self._write_chunk(entry, head if self.fmt == "jsonl" else (serena_log.HEADER_SIGNAL, [head], None, None, [serena_log.HEADER_SEQ]))
+
+    @staticmethod
+    def _close(entry: _DeviceLog, fsync: bool = False):
+        for fh in (entry.fh, entry.idx):
+            if fh is None:
+                continue
+            try:
+                fh.flush()
+                if fsync:
+                    os.fsync(fh.fileno())
+                fh.close()
+            except OSError as e:
+                log.error(f"Sluiten van {entry.path} mislukt: {e}")
+        entry.fh = entry.idx = None
+
+    def _rotation_due(self, entry: _DeviceLog, incoming: int) -> bool:
+        if self.override is not None:
+            return False
+        if self.max_bytes and entry.size + incoming > self.max_bytes:
+            return True
+        return bool(self.max_age_s) and time.monotonic() - entry.opened >= self.max_age_s
+
+    def _next_path(self, directory: Path) -> Path:
+        ts = _run_ts()
+        path = directory / f"ingest_{ts}{self.suffix}"
+        n = 1
+        while path.exists():
+            path = directory / f"ingest_{ts}_{n}{self.suffix}"
+            n += 1
+        return path
+
+    # ---------- rotatie / levenscyclus ----------
+
+    async def rotate(self, new_name: Optional[str] = None) -> str:
+        """
+        Alles flushen en sluiten. Met naam: alle devices schrijven voortaan naar
+        LOG_DIR/<naam> (replay-tools); zonder naam: nieuwe bestanden per device.
+        """
+        await self.flush(fsync=True)
+        async with self._lock:
+            entries = list(self._logs.values())
+            self._logs.clear()
+            await asyncio.to_thread(lambda: [self._close(e, fsync=True) for e in entries])
+            if new_name:
+                if self.fmt == "zstd" and not new_name.endswith(serena_log.ZST_SUFFIX):
+                    new_name += serena_log.ZST_SUFFIX
+                self.override = self.log_dir / new_name
+            else:
+                self.override = None
+                self.run_ts = _run_ts()
+        return str(self.path_for(None).resolve())
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("Log flush mislukt")
+
+    async def close(self):
+        """Bij afsluiten: laatste regels wegschrijven, fsync, bestanden sluiten"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush(fsync=True)
+        async with self._lock:
+            entries = list(self._logs.values())
+            self._logs.clear()
+            await asyncio.to_thread(lambda: [self._close(e) for e in entries])
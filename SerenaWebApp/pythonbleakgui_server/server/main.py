@@ -3,9 +3,7 @@
 from __future__ import annotations
 
 import logging
-import json
 import os
-from pathlib import Path
 
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
@@ -14,11 +12,12 @@ from fastapi.staticfiles import StaticFiles
 from server.endpoints import healthz, ingest, recent, stream, ui, reset, rotate, rotate_get
 from server.models import IngestResponse
 from server import edr_extractor
-from server.utils import WEB_DIR, log
+from server.utils import WEB_DIR, log, log_writer
 
 # --- NIEUW: Feedback Engine Import ---
 from server.feedback_engine import engine as feedback_engine
 from server.techniques_engine import engine as tech_engine
+from server.session import PARAM_SETS
 
 
 # ------------ logging ------------
@@ -41,6 +40,15 @@ app.add_middleware(
 log.info("Loaded EDR module: %s", edr_extractor.__file__)
 log.info("Loaded Feedback Engine with rules.")
 
+# ------------ logwriter (gebufferd, achtergrond-flush) ------------
+@app.on_event("startup")
+async def _start_log_writer():
+    await log_writer.start()
+
+@app.on_event("shutdown")
+async def _close_log_writer():
+    await log_writer.close()
+
 # ------------ route registration ------------
 app.get("/healthz")(healthz)
 app.post("/ingest", response_model=IngestResponse)(ingest)
@@ -125,28 +133,8 @@ async def delete_technique(name: str):
 @app.get("/param_versions")
 async def get_param_versions():
     """Haalt alle beschikbare 'version' strings op uit resp_rr_param_sets.json."""
-    param_file = Path(__file__).resolve().parent.parent / "resp_rr_param_sets.json"
-    
-    if not param_file.exists():
-        param_file = Path(__file__).parent / "resp_rr_param_sets.json"
-    
-    if not param_file.exists():
-        return []
-
-    try:
-        with open(param_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            
-        if isinstance(data, list):
-            versions = [item.get("version") for item in data if "version" in item]
-            return versions
-        elif isinstance(data, dict):
-            return list(data.keys())
-            
-        return []
-    except Exception as e:
-        log.error(f"Fout bij lezen param sets: {e}")
-        return []
+    # Gedeelde config-cache (session.PARAM_SETS): geen bestandsleesactie per poll
+    return list(PARAM_SETS.get())
         
 # ------------ static files ------------
 app.mount("/", StaticFiles(directory=str(WEB_DIR), html=True), name="static")
\ No newline at end of file
@@ -17,3 +17,4 @@ class Record(BaseModel):
 class IngestResponse(BaseModel):
     accepted: int
     file: str
+    duplicate: bool = False   # Idempotency-Key al gezien: niets opnieuw verwerkt
@@ -3,21 +3,45 @@
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
+import os
 from collections import deque
+from itertools import islice
 from pathlib import Path
 from typing import Any, Dict, Optional, List
 
+try: from .config_cache import json_file
+except ImportError: from server.config_cache import json_file
+
 # --- Constanten & Paden ---
 DEFAULT_BUFFER_SIZE = 2000
 
+# /recent-geschiedenis: één ring per signaal, zodat ECG-pakketten de afgeleide
+# signalen niet verdringen. Grootte per signaaltype (aantal records).
+HISTORY_DEFAULT = 1000
+HISTORY_SIZES = {"ecg": 300}
+# UNKNOWN-sessie houdt (referenties naar) de records van alle devices bij voor
+# /recent zonder device; 0 = alleen records zonder device_id
+GLOBAL_HISTORY = os.getenv("GLOBAL_HISTORY", "1") != "0"
+
 BASE_DIR = Path(__file__).resolve().parent.parent 
 PARAM_FILE = BASE_DIR / "resp_rr_param_sets.json"
 TECH_FILE = BASE_DIR / "server/techniques.json"
 
 log = logging.getLogger("session")
 
+
+def _build_param_registry(raw: Any) -> Dict[str, Any]:
+    """resp_rr_param_sets.json (lijst met 'version'-velden, of dict) -> {versie: params}"""
+    if isinstance(raw, list):
+        return {p["version"]: p for p in raw if p.get("version")}
+    return raw if isinstance(raw, dict) else {}
+
+# Eén keer geparsed, gedeeld door alle sessies (en /param_versions, /techniques);
+# gewijzigde bestanden worden op mtime opgepikt
+PARAM_SETS = json_file(PARAM_FILE, build=_build_param_registry)
+TECHNIQUES = json_file(TECH_FILE)
+
 class DeviceSession:
     def __init__(self, device_id: str):
         self.device_id = device_id
@@ -26,8 +50,8 @@ class DeviceSession:
         self.buffer_size = DEFAULT_BUFFER_SIZE
         self.ecg_buffer: deque = deque(maxlen=self.buffer_size)
         
-        # Opslag voor recente geschiedenis
-        self.history: deque = deque(maxlen=1000)
+        # Opslag voor recente geschiedenis: signaal -> ring van StreamRecords
+        self.history: Dict[str, deque] = {}
         self.last_emitted_ts: Optional[int] = None
         
         # Adem status
@@ -38,16 +62,6 @@ class DeviceSession:
         self.current_technique: Optional[str] = None
         
         # --- Dynamisch Parameter Beheer ---
-        raw_params = self._load_json(PARAM_FILE)
-        self.param_registry = {}
-        
-        if isinstance(raw_params, list):
-            for p in raw_params:
-                v_key = p.get("version")
-                if v_key: self.param_registry[v_key] = p
-        elif isinstance(raw_params, dict):
-            self.param_registry = raw_params
-        
         self.default_version = "v1_default" 
         if self.default_version not in self.param_registry and self.param_registry:
             first_key = next(iter(self.param_registry))
@@ -59,16 +73,10 @@ class DeviceSession:
         self._apply_buffer_size_from_params()
         self.listeners: List[asyncio.Queue] = []
 
-    def _load_json(self, path: Path) -> Any:
-        try:
-            if path.exists():
-                with open(path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            else:
-                return {}
-        except Exception as e:
-            log.error(f"Fout bij laden {path.name}: {e}")
-            return {}
+    @property
+    def param_registry(self) -> Dict[str, Any]:
+        """Gedeelde, read-only registry via de config-cache (volgt wijzigingen van het bestand)"""
+        return PARAM_SETS.get()
 
     def _apply_buffer_size_from_params(self):
         new_size = self.active_params.get("BUFFER_SIZE", DEFAULT_BUFFER_SIZE)
@@ -84,7 +92,7 @@ class DeviceSession:
 
         self.current_technique = tech_name
 
-        tech_registry = self._load_json(TECH_FILE)
+        tech_registry = TECHNIQUES.get()
         tech_info = tech_registry.get(tech_name)
         if not tech_info:
             return
@@ -113,12 +121,31 @@ class DeviceSession:
             self.active_version_name = self.default_version
             self._apply_buffer_size_from_params()
 
-    async def broadcast(self, data: dict):
-        self.history.append(data)
+    def remember(self, rec: Any):
+        ring = self.history.get(rec.signal)
+        if ring is None:
+            ring = self.history[rec.signal] = deque(maxlen=HISTORY_SIZES.get(rec.signal, HISTORY_DEFAULT))
+        ring.append(rec)
+
+    def recent(self, signal: str, limit: int) -> List[Any]:
+        """Laatste `limit` records van één signaal, oudste eerst"""
+        ring = self.history.get(signal)
+        if not ring or limit <= 0:
+            return []
+        if limit >= len(ring):
+            return list(ring)
+        out = list(islice(reversed(ring), limit))
+        out.reverse()
+        return out
+
+    async def broadcast(self, rec: Any, remember: bool = True):
+        # rec: utils.StreamRecord (JSON wordt pas bij de SSE-sink gemaakt, één keer voor alle listeners)
+        if remember:
+            self.remember(rec)
         if not self.listeners: return
         to_remove = []
         for q in self.listeners:
-            try: q.put_nowait(data)
+            try: q.put_nowait(rec)
             except asyncio.QueueFull: to_remove.append(q)
             except Exception: to_remove.append(q)
         for q in to_remove:
@@ -134,13 +161,13 @@ class SessionManager:
             self.sessions[device_id] = DeviceSession(device_id)
         return self.sessions[device_id]
 
-    async def distribute_data(self, data: dict):
-        dev_id = data.get("device_id", "UNKNOWN")
+    async def distribute_data(self, rec: Any):
+        dev_id = rec.device_id or "UNKNOWN"
         if dev_id != "UNKNOWN":
             session = self.get_session(dev_id)
-            await session.broadcast(data)
+            await session.broadcast(rec)
         global_session = self.get_session("UNKNOWN")
-        await global_session.broadcast(data)
+        await global_session.broadcast(rec, remember=GLOBAL_HISTORY or dev_id == "UNKNOWN")
 
     async def subscribe(self, device_id: str):
         session = self.get_session(device_id)
@@ -148,8 +175,8 @@ class SessionManager:
         session.listeners.append(q)
         try:
             while True:
-                data = await q.get()
-                yield data
+                rec = await q.get()
+                yield rec
         except asyncio.CancelledError:
             if q in session.listeners:
                 session.listeners.remove(q)
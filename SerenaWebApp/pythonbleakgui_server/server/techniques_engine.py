@@ -1,62 +1,60 @@
 # server/techniques_engine.py
-import json
-import os
 from pathlib import Path
 from typing import Dict, Any
 
+try: from .config_cache import json_file
+except ImportError: from server.config_cache import json_file
+
 DATA_FILE = Path(__file__).parent / "techniques.json"
 
 class TechniquesEngine:
     def __init__(self):
-        self.techniques = {}
+        # Gedeeld met DeviceSession.activate_technique (zelfde bestand, één cache)
+        self._file = json_file(DATA_FILE)
         self._ensure_file_exists()
 
     def _ensure_file_exists(self):
         if not DATA_FILE.exists():
             try:
-                with open(DATA_FILE, "w", encoding="utf-8") as f:
-                    json.dump({}, f)
+                self._file.write({}, indent=None)
             except Exception as e:
                 print(f"[TECHNIQUES] Kon initieel bestand niet maken: {e}")
 
+    @property
+    def techniques(self) -> Dict[str, Any]:
+        # Gedeelde cache: niet in-place wijzigen
+        return self._file.get()
+
     def load(self):
-        if not DATA_FILE.exists():
-            self.techniques = {}
-            return
-        try:
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                self.techniques = json.load(f)
-        except Exception as e:
-            print(f"[TECHNIQUES] Fout bij laden: {e}")
-            self.techniques = {}
+        """Forceer herladen van schijf (normaal niet nodig: get_all() controleert mtime)"""
+        self._file.reload()
 
     def get_all(self):
-        self.load()
         return self.techniques
 
     # AANGEPAST: Extra argument show_in_app
     def save_technique(self, name: str, description: str, protocol_data: list, param_version: str = "Default", show_in_app: bool = False):
-        self.load()
+        techniques = dict(self.techniques)
         
-        self.techniques[name] = {
+        techniques[name] = {
             "description": description,
             "param_version": param_version,
             "show_in_app": show_in_app, # NIEUW: Opslaan
             "protocol": protocol_data
         }
-        return self._persist()
+        return self._persist(techniques)
 
     def delete_technique(self, name: str):
-        self.load()
         if name in self.techniques:
-            del self.techniques[name]
-            return self._persist()
+            techniques = dict(self.techniques)
+            del techniques[name]
+            return self._persist(techniques)
         return False
 
-    def _persist(self):
+    def _persist(self, techniques: Dict[str, Any]):
         try:
-            with open(DATA_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.techniques, f, indent=2)
+            # temp-bestand + rename: lezers zien nooit een half bestand
+            self._file.write(techniques, indent=2)
             return True
         except Exception as e:
             print(f"[TECHNIQUES] Fout bij schrijven: {e}")
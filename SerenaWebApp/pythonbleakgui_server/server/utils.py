@@ -12,7 +12,6 @@ from typing import Any, List, Optional, Union
 from collections import deque
 from dataclasses import asdict
 
-import aiofiles
 import numpy as np
 
 # --- CONFIGURATIE ---
@@ -30,6 +29,9 @@ except ImportError as e:
 try: import resp_rr_param_sets 
 except ImportError: resp_rr_param_sets = None
 
+try: from .log_writer import LogWriter
+except ImportError: from server.log_writer import LogWriter
+
 try: from .feedback_engine import engine as fb_engine
 except ImportError:
     try: from server.feedback_engine import engine as fb_engine
@@ -40,7 +42,6 @@ log = logging.getLogger("sensor-ingest")
 # ------------ directories ------------
 LOG_DIR = (ROOT_DIR / "logs").resolve()
 WEB_DIR = (ROOT_DIR / "server/web").resolve()
-LOG_FILE_OVERRIDE: Optional[Path] = None
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 WEB_DIR.mkdir(parents=True, exist_ok=True)
 SERVER_START_TS = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -49,14 +50,73 @@ SERVER_START_TS = datetime.now().strftime('%Y%m%d_%H%M%S')
 BULK_MINIMAL_LOG = False  
 BULK_SIGNAL_WHITELIST = {"resp_rr", "guidance", "hr_derived", "BreathTarget"} 
 
+# Logwriter: flush-interval/-grootte en rotatie (0 = uit)
+LOG_FLUSH_INTERVAL_S = float(os.getenv("LOG_FLUSH_INTERVAL_S", "1.0"))
+LOG_FLUSH_BYTES = int(os.getenv("LOG_FLUSH_BYTES", str(256 * 1024)))
+LOG_ROTATE_MB = float(os.getenv("LOG_ROTATE_MB", "0"))
+LOG_ROTATE_HOURS = float(os.getenv("LOG_ROTATE_HOURS", "0"))
+# "jsonl" of "zstd" (.jsonl.zst + .idx, zie serena_log.py); frames max zoveel s in geheugen
+LOG_FORMAT = os.getenv("LOG_FORMAT", "jsonl").lower()
+LOG_FRAME_SECONDS = float(os.getenv("LOG_FRAME_SECONDS", "30"))
+
 # ------------ EDR init ------------
 FS_ECG = float(os.getenv("ECG_FS", "130.0"))
 
 try:
     import orjson
-    def dumps(obj: Any) -> str: return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS).decode()
+    def dumpb(obj: Any) -> bytes: return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS)
 except Exception:
-    def dumps(obj: Any) -> str: return json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n"
+    def dumpb(obj: Any) -> bytes: return (json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+def dumps(obj: Any) -> str: return dumpb(obj).decode("utf-8")
+
+
+class StreamRecord:
+    """
+    Eén record voor alle sinks (logbestand, SSE, /recent).
+    De JSON wordt pas gemaakt als een sink erom vraagt, en maar één keer:
+    de logregel en het SSE-event delen dezelfde bytes.
+    """
+    __slots__ = ("data", "device_id", "_line", "_event")
+
+    def __init__(self, data: dict, device_id: str = "UNKNOWN"):
+        self.data = data            # zoals gelogd (afgeleide records zonder device_id)
+        self.device_id = device_id
+        self._line: Optional[bytes] = None
+        self._event: Optional[bytes] = None
+
+    @property
+    def signal(self) -> Optional[str]:
+        return self.data.get("signal")
+
+    @property
+    def ts(self) -> Optional[int]:
+        ts = self.data.get("ts")
+        return int(ts) if isinstance(ts, (int, float)) else None
+
+    @property
+    def line(self) -> bytes:
+        """Logregel (JSON + newline)"""
+        if self._line is None:
+            self._line = dumpb(self.data)
+        return self._line
+
+    @property
+    def event(self) -> bytes:
+        """SSE-event; device_id wordt voorin de gecodeerde logregel geplakt als die ontbreekt"""
+        if self._event is None:
+            body = self.line.rstrip(b"\n")
+            if "device_id" not in self.data:
+                dev = dumpb(self.device_id).rstrip(b"\n")
+                body = b'{"device_id":' + dev + (b"," + body[1:] if self.data else b"}")
+            self._event = b"data: " + body + b"\n\n"
+        return self._event
+
+    def as_dict(self) -> dict:
+        """Record zoals live verstuurd (met device_id)"""
+        if "device_id" in self.data:
+            return self.data
+        return {"device_id": self.device_id, **self.data}
 
 # --- HELPER FUNCTIES ---
 
@@ -73,14 +133,7 @@ def enrich_with_dt(obj: dict) -> dict:
     return {"dt": dt_str, **obj}
 
 def _today_file(device_id: str = None) -> Path:
-    global LOG_FILE_OVERRIDE
-    if LOG_FILE_OVERRIDE is not None: return LOG_FILE_OVERRIDE
-    filename = f"ingest_{SERVER_START_TS}.jsonl"
-    if device_id and device_id != "UNKNOWN":
-        target_dir = LOG_DIR / device_id
-        target_dir.mkdir(parents=True, exist_ok=True)
-        return target_dir / filename
-    return LOG_DIR / filename
+    return log_writer.path_for(device_id)
 
 def _get_param_header_line() -> str:
     version = "v1_default"
@@ -97,14 +150,22 @@ def _get_param_header_line() -> str:
     # Header krijgt ook een timestamp, waarom niet
     return dumps(enrich_with_dt({"parameters": final_dict}))
 
-async def _append_lines(lines: List[str], device_id: str = None) -> str:
-    path = _today_file(device_id)
-    write_header = False
-    if not path.exists() or path.stat().st_size == 0: write_header = True
-    async with aiofiles.open(path, "a", encoding="utf-8") as f:
-        if write_header: await f.write(_get_param_header_line())
-        await f.writelines(lines)
-    return str(path.resolve())
+# Eén open bestand per device; header bij elk nieuw bestand
+log_writer = LogWriter(
+    LOG_DIR,
+    header=lambda: _get_param_header_line().encode("utf-8"),
+    run_ts=SERVER_START_TS,
+    flush_interval_s=LOG_FLUSH_INTERVAL_S,
+    flush_bytes=LOG_FLUSH_BYTES,
+    max_bytes=int(LOG_ROTATE_MB * 1024 * 1024),
+    max_age_s=LOG_ROTATE_HOURS * 3600,
+    fmt=LOG_FORMAT,
+    frame_age_s=LOG_FRAME_SECONDS,
+)
+
+async def _append_lines(lines: List[Union[str, bytes, StreamRecord]], device_id: str = None) -> str:
+    # StreamRecords: signaal/ts voor de zstd-frames zonder de regel te parsen
+    return await log_writer.append(device_id, lines)
 
 def _to_epoch_ms(x: Union[int, float, None]) -> Optional[int]:
     if x is None: return None
@@ -129,8 +190,9 @@ def _build_breath_instruction(cycle: dict) -> str:
         return ", ".join(parts) + "."
     except Exception: return ""
 
-def _derive_resp_lines(obj: dict, session: Any) -> List[str]:
-    out: List[str] = []
+def _derive_resp_lines(obj: dict, session: Any) -> List[dict]:
+    """Afgeleide records (met 'dt') voor één binnenkomend record; serialiseren doen de sinks"""
+    out: List[dict] = []
     signal_type = obj.get("signal")
 
     if signal_type == "BreathTarget":
@@ -151,7 +213,7 @@ def _derive_resp_lines(obj: dict, session: Any) -> List[str]:
         obj["active_param_version"] = active_ver
         
         # Voeg DT toe
-        out.append(dumps(enrich_with_dt(obj))) 
+        out.append(enrich_with_dt(obj)) 
         return out
 
     if signal_type != "ecg": return []
@@ -188,7 +250,7 @@ def _derive_resp_lines(obj: dict, session: Any) -> List[str]:
                 "exhale": exhale[i] if exhale is not None and i < len(exhale) else "",
             }
             # Voeg DT toe
-            out.append(dumps(enrich_with_dt(line_data)))
+            out.append(enrich_with_dt(line_data))
             
             if fb_engine:
                 text, audio_text, color = fb_engine.get_feedback(session.current_target_rr, float(est_rr[i]))
@@ -217,7 +279,7 @@ def _derive_resp_lines(obj: dict, session: Any) -> List[str]:
                         "target": session.current_target_rr, "actual": float(est_rr[i])
                     }
                     # Voeg DT toe
-                    out.append(dumps(enrich_with_dt(guidance_rec)))
+                    out.append(enrich_with_dt(guidance_rec))
             last_ts = max(last_ts, ts_ms_int)
 
     if rr_ms is not None and ts_per_beat is not None and len(rr_ms) > 0:
@@ -229,7 +291,7 @@ def _derive_resp_lines(obj: dict, session: Any) -> List[str]:
             bpm = 60000.0 / float(rr)
             rec = {"signal": "hr_derived", "ts": int(ts_hr) if ts_hr is not None else int(datetime.now().timestamp()*1000), "bpm": float(bpm)}
             # Voeg DT toe
-            out.append(dumps(enrich_with_dt(rec)))
+            out.append(enrich_with_dt(rec))
             break
 
     if ts_per_beat is not None and est_rr is not None and len(est_rr) > 0:
@@ -241,19 +303,13 @@ def _derive_resp_lines(obj: dict, session: Any) -> List[str]:
             ts_ms = int(ts_per_beat[idx_last]); br = float(est_rr[idx_last])
             rec = {"signal": "resp", "ts": ts_ms, "fs": 0.0, "t": [], "v": [], "br_bpm": br, "br_bpm_psd": br, "br_bpm_td": br}
             # Voeg DT toe
-            out.append(dumps(enrich_with_dt(rec)))
+            out.append(enrich_with_dt(rec))
 
     session.last_emitted_ts = last_ts if last_ts >= 0 else session.last_emitted_ts
     return out
 
 def reset_runtime_state() -> None: pass
-def rotate_logfile(new_name: Optional[str] = None) -> str:
-    global LOG_FILE_OVERRIDE
-    if new_name: path = LOG_DIR / new_name
-    else: path = LOG_DIR / f"ingest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
-    LOG_FILE_OVERRIDE = path
-    LOG_DIR.mkdir(parents=True, exist_ok=True)
-    try:
-        with open(path, "a", encoding="utf-8") as _f: pass
-    except Exception: pass
-    return str(path.resolve())
\ No newline at end of file
+async def rotate_logfile(new_name: Optional[str] = None) -> str:
+    # Alleen een bestandsnaam (geen pad) toestaan
+    if new_name: new_name = Path(new_name).name or None
+    return await log_writer.rotate(new_name)
\ No newline at end of file